@@ -0,0 +1,138 @@
+"""
+Analiza trendów wagi i spożycia. Dane wczytywane są przez values_list do tablic NumPy, a każda miara liczona jest
+wektorowo na całym szeregu (dni reprezentowane są jako liczby porządkowe dat, więc przerwy w pomiarach są uwzględniane).
+"""
+import numpy as np
+
+from diettracker.models import DailySummary, WeightEntry
+
+# Współczynnik wygładzania wykładniczego na dzień (jak w "The Hacker's Diet") - trend "prawdziwej" wagi
+TREND_SMOOTHING = 0.1
+
+# Przybliżona energia zmagazynowana w kilogramie masy ciała (kcal)
+KCAL_PER_KG = 7700
+
+# Maksymalny wykładnik przy przeskalowaniu wag wygładzania - chroni przed przepełnieniem float64 w długich szeregach
+_MAX_EXPONENT = 500
+
+
+def weight_series(user, start=None, end=None):
+    """
+    Zwraca (dni jako liczby porządkowe, wagi) posortowane po dacie.
+    """
+    entries = WeightEntry.objects.filter(user=user)
+    if start:
+        entries = entries.filter(date__gte=start)
+    if end:
+        entries = entries.filter(date__lte=end)
+    rows = list(entries.order_by('date').values_list('date', 'weight'))
+    days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    weights = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return days, weights
+
+
+def intake_series(user, start=None, end=None):
+    """
+    Zwraca (dni jako liczby porządkowe, kalorie) dla dni, w których użytkownik zapisał spożycie (z DailySummary).
+    """
+    summaries = DailySummary.objects.filter(user=user, entries__gt=0)
+    if start:
+        summaries = summaries.filter(date__gte=start)
+    if end:
+        summaries = summaries.filter(date__lte=end)
+    rows = list(summaries.order_by('date').values_list('date', 'calories'))
+    days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    calories = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return days, calories
+
+
+def moving_average(days, values, window):
+    """
+    Średnia z pomiarów z ostatnich window dni kalendarzowych (włącznie z bieżącym) dla każdego punktu szeregu.
+    """
+    if not len(values):
+        return np.empty(0)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    first = np.searchsorted(days, days - window + 1, side='left')
+    last = np.arange(1, len(values) + 1)
+    return (sums[last] - sums[first]) / (last - first)
+
+
+def exponential_trend(days, values, smoothing=TREND_SMOOTHING):
+    """
+    Wygładzanie wykładnicze z uwzględnieniem przerw: po gap dniach poprzedni trend ma wagę (1 - smoothing) ** gap.
+
+    Rekurencja t[n] = d[n] * t[n-1] + (1 - d[n]) * y[n] jest rozwinięta do sumy skumulowanej ważonej potęgami
+    współczynnika zaniku; wagi są przeskalowywane co blok, aby nie przekroczyć zakresu float64.
+    """
+    count = len(values)
+    trend = np.empty(count)
+    if not count:
+        return trend
+    log_decay = np.log1p(-smoothing)
+    gaps = np.diff(days, prepend=days[0])
+    gains = -np.expm1(gaps * log_decay)
+    gains[0] = 1.0
+    weighted = gains * values
+
+    max_span = int(_MAX_EXPONENT / -log_decay)
+    previous_day, previous_trend = days[0], 0.0
+    start = 0
+    while start < count:
+        base = days[start]
+        end = int(np.searchsorted(days, base + max_span, side='right'))
+        offsets = (days[start:end] - base) * log_decay
+        carried = previous_trend * np.exp((base - previous_day) * log_decay)
+        trend[start:end] = np.exp(offsets) * (carried + np.cumsum(weighted[start:end] * np.exp(-offsets)))
+        previous_day, previous_trend = days[end - 1], trend[end - 1]
+        start = end
+    return trend
+
+
+def weekly_rate(days, values):
+    """
+    Nachylenie prostej regresji (zmiana na tydzień) albo None, gdy punktów jest za mało.
+    """
+    if len(values) < 2 or days[0] == days[-1]:
+        return None
+    slope, _ = np.polyfit(days - days[0], values, 1)
+    return float(slope * 7)
+
+
+def energy_balance(weight_days, trend, intake_days, calories):
+    """
+    Szacuje bilans energetyczny z okresu, w którym są zarówno pomiary wagi, jak i zapisane spożycie:
+    średnie dzienne spożycie, bilans wynikający ze zmiany trendu wagi i wynikający z nich wydatek energetyczny.
+    """
+    if len(trend) < 2 or not len(calories):
+        return None
+    overlap = (intake_days >= weight_days[0]) & (intake_days <= weight_days[-1])
+    if not overlap.any():
+        return None
+    rate = weekly_rate(weight_days, trend)
+    if rate is None:
+        return None
+    intake = float(calories[overlap].mean())
+    balance = rate / 7 * KCAL_PER_KG
+    return {'average_intake': round(intake), 'daily_balance': round(balance), 'estimated_expenditure': round(intake - balance),
+            'days_logged': int(overlap.sum())}
+
+
+def weight_trends(user, start=None, end=None, rate_window=28):
+    """
+    Zwraca słownik z tablicami dni, wag, średnich 7- i 30-dniowych oraz trendu, a także tempem zmiany wagi
+    z ostatnich rate_window dni i szacunkiem bilansu energetycznego z tego samego okresu.
+    """
+    days, weights = weight_series(user, start, end)
+    trend = exponential_trend(days, weights)
+    recent = days >= days[-1] - rate_window + 1 if len(days) else np.zeros(0, dtype=bool)
+    intake_days, calories = intake_series(user, start, end)
+    return {
+        'days': days,
+        'weights': weights,
+        'average_7': moving_average(days, weights, 7),
+        'average_30': moving_average(days, weights, 30),
+        'trend': trend,
+        'weekly_rate': weekly_rate(days[recent], trend[recent]),
+        'energy_balance': energy_balance(days[recent], trend[recent], intake_days, calories),
+    }
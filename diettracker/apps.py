@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DiettrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diettracker'
+
+    def ready(self):
+        # Rejestruje pomiar zapytań na każdym nowym połączeniu z bazą (sygnał connection_created)
+        from diettracker import instrumentation  # noqa: F401
@@ -0,0 +1,103 @@
+"""
+Asynchroniczne odpowiedniki najczęściej odczytywanych widoków, używane przy uruchomieniu przez ASGI
+(patrz projectdjango/urls_async.py i diettracker.middleware.async_urlconf_middleware).
+
+Odczyty korzystają z asynchronicznego ORM, więc żądanie nie zajmuje wątku z puli. Zapisy (metody post) oraz lista
+produktów, oparta na synchronicznych pamięciach podręcznych, wykonywane są przez sync_to_async w kodzie widoków
+synchronicznych.
+"""
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, HttpResponseBadRequest
+from django.shortcuts import render
+from django.utils import timezone
+
+from diettracker.forms import MealConsumptionForm
+from diettracker.meal_library import aget_meal_library
+from diettracker.models import Consumption, Diet
+from diettracker.summaries import adaily_totals
+from diettracker.views import AllMealsView, ConsumptionListView, ConsumptionView, FoodView, WeightDataView
+
+
+class AsyncUserMixin:
+    """
+    Wczytuje użytkownika asynchronicznie, zanim widok lub szablon sięgną po leniwe request.user.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class AsyncConsumptionView(AsyncLoginRequiredMixin, ConsumptionView):
+    async def get(self, request):
+        user = request.user
+        totals = await adaily_totals(user, date.today())
+        user_diet = await Diet.objects.filter(user=user).afirst()
+        meal_consumption_form = MealConsumptionForm(meals=await aget_meal_library(user))
+        return render(request, 'consumption.html', self.get_context_data(totals, user_diet, meal_consumption_form))
+
+    async def post(self, request):
+        return await sync_to_async(super().post)(request)
+
+
+class AsyncConsumptionListView(AsyncLoginRequiredMixin, ConsumptionListView):
+    async def get(self, request):
+        today_consumption = [
+            consumption async for consumption in Consumption.objects.filter(user_id=request.user.id, date=timezone.now().date())
+        ]
+        return render(request, 'consumption_list.html', {'today_consumption': today_consumption})
+
+    async def post(self, request):
+        return await sync_to_async(super().post)(request)
+
+
+class AsyncFoodView(AsyncUserMixin, FoodView):
+    async def get(self, request, *args, **kwargs):
+        # Strony katalogu pochodzą z synchronicznych pamięci podręcznych (get_page, food_cache, kostka faset), więc
+        # całe budowanie odpowiedzi pozostaje w FoodView.get - oba widoki nie mogą się rozjechać
+        return await sync_to_async(super().get)(request, *args, **kwargs)
+
+
+class AsyncAllMealsView(AsyncUserMixin, AllMealsView):
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        self.paginator = self.get_paginator(self.object_list, self.paginate_by)
+        await self.paginator.acount()
+
+        page = self.kwargs.get(self.page_kwarg) or request.GET.get(self.page_kwarg) or 1
+        try:
+            page_number = int(page)
+        except ValueError:
+            if page != 'last':
+                raise Http404("Page is not “last”, nor can it be converted to an int.")
+            page_number = self.paginator.num_pages
+        await self.paginator.aprefetch_page(page_number)
+        return self.render_to_response(self.get_context_data())
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        # Paginator z wczytaną asynchronicznie stroną jest używany ponownie przez get_context_data
+        if getattr(self, 'paginator', None) is not None:
+            return self.paginator
+        return super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class AsyncWeightDataView(AsyncLoginRequiredMixin, WeightDataView):
+    async def get(self, request):
+        try:
+            weight_entries, points = self.get_queryset()
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowe parametry zapytania")
+        return self.render_series([row async for row in weight_entries], points)
@@ -0,0 +1,204 @@
+"""
+Mikrobenchmarki najczęściej wykonywanych ścieżek diettracker.
+
+Każda ścieżka jest mierzona na osobnej, testowej bazie danych wypełnionej katalogiem Food o kilku rozmiarach oraz
+dla użytkowników z historią jednego dnia i pięciu lat. Poza czasem sprawdzana jest liczba zapytań SQL - przekroczenie
+limitu z QUERY_BUDGETS kończy program kodem 1. Wyniki zapisywane są jako JSON, aby można je było porównywać między wydaniami.
+
+Uruchomienie:
+    python -m diettracker.benchmarks --food-sizes 1000 100000 1000000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectdjango.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from diettracker.forms import MealConsumptionForm
+from diettracker.models import Consumption, Food, Meal, WeightEntry
+from diettracker.summaries import rebuild_summaries
+from diettracker.views import AllMealsView, ConsumptionView, WeightChartView
+
+# Maksymalna liczba zapytań SQL dla każdej ścieżki (liczone są także BEGIN i COMMIT bloków transaction.atomic)
+QUERY_BUDGETS = {
+    'consumption_post_food': 4,
+    'meal_form_cold': 1,
+    'meal_form_warm': 0,
+    'consumption_get': 2,
+    'weight_chart_cold': 2,
+    'weight_chart_cached': 1,
+    'weight_chart_not_modified': 1,
+    'all_meals_search_cold_count': 2,
+    'all_meals_search_warm_count': 1,
+}
+
+HISTORY_DAYS = {'1_day': 1, '5_years': 5 * 365}
+FOOD_WORDS = ['jogurt', 'ser', 'chleb', 'makaron', 'ryż', 'kurczak', 'łosoś', 'jabłko', 'sok', 'baton', 'płatki', 'mleko']
+MEAL_WORDS = ['sałatka', 'zupa', 'owsianka', 'kanapka', 'leczo', 'pierogi', 'gulasz', 'omlet']
+
+
+def seed_foods(target, rng, batch_size=5000):
+    existing = Food.objects.count()
+    for start in range(existing, target, batch_size):
+        Food.objects.bulk_create([
+            Food(code='bench-%d' % i, name='%s %d' % (rng.choice(FOOD_WORDS), i), calories=rng.uniform(0, 900),
+                 protein=rng.uniform(0, 30), carbohydrates=rng.uniform(0, 60), fat=rng.uniform(0, 10))
+            for i in range(start, min(start + batch_size, target))
+        ])
+
+
+def seed_meals(target, owner, rng, batch_size=5000):
+    existing = Meal.objects.count()
+    for start in range(existing, target, batch_size):
+        Meal.objects.bulk_create([
+            Meal(user=owner, name='%s %d' % (rng.choice(MEAL_WORDS), i), calories=rng.uniform(100, 900),
+                 protein=rng.uniform(0, 40), carbohydrates=rng.uniform(0, 90), fat=rng.uniform(0, 40),
+                 popularity=rng.randint(0, 50))
+            for i in range(start, min(start + batch_size, target))
+        ])
+
+
+def seed_user(username, days, rng):
+    user = User.objects.create_user(username=username, password='benchmark')
+    today = date.today()
+    with transaction.atomic():
+        WeightEntry.objects.bulk_create([
+            WeightEntry(user=user, weight=80 + rng.uniform(-2, 2), date=today - timedelta(days=offset))
+            for offset in reversed(range(days))
+        ])
+        Consumption.objects.bulk_create([
+            Consumption(user=user, name='wpis', date=today - timedelta(days=offset), calories=rng.randint(100, 900),
+                        fat=rng.randint(0, 40), carbohydrates=rng.randint(0, 100), protein=rng.randint(0, 50))
+            for offset in range(days) for meal in range(3)
+        ])
+    rebuild_summaries([user.id])
+    Meal.objects.bulk_create([Meal(user=user, name='%s własny %d' % (MEAL_WORDS[i % len(MEAL_WORDS)], i), calories=500)
+                              for i in range(20)])
+    return user
+
+
+def measure(name, func, repeat, before=None, **labels):
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(context))
+    budget = QUERY_BUDGETS[name]
+    return dict(labels, name=name, repeat=repeat, mean_ms=round(statistics.mean(timings), 3),
+                median_ms=round(statistics.median(timings), 3),
+                p95_ms=round(sorted(timings)[max(0, int(len(timings) * 0.95) - 1)], 3),
+                queries=max(queries), query_budget=budget, ok=max(queries) <= budget)
+
+
+def run_paths(user, food, repeat, labels):
+    factory = RequestFactory()
+
+    def request(method, path, data=None, **extra):
+        req = getattr(factory, method)(path, data or {}, **extra)
+        req.user = user
+        return req
+
+    results = []
+
+    post = lambda: ConsumptionView.as_view()(request('post', reverse('consumption'), {'food': food.id, 'amount': 150}))
+    post()
+    results.append(measure('consumption_post_food', post, repeat, **labels))
+
+    build_form = lambda: MealConsumptionForm(user=user)
+    results.append(measure('meal_form_cold', build_form, repeat, before=cache.clear, **labels))
+    results.append(measure('meal_form_warm', build_form, repeat, **labels))
+
+    results.append(measure('consumption_get', lambda: ConsumptionView.as_view()(request('get', reverse('consumption'))),
+                           repeat, **labels))
+
+    chart = lambda: WeightChartView.as_view()(request('get', reverse('weight_chart')))
+    results.append(measure('weight_chart_cold', chart, max(1, repeat // 5), before=cache.clear, **labels))
+    chart()
+    results.append(measure('weight_chart_cached', chart, repeat, **labels))
+    etag = chart().get('ETag', '')
+    results.append(measure('weight_chart_not_modified',
+                           lambda: WeightChartView.as_view()(request('get', reverse('weight_chart'), HTTP_IF_NONE_MATCH=etag)),
+                           repeat, **labels))
+
+    search = lambda: AllMealsView.as_view()(request('get', reverse('all_meals'), {'search': 'sala', 'page': 'last'})).render()
+    results.append(measure('all_meals_search_cold_count', search, repeat, before=cache.clear, **labels))
+    search()
+    results.append(measure('all_meals_search_warm_count', search, repeat, **labels))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--food-sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--history', choices=sorted(HISTORY_DAYS), nargs='+', default=sorted(HISTORY_DAYS))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1234)
+    setup_test_environment()
+    # Pomiary "cold" czyszczą cache - benchmark dostaje własny katalog, a nie współdzielony cache serwera (CACHE_DIR/Redis)
+    cache_dir = tempfile.TemporaryDirectory(prefix='diettracker-bench-cache-')
+    test_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                       'LOCATION': cache_dir.name}})
+    test_cache.enable()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        owner = User.objects.create_user(username='meal-owner', password='benchmark')
+        users = {profile: seed_user('bench-%s' % profile, HISTORY_DAYS[profile], rng) for profile in args.history}
+        results = []
+        for size in sorted(args.food_sizes):
+            seed_foods(size, rng)
+            seed_meals(max(1000, size // 10), owner, rng)
+            food = Food.objects.order_by('?').first()
+            for profile, user in users.items():
+                labels = {'food_rows': size, 'history': profile}
+                results.extend(run_paths(user, food, args.repeat, labels))
+                for result in results[-len(QUERY_BUDGETS):]:
+                    print('%(name)-30s food=%(food_rows)-8d %(history)-8s %(median_ms)9.3f ms  %(queries)d/%(query_budget)d queries' % result)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_cache.disable()
+        cache_dir.cleanup()
+        teardown_test_environment()
+
+    report = {
+        'environment': {'python': platform.python_version(), 'django': django.get_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform()},
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    over_budget = [result for result in results if not result['ok']]
+    for result in over_budget:
+        print('Przekroczony limit zapytań: %(name)s (%(queries)d > %(query_budget)d), food=%(food_rows)d, %(history)s' % result,
+              file=sys.stderr)
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
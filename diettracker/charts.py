@@ -0,0 +1,28 @@
+"""
+Renderowanie wykresów do PNG bez globalnego stanu matplotlib.pyplot - każdy wykres ma własny obiekt Figure,
+więc renderowanie jest bezpieczne w wielu wątkach i nie zostawia otwartych figur.
+"""
+import io
+
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+
+
+def render_weight_chart(dates, weights, trend=None):
+    """
+    Zwraca wykres wagi w czasie jako bajty PNG; trend (wygładzona waga dla tych samych dat) rysowany jest jako druga linia.
+    """
+    figure = Figure()
+    axes = figure.subplots()
+    axes.plot(dates, weights, label='Waga')
+    if trend is not None:
+        axes.plot(dates, trend, label='Trend')
+        axes.legend()
+    axes.set_xlabel('Data')
+    axes.set_ylabel('Waga')
+    axes.set_title('Waga w zależności od czasu')
+    axes.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
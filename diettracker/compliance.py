@@ -0,0 +1,108 @@
+"""
+Ocena zgodności dni użytkowników z ich dietą (model DailyCompliance).
+
+Przeliczane są tylko dni, których podsumowanie (DailySummary) zmieniło się od ostatniej oceny. Odczyt i obliczenia
+(score_users) mogą działać w osobnych procesach, a zapis (save_scores) wykonuje jeden proces w krótkich transakcjach.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from diettracker.models import DailyCompliance, DailySummary, Diet
+from diettracker.reports import DIET_LIMITS, MACROS
+
+
+def diet_bounds(diet):
+    """
+    Zwraca tablice (minima, maksima) limitów diety w kolejności MACROS; brak limitu to NaN.
+    """
+    limits = [DIET_LIMITS[macro] for macro in MACROS]
+    lows = [getattr(diet, low) if low else None for low, _ in limits]
+    highs = [getattr(diet, high) for _, high in limits]
+    return np.array(lows, dtype=np.float64), np.array(highs, dtype=np.float64)
+
+
+def score_days(totals, lows, highs):
+    """
+    Ocenia wiersze sum dziennych (tablica dni x MACROS). Każdy ustawiony limit daje ocenę 1 przy jego spełnieniu,
+    malejącą liniowo z względnym przekroczeniem (przy przekroczeniu o 100% - 0). Zwraca (oceny 0-100, spełnione limity,
+    sprawdzone limity); dzień bez żadnych limitów ma ocenę 100.
+    """
+    totals = np.asarray(totals, dtype=np.float64).reshape(-1, len(MACROS))
+    checked = ~np.isnan(lows) | ~np.isnan(highs)
+    limits_checked = int(checked.sum())
+    if not limits_checked:
+        return np.full(len(totals), 100.0), np.zeros(len(totals), dtype=np.int64), 0
+
+    # Brak limitu (NaN) oraz minimum równe 0 nie dają odchylenia; maksimum równe 0 przekroczone jest "nieskończenie"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        below = np.nan_to_num(np.fmax(lows - totals, 0) / lows, nan=0.0)
+        above = np.nan_to_num(np.fmax(totals - highs, 0) / highs, nan=0.0)
+    deviation = below + above
+    scores = (np.clip(1 - deviation, 0, 1) * checked).sum(axis=1) / limits_checked * 100
+    met = ((deviation == 0) & checked).sum(axis=1)
+    return scores, met, limits_checked
+
+
+def stale_summaries(user_ids, full=False):
+    """
+    Podsumowania dni użytkowników, które nie mają oceny albo zmieniły się po jej wyliczeniu (wszystkie przy full=True).
+    """
+    summaries = DailySummary.objects.filter(user_id__in=user_ids)
+    if not full:
+        computed_at = DailyCompliance.objects.filter(user_id=OuterRef('user_id'), date=OuterRef('date')).values('computed_at')
+        summaries = summaries.annotate(computed_at=Subquery(computed_at)).filter(
+            Q(computed_at__isnull=True) | Q(updated_at__gt=F('computed_at'))
+        )
+    return summaries.order_by('user_id', 'date').values_list('user_id', 'date', *MACROS)
+
+
+def score_users(user_ids, full=False):
+    """
+    Wylicza oceny zmienionych dni podanych użytkowników. Zwraca listę krotek (user_id, date, score, limits_met,
+    limits_checked, computed_at); nie zapisuje niczego w bazie.
+    """
+    computed_at = timezone.now()
+    # Jak w widokach obowiązuje pierwsza dieta użytkownika - przy sortowaniu malejącym nadpisuje ona późniejsze
+    diets = {diet.user_id: diet for diet in Diet.objects.filter(user_id__in=user_ids).order_by('-id')}
+
+    rows = list(stale_summaries(user_ids, full))
+    if not rows:
+        return []
+    users = np.array([row[0] for row in rows], dtype=np.int64)
+    totals = np.array([row[2:] for row in rows], dtype=np.float64)
+    # Wiersze są posortowane po użytkowniku - każdy użytkownik to jeden ciągły wycinek
+    boundaries = np.flatnonzero(np.diff(users)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(rows)]))
+
+    results = []
+    for start, end in zip(starts, ends):
+        diet = diets.get(int(users[start]))
+        if diet is None:
+            continue
+        scores, met, checked = score_days(totals[start:end], *diet_bounds(diet))
+        results.extend(
+            (row[0], row[1], round(float(score), 1), int(count), checked, computed_at)
+            for row, score, count in zip(rows[start:end], scores, met)
+        )
+    return results
+
+
+def save_scores(user_ids, results, batch_size=1000):
+    """
+    Zapisuje oceny jednej paczki użytkowników i usuwa oceny dni, których podsumowania już nie istnieją.
+    """
+    with transaction.atomic():
+        DailyCompliance.objects.bulk_create(
+            [DailyCompliance(user_id=user_id, date=day, score=score, limits_met=met, limits_checked=checked,
+                             computed_at=computed_at)
+             for user_id, day, score, met, checked, computed_at in results],
+            batch_size=batch_size, update_conflicts=True, unique_fields=['user', 'date'],
+            update_fields=['score', 'limits_met', 'limits_checked', 'computed_at'],
+        )
+        orphaned = DailyCompliance.objects.filter(user_id__in=user_ids).exclude(
+            Exists(DailySummary.objects.filter(user_id=OuterRef('user_id'), date=OuterRef('date')))
+        )
+        orphaned.delete()
@@ -0,0 +1,83 @@
+"""
+Strumieniowy eksport danych użytkownika (spożycie, waga, posiłki) do CSV lub NDJSON, opcjonalnie kompresowany gzipem w locie.
+
+Wiersze czytane są z bazy porcjami przez .iterator(chunk_size=...) i od razu zamieniane na tekst, więc zużycie pamięci
+nie zależy od długości historii, a pierwsze bajty odpowiedzi wysyłane są zaraz po pierwszej porcji.
+"""
+import csv
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from diettracker.models import Consumption, Meal, WeightEntry
+
+CHUNK_SIZE = 2000
+
+# Liczba wierszy łączonych w jeden fragment odpowiedzi
+ROWS_PER_BLOCK = 500
+
+EXPORTS = {
+    'consumption': (Consumption, ['date', 'name', 'calories', 'fat', 'carbohydrates', 'protein'], ['date', 'id']),
+    'weight': (WeightEntry, ['date', 'weight'], ['date']),
+    'meals': (Meal, ['name', 'calories', 'protein', 'carbohydrates', 'fat'], ['id']),
+}
+
+
+class Echo:
+    """
+    "Plik" dla csv.writer, który zamiast zapisywać zwraca sformatowany wiersz.
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(user, kind, chunk_size=CHUNK_SIZE):
+    model, fields, ordering = EXPORTS[kind]
+    return model.objects.filter(user=user).order_by(*ordering).values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(fields, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def blocks(lines, size=ROWS_PER_BLOCK):
+    """
+    Łączy linie w większe fragmenty, aby nie wysyłać każdego wiersza osobno.
+    """
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= size:
+            yield ''.join(block).encode()
+            block = []
+    if block:
+        yield ''.join(block).encode()
+
+
+def gzip_stream(chunks):
+    """
+    Kompresuje strumień bajtów do formatu gzip; każdy fragment jest opróżniany (Z_SYNC_FLUSH), aby klient dostawał dane na bieżąco.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_stream(user, kind, output_format, compress=False):
+    """
+    Zwraca iterator bajtów eksportu danych użytkownika (kind - klucz EXPORTS, output_format - 'csv' lub 'ndjson').
+    """
+    fields = EXPORTS[kind][1]
+    lines = (csv_lines if output_format == 'csv' else ndjson_lines)(fields, export_rows(user, kind))
+    stream = blocks(lines)
+    return gzip_stream(stream) if compress else stream
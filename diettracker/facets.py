@@ -0,0 +1,137 @@
+"""
+Fasety zakresów makroskładników dla listy produktów (FoodView) - liczby produktów w przedziałach FACET_EDGES.
+
+Liczby nie są liczone zapytaniem COUNT dla każdego przedziału. import_off zapisuje tabelę FoodFacetCell z liczbą produktów
+w każdej kombinacji przedziałów czterech makroskładników (komórki "kostki", liczone wektorowo z migawki
+diettracker.nutrient_store). Widok wczytuje tę kostkę raz na wersję katalogu (z cache) i sumuje ją w NumPy.
+Przy wyszukiwaniu po nazwie kostka powstaje z jednego zapytania GROUP BY po komórkach pasujących produktów.
+
+Faseta makroskładnika uwzględnia filtry pozostałych makroskładników, ale nie własny - pokazuje, ile produktów
+dałby każdy przedział. Filtry, których granice nie pokrywają się z granicami przedziałów, zaliczają przedział częściowo
+objęty filtrem w całości, więc liczby faset są wtedy górnym oszacowaniem (sama lista produktów jest zawsze dokładna).
+"""
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from diettracker.food_cache import bump_food_catalogue_version, food_catalogue_version
+from diettracker.models import FoodFacetCell
+from diettracker.nutrient_store import rebuild_nutrient_store
+
+MACROS = ('calories', 'protein', 'carbohydrates', 'fat')
+
+# Dolne granice przedziałów (na 100 g); ostatni przedział nie ma górnej granicy
+FACET_EDGES = {
+    'calories': (0, 50, 100, 150, 200, 300, 400, 500, 700, 900),
+    'protein': (0, 1, 2, 5, 10, 15, 20, 30, 50),
+    'carbohydrates': (0, 1, 5, 10, 20, 30, 50, 70, 90),
+    'fat': (0, 1, 3, 5, 10, 20, 30, 50, 80),
+}
+SHAPE = tuple(len(FACET_EDGES[macro]) for macro in MACROS)
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def bucket_index(macro, values):
+    edges = np.asarray(FACET_EDGES[macro], dtype=np.float64)
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 1)
+
+
+def cube_from_columns(columns):
+    """
+    Liczy produkty w komórkach kostki na podstawie kolumn wartości makroskładników (w kolejności MACROS).
+    """
+    if not len(columns[0]):
+        return np.zeros(SHAPE, dtype=np.int64)
+    cells = np.ravel_multi_index([bucket_index(macro, column) for macro, column in zip(MACROS, columns)], SHAPE)
+    return np.bincount(cells, minlength=int(np.prod(SHAPE))).reshape(SHAPE)
+
+
+def rebuild_food_facets(store=None):
+    """
+    Zapisuje tabelę komórek kostki od nowa na podstawie migawki katalogu (bez podanej migawki zapisuje też ją od nowa).
+    Zwraca liczbę policzonych produktów.
+    """
+    store = rebuild_nutrient_store() if store is None else store
+    cube = cube_from_columns([store.column(macro) for macro in MACROS])
+    cells = np.flatnonzero(cube)
+    buckets = np.unravel_index(cells, SHAPE)
+    with transaction.atomic():
+        FoodFacetCell.objects.all().delete()
+        FoodFacetCell.objects.bulk_create([
+            FoodFacetCell(count=int(cube.flat[cell]), **{'%s_bucket' % macro: int(buckets[axis][i]) for axis, macro in enumerate(MACROS)})
+            for i, cell in enumerate(cells)
+        ], batch_size=1000)
+        # Nowa wersja katalogu unieważnia kostki zapamiętane w cache
+        bump_food_catalogue_version()
+    return int(cube.sum())
+
+
+def _cube_from_rows(rows):
+    cube = np.zeros(SHAPE, dtype=np.int64)
+    for *buckets, count in rows:
+        cube[tuple(buckets)] += count
+    return cube
+
+
+def stored_cube():
+    """
+    Kostka z tabeli FoodFacetCell, zapamiętywana w cache dla bieżącej wersji katalogu. Wersję podbija
+    rebuild_food_facets we współdzielonym cache, więc procesy serwera wczytują nową kostkę zaraz po imporcie.
+    """
+    cache_key = 'food_facets:%s' % food_catalogue_version()
+    cube = cache.get(cache_key)
+    if cube is None:
+        cube = _cube_from_rows(FoodFacetCell.objects.values_list(*['%s_bucket' % macro for macro in MACROS], 'count'))
+        cache.set(cache_key, cube, CACHE_TIMEOUT)
+    return cube
+
+
+def bucket_case(macro):
+    edges = FACET_EDGES[macro]
+    return Case(*[When(**{'%s__lt' % macro: edges[i + 1]}, then=Value(i)) for i in range(len(edges) - 1)],
+                default=Value(len(edges) - 1), output_field=IntegerField())
+
+
+def queryset_cube(queryset):
+    """
+    Kostka produktów z querysetu (np. wyników wyszukiwania) - jedno zapytanie GROUP BY po komórkach.
+    """
+    aliases = {'%s_bucket' % macro: bucket_case(macro) for macro in MACROS}
+    rows = queryset.order_by().annotate(**aliases).values(*aliases).annotate(count=Count('id')).values_list(*aliases, 'count')
+    return _cube_from_rows(rows)
+
+
+def bucket_mask(macro, low=None, high=None):
+    """
+    Maska przedziałów makroskładnika, które mają część wspólną z zakresem [low, high].
+    """
+    edges = np.asarray(FACET_EDGES[macro], dtype=np.float64)
+    uppers = np.append(edges[1:], np.inf)
+    mask = np.ones(len(edges), dtype=bool)
+    if low is not None:
+        mask &= uppers > low
+    if high is not None:
+        mask &= edges <= high
+    return mask
+
+
+def facet_counts(cube, ranges):
+    """
+    Zwraca słownik {makroskładnik: [{'min', 'max', 'count'}, ...]} dla kostki i zakresów {makroskładnik: (low, high)}.
+    """
+    masks = [bucket_mask(macro, *ranges.get(macro, (None, None))) for macro in MACROS]
+    facets = {}
+    for axis, macro in enumerate(MACROS):
+        filtered = cube
+        for other, mask in enumerate(masks):
+            if other != axis:
+                filtered = np.compress(mask, filtered, axis=other)
+        counts = filtered.sum(axis=tuple(other for other in range(len(MACROS)) if other != axis))
+        edges = FACET_EDGES[macro]
+        facets[macro] = [
+            {'min': edges[i], 'max': edges[i + 1] if i + 1 < len(edges) else None, 'count': int(counts[i])}
+            for i in range(len(edges))
+        ]
+    return facets
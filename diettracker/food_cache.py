@@ -0,0 +1,144 @@
+"""
+Pamięć podręczna produktów (Food) w procesie serwera - ograniczona rozmiarem (LRU) i wersjonowana.
+
+Katalog produktów zmienia się praktycznie tylko przy imporcie, więc import_off podbija wersję katalogu
+w cache Django (bump_food_catalogue_version). Każdy proces sprawdza wersję co najwyżej raz na
+VERSION_CHECK_INTERVAL sekund i przy zmianie czyści swoją pamięć. Wersja dociera do wszystkich procesów, bo CACHES
+wskazuje współdzielony backend (katalog plików albo Redis). Gdy klucz wersji zniknie z cache (np. przy usuwaniu
+nadmiaru wpisów), wersja startuje od bieżącego czasu, a nie od 1 - nie wraca więc do wartości sprzed importu.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from diettracker.models import Food
+
+CATALOGUE_VERSION_KEY = 'food_catalogue_version'
+VERSION_CHECK_INTERVAL = 1.0
+DEFAULT_SIZE = 10000
+
+
+def initial_version():
+    return time.time_ns() // 1000
+
+
+def food_catalogue_version():
+    """
+    Wersja katalogu produktów - zmienia się po każdej paczce zapisanej przez import_off.
+    """
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, initial_version, None)
+
+
+def bump_food_catalogue_version():
+    def bump():
+        try:
+            cache.incr(CATALOGUE_VERSION_KEY)
+        except ValueError:
+            cache.set(CATALOGUE_VERSION_KEY, initial_version(), None)
+    transaction.on_commit(bump)
+
+
+class FoodCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def check_version(self):
+        now = time.monotonic()
+        if now - self.checked_at < VERSION_CHECK_INTERVAL:
+            return
+        version = food_catalogue_version()
+        with self.lock:
+            self.checked_at = now
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get_many(self, ids):
+        """
+        Zwraca słownik {id: Food} dla istniejących produktów; brakujące wczytuje jednym zapytaniem.
+        """
+        self.check_version()
+        found = {}
+        with self.lock:
+            for food_id in ids:
+                food = self.entries.get(food_id)
+                if food is not None:
+                    self.entries.move_to_end(food_id)
+                    found[food_id] = food
+            self.hits += len(found)
+            missing = [food_id for food_id in ids if food_id not in found]
+            self.misses += len(missing)
+        if missing:
+            loaded = Food.objects.in_bulk(missing)
+            self.put_many(loaded.values())
+            found.update(loaded)
+        return found
+
+    def get(self, food_id):
+        return self.get_many([food_id]).get(food_id)
+
+    def put_many(self, foods):
+        self.check_version()
+        with self.lock:
+            for food in foods:
+                self.entries[food.pk] = food
+                self.entries.move_to_end(food.pk)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+            self.checked_at = 0.0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries),
+                    'maxsize': self.maxsize, 'version': self.version}
+
+
+food_cache = FoodCache(getattr(settings, 'FOOD_CACHE_SIZE', DEFAULT_SIZE))
+
+
+def get_food(food_id):
+    """
+    Zwraca produkt o podanym id albo None. Obiekt jest współdzielony między żądaniami - nie wolno go modyfikować.
+    """
+    return food_cache.get(food_id)
+
+
+def get_foods(ids):
+    """
+    Zwraca listę produktów o podanych id w tej samej kolejności (pomija nieistniejące).
+    """
+    found = food_cache.get_many(ids)
+    return [found[food_id] for food_id in ids if food_id in found]
+
+
+def render_metrics():
+    """
+    Liczniki pamięci podręcznej produktów w formacie tekstowym Prometheusa (dołączane do /metrics).
+    """
+    stats = food_cache.stats()
+    lines = []
+    for name, kind, description in [('hits', 'counter', 'Odczyty produktów obsłużone z pamięci podręcznej.'),
+                                    ('misses', 'counter', 'Odczyty produktów wymagające zapytania do bazy.'),
+                                    ('evictions', 'counter', 'Produkty usunięte z pamięci podręcznej z braku miejsca.'),
+                                    ('size', 'gauge', 'Liczba produktów w pamięci podręcznej.'),
+                                    ('maxsize', 'gauge', 'Pojemność pamięci podręcznej produktów.')]:
+        metric = 'diettracker_food_cache_%s%s' % (name, '_total' if kind == 'counter' else '')
+        lines.extend(['# HELP %s %s' % (metric, description), '# TYPE %s %s' % (metric, kind), '%s %d' % (metric, stats[name])])
+    return '\n'.join(lines) + '\n'
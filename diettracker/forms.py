@@ -1,8 +1,10 @@
 from django import forms
-from django.db import models
 from django.core.exceptions import ValidationError
-from diettracker.models import Diet, WeightEntry, Food, Meal, UserMeal
+from diettracker.models import Diet, WeightEntry, Food, Meal
+from diettracker.meal_library import get_meal_library
+from diettracker.food_cache import get_food
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
 from datetime import date
 
 class LoginForm(forms.Form):
@@ -90,18 +92,11 @@ class WeightUpdateForm(forms.ModelForm):
         return cleaned_data
 
     def save(self, user, commit=True):
-        existing_entry = WeightEntry.objects.filter(user=user, date=date.today()).first()
-        if existing_entry:
-            existing_entry.weight = self.cleaned_data['weight']
-            existing_entry.save()
-            return existing_entry
-        else:
-            instance = super().save(commit=False)
-            instance.user = user
-            instance.date = date.today()
-            if commit:
-                instance.save()
-            return instance
+        instance = WeightEntry(user=user, date=date.today(), weight=self.cleaned_data['weight'])
+        if commit:
+            WeightEntry.objects.bulk_create([instance], update_conflicts=True, unique_fields=['user', 'date'],
+                                            update_fields=['weight', 'updated_at'])
+        return instance
 
 class BMICalculatorForm(forms.Form):
     weight = forms.DecimalField(label='Waga (kg)', min_value=0)
@@ -121,11 +116,96 @@ class BMICalculatorForm(forms.Form):
         return cleaned_data
 
 
+class FoodAutocompleteWidget(forms.Widget):
+    """
+    Pole wyboru produktu z podpowiedziami pobieranymi z /food/search/. W formularzu przesyłany jest tylko identyfikator produktu,
+    więc renderowanie nie wczytuje katalogu produktów.
+    """
+    template_name = 'widgets/food_autocomplete.html'
+    url = reverse_lazy('food_search')
+
+    class Media:
+        js = ['food_autocomplete.js']
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['url'] = self.url
+        return context
+
+
+class CachedFoodChoiceField(forms.ModelChoiceField):
+    """
+    Pole wyboru produktu, które odczytuje wybrany produkt z pamięci podręcznej katalogu zamiast z bazy.
+    """
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            food = get_food(int(value))
+        except (TypeError, ValueError):
+            food = None
+        if food is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return food
+
+
 class ConsumptionForm(forms.Form):
-    food = forms.ModelChoiceField(queryset=Food.objects.all(), empty_label="Wybierz produkt", label="Jedzenie")
+    food = CachedFoodChoiceField(queryset=Food.objects.all(), widget=FoodAutocompleteWidget, label="Jedzenie")
     amount = forms.FloatField(label="Ilość (w gramach)")
 
 
+class MealIngredientForm(forms.Form):
+    food = forms.ModelChoiceField(queryset=Food.objects.all(), widget=FoodAutocompleteWidget, label="Produkt")
+    amount = forms.FloatField(label="Ilość (w gramach)", min_value=1, max_value=5000)
+
+
+class BulkConsumptionEntryForm(forms.Form):
+    """
+    Walidacja pojedynczego wpisu w BulkConsumptionView: produkt z ilością, posiłek albo ręcznie podane makroskładniki.
+    Istnienie produktów i posiłków sprawdzane jest w widoku, jednym zapytaniem dla całej paczki.
+    """
+    food = forms.IntegerField(required=False)
+    amount = forms.FloatField(required=False, min_value=0)
+    meal = forms.IntegerField(required=False)
+    name = forms.CharField(max_length=100, required=False)
+    calories = forms.IntegerField(required=False, min_value=0)
+    fat = forms.IntegerField(required=False, min_value=0)
+    carbohydrates = forms.IntegerField(required=False, min_value=0)
+    protein = forms.IntegerField(required=False, min_value=0)
+    date = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        kinds = [kind for kind in ('food', 'meal', 'calories') if cleaned_data.get(kind) is not None]
+        if len(kinds) != 1:
+            raise forms.ValidationError("Wpis musi zawierać dokładnie jedno z pól: food, meal lub calories.")
+        if cleaned_data.get('food') is not None and cleaned_data.get('amount') is None:
+            self.add_error('amount', "Podaj ilość produktu (w gramach).")
+        if cleaned_data.get('calories') is not None and not cleaned_data.get('name'):
+            self.add_error('name', "Podaj nazwę wpisu.")
+        return cleaned_data
+
+
+class WeightImportRowForm(forms.Form):
+    """
+    Walidacja wiersza importowanej historii wagi (diettracker.history_import).
+    """
+    date = forms.DateField()
+    weight = forms.FloatField(min_value=1, max_value=499)
+
+
+class ConsumptionImportRowForm(forms.Form):
+    """
+    Walidacja wiersza importowanej historii spożycia (diettracker.history_import).
+    """
+    date = forms.DateField()
+    name = forms.CharField(max_length=100)
+    calories = forms.FloatField(min_value=0, max_value=20000)
+    fat = forms.FloatField(min_value=0, max_value=2000, required=False)
+    carbohydrates = forms.FloatField(min_value=0, max_value=2000, required=False)
+    protein = forms.FloatField(min_value=0, max_value=2000, required=False)
+
+
 class MealForm(forms.ModelForm):
     class Meta:
         model = Meal
@@ -183,18 +263,26 @@ class EditMealForm(forms.ModelForm):
                 self.fields['carbohydrates'].widget.attrs['placeholder'] = str(self.instance.carbohydrates)
             if self.instance.fat is not None:
                 self.fields['fat'].widget.attrs['placeholder'] = str(self.instance.fat)
+        if self.instance.pk and self.instance.ingredients.exists():
+            # Sumy posiłku-przepisu liczy diettracker.recipes ze składników - ręczna zmiana rozjechałaby je ze składnikami
+            for field_name in ('calories', 'protein', 'carbohydrates', 'fat'):
+                del self.fields[field_name]
     def clean(self):
         cleaned_data = super().clean()
         return cleaned_data
 
 class MealConsumptionForm(forms.Form):
-    def __init__(self, *args, user=None, **kwargs):
+    def __init__(self, *args, user=None, meals=None, **kwargs):
         super(MealConsumptionForm, self).__init__(*args, **kwargs)
-        if user:
-            user_meals = UserMeal.objects.filter(user=user).values_list('meal', flat=True)
-            self.fields['meal'].queryset = Meal.objects.filter(models.Q(user=user) | models.Q(pk__in=user_meals))
+        if meals is None:
+            meals = get_meal_library(user) if user else []
+        self.meals = {meal.id: meal for meal in meals}
+        self.fields['meal'].choices = [('', '---------')] + [(meal.id, meal.name) for meal in self.meals.values()]
+
+    meal = forms.TypedChoiceField(coerce=int, label="Posiłek")
 
-    meal = forms.ModelChoiceField(queryset=Meal.objects.none(), label="Posiłek")
+    def clean_meal(self):
+        return self.meals[self.cleaned_data['meal']]
 
 class AddMealForm(forms.Form):
     meal_id = forms.IntegerField(widget=forms.HiddenInput())
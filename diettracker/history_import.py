@@ -0,0 +1,167 @@
+"""
+Import historii wagi i spożycia z plików innych aplikacji (CSV z nagłówkiem lub NDJSON - jeden obiekt JSON w linii).
+
+Plik czytany jest strumieniowo, linia po linii, a poprawne wiersze zapisywane są paczkami po CHUNK_SIZE - jednym
+INSERT ... ON CONFLICT DO UPDATE na paczkę (bulk_create z update_conflicts), więc dni, które już mają wpis, są aktualizowane
+zamiast odrzucane. Każda paczka zapisywana jest w osobnej transakcji; błąd formatu pliku przerywa import, a podsumowanie
+obejmuje paczki zapisane przed nim.
+
+Wpisy spożycia nie mają naturalnego klucza, dlatego każdy importowany wiersz dostaje import_key wyliczony z daty, nazwy
+i numeru kolejnego wystąpienia tej pary w pliku - ponowny import tego samego pliku aktualizuje wcześniej zaimportowane wpisy.
+"""
+import codecs
+import collections
+import csv
+import hashlib
+import json
+
+from django.db import transaction
+
+from diettracker.forms import ConsumptionImportRowForm, WeightImportRowForm
+from diettracker.models import Consumption, WeightEntry
+from diettracker.summaries import rebuild_days
+
+CHUNK_SIZE = 1000
+
+# Liczba błędów wierszy zwracanych w podsumowaniu (odrzucone wiersze liczone są wszystkie)
+MAX_REPORTED_ERRORS = 100
+
+
+def decode_lines(stream):
+    """
+    Zamienia strumień bajtów (przesłany plik lub ciało żądania) na linie tekstu, pomijając ewentualny BOM.
+    """
+    return codecs.iterdecode(stream, 'utf-8-sig')
+
+
+def csv_rows(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def ndjson_rows(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row
+
+
+FORMATS = {'csv': csv_rows, 'ndjson': ndjson_rows}
+
+
+class HistoryImport:
+    form_class = None
+
+    def __init__(self, user, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+        self.error = None
+
+    def reject(self, line, errors):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def run(self, rows):
+        """
+        Waliduje i zapisuje wiersze (pary (numer linii, słownik) z csv_rows lub ndjson_rows). Zwraca podsumowanie.
+        """
+        batch = []
+        try:
+            for line, row in rows:
+                if not isinstance(row, dict):
+                    self.reject(line, {'__all__': [{'message': "Wiersz musi być obiektem JSON.", 'code': 'invalid'}]})
+                    continue
+                form = self.form_class(row)
+                if not form.is_valid():
+                    self.reject(line, form.errors.get_json_data())
+                    continue
+                batch.append(form.cleaned_data)
+                if len(batch) >= self.chunk_size:
+                    self.write(batch)
+                    batch = []
+        except (UnicodeDecodeError, csv.Error) as error:
+            self.error = "Nieprawidłowy format pliku: %s" % error
+        else:
+            if batch:
+                self.write(batch)
+        return self.summary()
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def summary(self):
+        summary = {'inserted': self.inserted, 'updated': self.updated, 'rejected': self.rejected, 'errors': self.errors}
+        if self.error:
+            summary['error'] = self.error
+        return summary
+
+
+class WeightImport(HistoryImport):
+    form_class = WeightImportRowForm
+
+    def write(self, rows):
+        # Dla powtórzonej daty obowiązuje ostatni wiersz pliku - wcześniejsze liczone są jako zaktualizowane
+        weights = {row['date']: row['weight'] for row in rows}
+        with transaction.atomic():
+            existing = WeightEntry.objects.filter(user=self.user, date__in=list(weights)).count()
+            WeightEntry.objects.bulk_create(
+                [WeightEntry(user=self.user, date=day, weight=weight) for day, weight in weights.items()],
+                update_conflicts=True, unique_fields=['user', 'date'], update_fields=['weight', 'updated_at'],
+            )
+        self.inserted += len(weights) - existing
+        self.updated += existing + len(rows) - len(weights)
+
+
+class ConsumptionImport(HistoryImport):
+    form_class = ConsumptionImportRowForm
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.occurrences = collections.Counter()
+
+    def import_key(self, row):
+        name = row['name'].strip().lower()
+        self.occurrences[(row['date'], name)] += 1
+        value = '%s|%s|%d' % (row['date'].isoformat(), name, self.occurrences[(row['date'], name)])
+        return hashlib.sha1(value.encode()).hexdigest()
+
+    def write(self, rows):
+        consumptions = [
+            Consumption(user=self.user, import_key=self.import_key(row), date=row['date'], name=row['name'],
+                        calories=round(row['calories']), fat=round(row['fat'] or 0),
+                        carbohydrates=round(row['carbohydrates'] or 0), protein=round(row['protein'] or 0))
+            for row in rows
+        ]
+        with transaction.atomic():
+            existing = Consumption.objects.filter(
+                user=self.user, import_key__in=[consumption.import_key for consumption in consumptions]
+            ).count()
+            Consumption.objects.bulk_create(
+                consumptions, update_conflicts=True, unique_fields=['user', 'import_key'],
+                update_fields=['calories', 'fat', 'carbohydrates', 'protein'],
+            )
+            rebuild_days({(self.user.id, consumption.date) for consumption in consumptions})
+        self.inserted += len(consumptions) - existing
+        self.updated += existing
+
+
+IMPORTS = {'weight': WeightImport, 'consumption': ConsumptionImport}
+
+
+def import_history(user, kind, stream, input_format, chunk_size=CHUNK_SIZE):
+    """
+    Importuje historię użytkownika (kind - klucz IMPORTS) ze strumienia bajtów w formacie input_format (klucz FORMATS).
+    Zwraca słownik z liczbą dodanych, zaktualizowanych i odrzuconych wierszy oraz błędami odrzuconych wierszy.
+    """
+    rows = FORMATS[input_format](decode_lines(stream))
+    return IMPORTS[kind](user, chunk_size).run(rows)
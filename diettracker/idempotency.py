@@ -0,0 +1,141 @@
+"""
+Klucze idempotencji dla widoków zapisujących dane.
+
+Klient (np. aplikacja mobilna ponawiająca żądanie po zerwaniu połączenia) wysyła nagłówek Idempotency-Key, a formularze HTML
+ukryte pole idempotency_key (wartość dostarcza procesor kontekstu new_idempotency_key). Widok z IdempotentMixin wykonuje
+zapis i zapamiętanie odpowiedzi w jednej transakcji, więc żądanie z tym samym kluczem zapisze dane co najwyżej raz.
+Powtórzenie zwraca zapamiętaną odpowiedź - z cache, a gdy jej tam nie ma, z tabeli IdempotencyKey - bez ponownego zapisu.
+Odpowiedzi przechowywane są przez settings.IDEMPOTENCY_KEY_TTL sekund; wygasłe wiersze usuwa komenda purge_idempotency_keys.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.template.response import SimpleTemplateResponse
+from django.utils import timezone
+
+from diettracker.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+DEFAULT_TTL = 60 * 60 * 24
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+
+
+def new_idempotency_key(request):
+    """
+    Procesor kontekstu - nowy klucz dla każdego wyrenderowanego formularza.
+    """
+    return {'idempotency_key': uuid.uuid4().hex}
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _cache_key(user_id, key):
+    return 'idempotency:%d:%s' % (user_id, hashlib.sha1(key.encode()).hexdigest())
+
+
+def _stored(record):
+    return {'fingerprint': record.fingerprint, 'status_code': record.status_code, 'content_type': record.content_type,
+            'location': record.location, 'body': bytes(record.body)}
+
+
+def lookup(user_id, key):
+    """
+    Zwraca zapamiętaną odpowiedź (słownik) dla klucza użytkownika albo None. Wygasły wiersz jest usuwany.
+    """
+    stored = cache.get(_cache_key(user_id, key))
+    if stored is not None:
+        return stored
+    record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.expires_at <= timezone.now():
+        record.delete()
+        return None
+    stored = _stored(record)
+    cache.set(_cache_key(user_id, key), stored, max(1, int((record.expires_at - timezone.now()).total_seconds())))
+    return stored
+
+
+def remember(user_id, key, fingerprint, response):
+    """
+    Zapisuje odpowiedź pod kluczem (w bieżącej transakcji); do cache trafia dopiero po zatwierdzeniu transakcji.
+    """
+    ttl = key_ttl()
+    record = IdempotencyKey.objects.create(
+        user_id=user_id, key=key, fingerprint=fingerprint, status_code=response.status_code,
+        content_type=response.get('Content-Type', ''), location=response.get('Location', ''), body=response.content,
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    )
+    stored = _stored(record)
+    transaction.on_commit(lambda: cache.set(_cache_key(user_id, key), stored, ttl))
+
+
+def replay(stored):
+    response = HttpResponse(stored['body'], status=stored['status_code'], content_type=stored['content_type'])
+    if stored['location']:
+        response['Location'] = stored['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired_keys():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+class IdempotentMixin:
+    """
+    Czyni żądania POST widoku idempotentnymi, jeśli klient podał klucz. Żądania bez klucza i od niezalogowanych
+    użytkowników obsługiwane są bez zmian. Zapamiętywane są tylko odpowiedzi 2xx i 3xx - przy 4xx i 5xx transakcja jest
+    wycofywana, a klucz pozostaje wolny, więc poprawione lub ponowione żądanie z tym samym kluczem zostanie wykonane.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'POST' or not request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        # Ciało odczytujemy przed request.POST - potrzebne jest do odcisku żądania
+        fingerprint = request_fingerprint(request)
+        key = request.headers.get(HEADER) or request.POST.get(FIELD)
+        if not key:
+            return super().dispatch(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': 'Klucz idempotencji może mieć najwyżej %d znaków.' % MAX_KEY_LENGTH}, status=400)
+
+        user_id = request.user.id
+        stored = lookup(user_id, key)
+        if stored is None:
+            try:
+                with transaction.atomic():
+                    response = super().dispatch(request, *args, **kwargs)
+                    if isinstance(response, SimpleTemplateResponse):
+                        response.render()
+                    if response.status_code >= 400:
+                        transaction.set_rollback(True)
+                        return response
+                    if response.streaming:
+                        return response
+                    remember(user_id, key, fingerprint, response)
+                return response
+            except IntegrityError:
+                # Równoległe żądanie z tym samym kluczem zdążyło zapisać swoją odpowiedź - nasz zapis został wycofany
+                stored = lookup(user_id, key)
+                if stored is None:
+                    raise
+        if stored['fingerprint'] != fingerprint:
+            return JsonResponse({'error': 'Klucz idempotencji został już użyty dla innego żądania.'}, status=422)
+        return replay(stored)
@@ -0,0 +1,263 @@
+"""
+Pomiary żądań: liczba i czas zapytań SQL, czas renderowania szablonów oraz histogramy czasów dla każdej nazwy URL.
+
+Dane bieżącego żądania trzymane są w zmiennej kontekstowej, dzięki czemu trafiają do nich także zapytania wykonywane
+przez asynchroniczny ORM w wątkach sync_to_async. Czas widoku mierzy view_timing_middleware wokół samego wywołania
+widoku, bez jego zapytań SQL i renderowania szablonów (te mają osobne pomiary). Histogramy są przechowywane w pamięci
+procesu - przy kilku procesach serwera każdy z nich wystawia własne wartości pod /metrics, dostępne tylko dla
+administratorów (is_staff) i z tokenem settings.METRICS_TOKEN (nagłówek Authorization: Bearer <token>).
+"""
+import contextlib
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Granice kubełków histogramów czasu (w sekundach) i liczby zapytań
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Próg wzorca N+1, gdy w ustawieniach nie ma REPEATED_QUERY_THRESHOLD
+DEFAULT_REPEATED_QUERY_THRESHOLD = 5
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def repeated_query_threshold():
+    return getattr(settings, 'REPEATED_QUERY_THRESHOLD', DEFAULT_REPEATED_QUERY_THRESHOLD)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.view_time = None
+        self.statements = Counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @contextlib.contextmanager
+    def measure_view(self):
+        """
+        Mierzy czas widoku bez zapytań SQL i renderowania szablonów wykonanych w trakcie bloku.
+        """
+        started, sql_time, template_time = time.perf_counter(), self.sql_time, self.template_time
+        try:
+            yield
+        finally:
+            spent = (self.sql_time - sql_time) + (self.template_time - template_time)
+            self.view_time = max(0.0, time.perf_counter() - started - spent)
+
+    def repeated_queries(self, threshold=None):
+        """
+        Zwraca listę par (sql, liczba wykonań) dla zapytań powtórzonych co najmniej threshold razy.
+        Zapytania porównywane są bez parametrów, więc ta sama instrukcja wykonana dla kolejnych id też się liczy.
+        """
+        if threshold is None:
+            threshold = repeated_query_threshold()
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements[sql] += 1
+
+
+def instrument_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_connections():
+    for connection in connections.all(initialized_only=True):
+        instrument_connection(connection)
+
+
+connection_created.connect(instrument_connection, dispatch_uid='diettracker.instrumentation')
+
+
+class InstrumentedTemplate:
+    """
+    Opakowanie szablonu mierzące czas render() na potrzeby bieżącego żądania.
+    """
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Backend szablonów Django, którego szablony wliczają czas renderowania do pomiarów żądania (settings.TEMPLATES).
+    """
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    Histogram w formacie Prometheusa z osobną serią dla każdej nazwy URL (etykieta view).
+    """
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self.lock:
+            series = self.series.setdefault(view, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            snapshot = sorted((view, list(series['buckets']), series['sum'], series['count'])
+                              for view, series in self.series.items())
+        for view, buckets, total, count in snapshot:
+            label = escape_label(view)
+            for bound, bucket in zip(self.buckets, buckets):
+                lines.append('%s_bucket{view="%s",le="%s"} %d' % (self.name, label, bound, bucket))
+            lines.append('%s_bucket{view="%s",le="+Inf"} %d' % (self.name, label, count))
+            lines.append('%s_sum{view="%s"} %r' % (self.name, label, round(total, 6)))
+            lines.append('%s_count{view="%s"} %d' % (self.name, label, count))
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, view, amount=1):
+        with self.lock:
+            self.values[view] += amount
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s counter' % self.name]
+        with self.lock:
+            snapshot = sorted(self.values.items())
+        lines.extend('%s{view="%s"} %d' % (self.name, escape_label(view), value) for view, value in snapshot)
+        return lines
+
+
+REQUEST_DURATION = Histogram('diettracker_request_duration_seconds', 'Czas obsługi żądania.', DURATION_BUCKETS)
+VIEW_DURATION = Histogram('diettracker_view_duration_seconds',
+                          'Czas widoku bez middleware, zapytań SQL i renderowania szablonów.', DURATION_BUCKETS)
+SQL_DURATION = Histogram('diettracker_sql_duration_seconds', 'Łączny czas zapytań SQL w żądaniu.', DURATION_BUCKETS)
+TEMPLATE_DURATION = Histogram('diettracker_template_duration_seconds', 'Łączny czas renderowania szablonów w żądaniu.',
+                              DURATION_BUCKETS)
+QUERY_COUNT = Histogram('diettracker_sql_queries', 'Liczba zapytań SQL w żądaniu.', QUERY_COUNT_BUCKETS)
+REPEATED_QUERIES = CounterMetric('diettracker_repeated_queries_total',
+                                 'Liczba żądań, w których to samo zapytanie wykonano wielokrotnie (wzorzec N+1).')
+
+METRICS = (REQUEST_DURATION, VIEW_DURATION, SQL_DURATION, TEMPLATE_DURATION, QUERY_COUNT, REPEATED_QUERIES)
+
+
+def observe_request(request, stats, total):
+    """
+    Zapisuje pomiary zakończonego żądania w histogramach i zgłasza powtarzające się zapytania.
+    """
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match and match.view_name else 'unresolved'
+    REQUEST_DURATION.observe(view, total)
+    if stats.view_time is not None:
+        VIEW_DURATION.observe(view, stats.view_time)
+    SQL_DURATION.observe(view, stats.sql_time)
+    TEMPLATE_DURATION.observe(view, stats.template_time)
+    QUERY_COUNT.observe(view, stats.queries)
+
+    repeated = stats.repeated_queries()
+    if repeated:
+        REPEATED_QUERIES.inc(view)
+        for sql, count in repeated:
+            logger.warning('Zapytanie wykonane %d razy w %s %s (%s): %s', count, request.method, request.path, view, sql)
+    return repeated
+
+
+def server_timing(stats, total):
+    """
+    Buduje wartość nagłówka Server-Timing (czasy w milisekundach).
+    """
+    timings = ['sql;dur=%.2f;desc="%d queries"' % (stats.sql_time * 1000, stats.queries)]
+    if stats.view_time is not None:
+        timings.append('view;dur=%.2f' % (stats.view_time * 1000))
+    timings.extend(['tpl;dur=%.2f' % (stats.template_time * 1000), 'total;dur=%.2f' % (total * 1000)])
+    return ', '.join(timings)
+
+
+def can_read_metrics(request):
+    """
+    /metrics widzą administratorzy oraz klienci (np. Prometheus) z tokenem settings.METRICS_TOKEN.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.clear()
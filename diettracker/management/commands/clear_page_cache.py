@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from diettracker.page_cache import bump_page_cache_version, page_cache_version
+
+
+class Command(BaseCommand):
+    help = 'Unieważnia zapamiętane strony i fragmenty szablonów (np. po wdrożeniu nowych szablonów).'
+
+    def handle(self, *args, **options):
+        bump_page_cache_version()
+        self.stdout.write(self.style.SUCCESS("Nowa wersja pamięci podręcznej stron: %s." % page_cache_version()))
@@ -0,0 +1,136 @@
+import collections
+import gzip
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from diettracker.food_cache import bump_food_catalogue_version
+from diettracker.models import Food, ImportCheckpoint
+from diettracker.openfoodfacts import iter_chunks, parse_chunk, resolve_columns
+from diettracker.recipes import recompute_meals_for_foods
+from diettracker.facets import rebuild_food_facets
+from diettracker.nutrient_store import rebuild_nutrient_store
+from diettracker.recommendations import rebuild_food_index
+
+FOOD_UPDATE_FIELDS = ['name', 'calories', 'protein', 'carbohydrates', 'fat']
+MACRO_FIELDS = ['calories', 'protein', 'carbohydrates', 'fat']
+
+
+class Command(BaseCommand):
+    help = 'Importuje katalog produktów z eksportu OpenFoodFacts (CSV rozdzielany tabulatorami, również .gz) do modelu Food.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Ścieżka do pliku eksportu OpenFoodFacts')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Liczba procesów parsujących wiersze (0 lub 1 - parsowanie w bieżącym procesie)')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Liczba linii w jednej paczce; każda paczka zapisywana jest w osobnej transakcji')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rozmiar partii bulk_create')
+        parser.add_argument('--restart', action='store_true', help='Ignoruje zapisany punkt kontrolny i importuje plik od początku')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError("Plik %s nie istnieje." % path)
+
+        checkpoint = self.get_checkpoint(path, options['restart'])
+        if checkpoint.completed:
+            self.stdout.write("Plik został już zaimportowany. Użyj --restart, aby zaimportować go ponownie.")
+            return
+
+        opener = gzip.open if path.endswith('.gz') else open
+        started = time.monotonic()
+        processed = 0
+
+        with opener(path, 'rb') as file:
+            try:
+                columns = resolve_columns(file.readline())
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+            if checkpoint.offset:
+                file.seek(checkpoint.offset)
+                self.stdout.write("Wznawianie importu od pozycji %d (zaimportowano %d wierszy)." % (checkpoint.offset, checkpoint.rows_imported))
+
+            chunks = iter_chunks(file, options['chunk_size'])
+            for rows, rejected, offset in self.parse(chunks, columns, options['workers']):
+                self.write_chunk(checkpoint, rows, rejected, offset, options['batch_size'])
+                processed += len(rows) + rejected
+                if options['verbosity'] >= 1:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write("%d wierszy, %.0f wierszy/s" % (processed, processed / elapsed if elapsed else 0))
+
+        checkpoint.completed = True
+        checkpoint.save(update_fields=['completed', 'updated_at'])
+        index = rebuild_food_index()
+        store = rebuild_nutrient_store()
+        rebuild_food_facets(store)
+        if options['verbosity'] >= 1:
+            self.stdout.write("Przebudowano indeks podpowiedzi (%d produktów)." % len(index))
+            self.stdout.write("Zapisano migawkę katalogu (%d produktów)." % len(store))
+        self.stdout.write(self.style.SUCCESS(
+            "Import zakończony: %d produktów zapisanych, %d wierszy odrzuconych." % (checkpoint.rows_imported, checkpoint.rows_rejected)
+        ))
+
+    def get_checkpoint(self, path, restart):
+        stat = os.stat(path)
+        fingerprint = '%d:%d' % (stat.st_size, stat.st_mtime_ns)
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(source=path, defaults={'fingerprint': fingerprint})
+        if restart or checkpoint.fingerprint != fingerprint:
+            checkpoint.fingerprint = fingerprint
+            checkpoint.offset = 0
+            checkpoint.rows_imported = 0
+            checkpoint.rows_rejected = 0
+            checkpoint.completed = False
+            checkpoint.save()
+        return checkpoint
+
+    def parse(self, chunks, columns, workers):
+        """
+        Parsuje paczki linii, w miarę możliwości w puli procesów. Kolejność paczek jest zachowana,
+        a liczba paczek oczekujących w pamięci jest ograniczona.
+        """
+        if workers <= 1:
+            for lines, offset in chunks:
+                rows, rejected = parse_chunk(lines, columns)
+                yield rows, rejected, offset
+            return
+
+        with multiprocessing.get_context().Pool(workers) as pool:
+            pending = collections.deque()
+            for lines, offset in chunks:
+                pending.append((pool.apply_async(parse_chunk, (lines, columns)), offset))
+                if len(pending) >= workers * 2:
+                    result, done_offset = pending.popleft()
+                    yield result.get() + (done_offset,)
+            while pending:
+                result, done_offset = pending.popleft()
+                yield result.get() + (done_offset,)
+
+    def write_chunk(self, checkpoint, rows, rejected, offset, batch_size):
+        # Powtórzony kod kreskowy w obrębie paczki - wygrywa ostatni wiersz
+        foods = {
+            code: Food(code=code, name=name, calories=calories, protein=protein, carbohydrates=carbohydrates, fat=fat)
+            for code, name, calories, protein, carbohydrates, fat in rows
+        }
+        with transaction.atomic():
+            # Produkty używane w przepisach, których wartości zmienia ta paczka - ich przepisy trzeba przeliczyć
+            used = Food.objects.filter(code__in=list(foods), mealingredient__isnull=False).distinct().values_list('id', 'code', *MACRO_FIELDS)
+            changed = [
+                food_id for food_id, code, *values in used
+                if values != [getattr(foods[code], field) for field in MACRO_FIELDS]
+            ]
+            Food.objects.bulk_create(
+                foods.values(), batch_size=batch_size,
+                update_conflicts=True, unique_fields=['code'], update_fields=FOOD_UPDATE_FIELDS,
+            )
+            if changed:
+                recompute_meals_for_foods(changed)
+            bump_food_catalogue_version()
+            checkpoint.offset = offset
+            checkpoint.rows_imported += len(foods)
+            checkpoint.rows_rejected += rejected
+            checkpoint.save()
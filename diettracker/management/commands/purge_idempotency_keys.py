@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from diettracker.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Usuwa wygasłe klucze idempotencji wraz z zapamiętanymi odpowiedziami.'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS("Usunięto %d wygasłych kluczy idempotencji." % deleted))
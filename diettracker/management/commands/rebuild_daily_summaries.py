@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from diettracker.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Odbudowuje tabelę DailySummary na podstawie wpisów Consumption.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Identyfikator użytkownika (można podać wielokrotnie); domyślnie wszyscy użytkownicy')
+
+    def handle(self, *args, **options):
+        created = rebuild_summaries(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS("Odbudowano %d dziennych podsumowań." % created))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from diettracker.facets import rebuild_food_facets
+from diettracker.nutrient_store import rebuild_nutrient_store
+
+
+class Command(BaseCommand):
+    help = 'Zapisuje od nowa migawkę katalogu produktów i tabelę faset zakresów makroskładników (FoodFacetCell).'
+
+    def handle(self, *args, **options):
+        counted = rebuild_food_facets(rebuild_nutrient_store())
+        self.stdout.write(self.style.SUCCESS("Przeliczono fasety dla %d produktów." % counted))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from diettracker.recommendations import rebuild_food_index
+
+
+class Command(BaseCommand):
+    help = 'Buduje od nowa indeks produktów używany przez podpowiedzi (settings.FOOD_INDEX_PATH).'
+
+    def handle(self, *args, **options):
+        index = rebuild_food_index()
+        self.stdout.write(self.style.SUCCESS("Przebudowano indeks podpowiedzi (%d produktów)." % len(index)))
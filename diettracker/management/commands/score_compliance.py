@@ -0,0 +1,71 @@
+import collections
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from diettracker.compliance import save_scores, score_users
+from diettracker.models import Diet
+
+
+def close_connections():
+    # Połączenia odziedziczone po procesie nadrzędnym nie mogą być używane w procesach potomnych
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Ocenia zgodność dni użytkowników z ich dietą i zapisuje wyniki w DailyCompliance. '
+            'Domyślnie przelicza tylko dni, których podsumowanie zmieniło się od ostatniej oceny.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Liczba procesów liczących oceny (0 lub 1 - obliczenia w bieżącym procesie)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Liczba użytkowników w jednej paczce; każda paczka zapisywana jest w osobnej transakcji')
+        parser.add_argument('--full', action='store_true', help='Przelicza wszystkie dni, a nie tylko zmienione')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Identyfikator użytkownika (można podać wielokrotnie); domyślnie wszyscy użytkownicy z dietą')
+
+    def handle(self, *args, **options):
+        users = Diet.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        if options['user_ids']:
+            users = users.filter(user_id__in=options['user_ids'])
+        users = list(users)
+        chunk_size = max(1, options['chunk_size'])
+        chunks = [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
+
+        started = time.monotonic()
+        scored = 0
+        for done, (user_ids, results) in enumerate(self.score(chunks, options['workers'], options['full']), 1):
+            save_scores(user_ids, results)
+            scored += len(results)
+            if options['verbosity'] >= 2:
+                elapsed = time.monotonic() - started
+                self.stdout.write("Paczka %d/%d, %d ocenionych dni, %.0f dni/s" % (done, len(chunks), scored,
+                                                                                 scored / elapsed if elapsed else 0))
+
+        self.stdout.write(self.style.SUCCESS("Oceniono %d dni %d użytkowników." % (scored, len(users))))
+
+    def score(self, chunks, workers, full):
+        """
+        Liczy oceny paczek użytkowników, w miarę możliwości w puli procesów. Procesy potomne tylko czytają z bazy -
+        zapis wykonuje proces główny, więc blokada zapisu SQLite trzymana jest tylko na czas jednej paczki.
+        """
+        if workers <= 1 or len(chunks) <= 1:
+            for user_ids in chunks:
+                yield user_ids, score_users(user_ids, full)
+            return
+
+        close_connections()
+        with multiprocessing.get_context().Pool(workers, initializer=close_connections) as pool:
+            pending = collections.deque()
+            for user_ids in chunks:
+                pending.append((pool.apply_async(score_users, (user_ids, full)), user_ids))
+                if len(pending) >= workers * 2:
+                    result, done_user_ids = pending.popleft()
+                    yield done_user_ids, result.get()
+            while pending:
+                result, done_user_ids = pending.popleft()
+                yield done_user_ids, result.get()
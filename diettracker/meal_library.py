@@ -0,0 +1,76 @@
+"""
+Podręczna pamięć (cache) biblioteki posiłków użytkownika - jego własnych posiłków oraz posiłków dodanych przez UserMeal.
+
+Każda zmiana tego zbioru musi po zapisie wywołać invalidate_meal_library (dla zmian jednego posiłku z meal_library_users).
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from diettracker.models import Meal, UserMeal
+
+MEAL_FIELDS = ('id', 'user_id', 'name', 'calories', 'protein', 'carbohydrates', 'fat')
+CACHE_TIMEOUT = 60 * 60
+CATALOGUE_VERSION_KEY = 'meal_catalogue_version'
+
+
+def cache_key(user_id):
+    return 'meal_library:%d' % user_id
+
+
+def _library_queryset(user):
+    linked = UserMeal.objects.filter(user=user).values('meal')
+    return Meal.objects.filter(Q(user=user) | Q(pk__in=linked)).order_by('name', 'id').values(*MEAL_FIELDS)
+
+
+def get_meal_library(user):
+    """
+    Zwraca listę posiłków użytkownika jako niezapisane instancje Meal (bez zapytań do bazy, jeśli lista jest w cache).
+    """
+    rows = cache.get(cache_key(user.id))
+    if rows is None:
+        rows = list(_library_queryset(user))
+        cache.set(cache_key(user.id), rows, CACHE_TIMEOUT)
+    return [Meal(**row) for row in rows]
+
+
+async def aget_meal_library(user):
+    rows = await cache.aget(cache_key(user.id))
+    if rows is None:
+        rows = [row async for row in _library_queryset(user)]
+        await cache.aset(cache_key(user.id), rows, CACHE_TIMEOUT)
+    return [Meal(**row) for row in rows]
+
+
+def invalidate_meal_library(*user_ids):
+    keys = [cache_key(user_id) for user_id in user_ids if user_id is not None]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def meal_library_users(meal):
+    """
+    Identyfikatory właściciela posiłku i wszystkich użytkowników, którzy dodali go do swojej listy. Przy usuwaniu posiłku
+    trzeba je pobrać przed delete(), dopóki istnieją wiersze UserMeal, a unieważnić biblioteki dopiero po zapisie
+    (invalidate_meal_library w tej samej transakcji) - inaczej równoległy odczyt zapamiętałby starą listę.
+    """
+    return [meal.user_id, *UserMeal.objects.filter(meal=meal).values_list('user_id', flat=True)]
+
+
+def meal_catalogue_version():
+    """
+    Wersja katalogu wszystkich posiłków - zmienia się przy każdym dodaniu, edycji i usunięciu posiłku.
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATALOGUE_VERSION_KEY, version, None)
+    return version
+
+
+def bump_meal_catalogue_version():
+    def bump():
+        try:
+            cache.incr(CATALOGUE_VERSION_KEY)
+        except ValueError:
+            cache.set(CATALOGUE_VERSION_KEY, 2, None)
+    transaction.on_commit(bump)
@@ -0,0 +1,108 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from diettracker.instrumentation import RequestStats, current_stats, instrument_connections, observe_request, server_timing
+from diettracker.routers import RoutingState, current_routing, pin_to_primary, reads_from_replica
+
+
+@sync_and_async_middleware
+def async_urlconf_middleware(get_response):
+    """
+    Przy obsłudze przez ASGI kieruje żądania do URLconfu z asynchronicznymi wersjami widoków (settings.ASYNC_ROOT_URLCONF).
+    Przy WSGI żądania obsługuje zwykły ROOT_URLCONF.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            request.urlconf = settings.ASYNC_ROOT_URLCONF
+            return await get_response(request)
+    else:
+        def middleware(request):
+            return get_response(request)
+    return middleware
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    """
+    Mierzy liczbę i czas zapytań SQL, czas widoku (z view_timing_middleware) i renderowania szablonów każdego żądania.
+    Wynik trafia do nagłówka Server-Timing oraz do histogramów wystawianych pod /metrics. Powinien być pierwszy na
+    liście MIDDLEWARE.
+    """
+    def finish(request, response, stats):
+        total = stats.elapsed
+        observe_request(request, stats, total)
+        response['Server-Timing'] = server_timing(stats, total)
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = current_stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                current_stats.reset(token)
+            return finish(request, response, stats)
+    else:
+        def middleware(request):
+            instrument_connections()
+            stats = RequestStats()
+            token = current_stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                current_stats.reset(token)
+            return finish(request, response, stats)
+    return middleware
+
+
+@sync_and_async_middleware
+def view_timing_middleware(get_response):
+    """
+    Mierzy czas samego widoku dla request_metrics_middleware - powinien być ostatni na liście MIDDLEWARE, żeby pomiar
+    nie obejmował pozostałych middleware (sesji, uwierzytelniania itp.).
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = current_stats.get()
+            if stats is None:
+                return await get_response(request)
+            with stats.measure_view():
+                return await get_response(request)
+    else:
+        def middleware(request):
+            stats = current_stats.get()
+            if stats is None:
+                return get_response(request)
+            with stats.measure_view():
+                return get_response(request)
+    return middleware
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Pozwala kierować odczyty żądań tylko do odczytu do replik bazy danych (diettracker.routers), a po żądaniu zapisującym
+    na chwilę przypina odczyty klienta do bazy głównej.
+    """
+    def start(request):
+        return current_routing.set(RoutingState() if reads_from_replica(request) else None)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = start(request)
+            try:
+                response = await get_response(request)
+            finally:
+                current_routing.reset(token)
+            return pin_to_primary(request, response)
+    else:
+        def middleware(request):
+            token = start(request)
+            try:
+                response = get_response(request)
+            finally:
+                current_routing.reset(token)
+            return pin_to_primary(request, response)
+    return middleware
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Indeks pełnotekstowy nazw produktów (SQLite FTS5). Tokenizer unicode61 usuwa znaki diakrytyczne,
+# poza literą "ł", którą zamieniamy ręcznie - tak samo jak diettracker.search.fold przy zapytaniach.
+FOLDED_NAME = "replace(replace(new.name, 'ł', 'l'), 'Ł', 'L')"
+
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS diettracker_food_fts USING fts5(name, tokenize="unicode61 remove_diacritics 2")""",
+    """CREATE TRIGGER IF NOT EXISTS diettracker_food_fts_insert AFTER INSERT ON diettracker_food BEGIN
+        INSERT INTO diettracker_food_fts(rowid, name) VALUES (new.id, %s);
+    END""" % FOLDED_NAME,
+    """CREATE TRIGGER IF NOT EXISTS diettracker_food_fts_delete AFTER DELETE ON diettracker_food BEGIN
+        DELETE FROM diettracker_food_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diettracker_food_fts_update AFTER UPDATE OF name ON diettracker_food BEGIN
+        DELETE FROM diettracker_food_fts WHERE rowid = old.id;
+        INSERT INTO diettracker_food_fts(rowid, name) VALUES (new.id, %s);
+    END""" % FOLDED_NAME,
+    """INSERT INTO diettracker_food_fts(rowid, name)
+        SELECT id, replace(replace(name, 'ł', 'l'), 'Ł', 'L') FROM diettracker_food""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS diettracker_food_fts_update",
+    "DROP TRIGGER IF EXISTS diettracker_food_fts_delete",
+    "DROP TRIGGER IF EXISTS diettracker_food_fts_insert",
+    "DROP TABLE IF EXISTS diettracker_food_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0008_food_code_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
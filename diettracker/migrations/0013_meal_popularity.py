@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+# Indeks pełnotekstowy nazw posiłków - analogicznie do 0009_food_fts
+FOLDED_NAME = "replace(replace(new.name, 'ł', 'l'), 'Ł', 'L')"
+
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS diettracker_meal_fts USING fts5(name, tokenize="unicode61 remove_diacritics 2")""",
+    """CREATE TRIGGER IF NOT EXISTS diettracker_meal_fts_insert AFTER INSERT ON diettracker_meal BEGIN
+        INSERT INTO diettracker_meal_fts(rowid, name) VALUES (new.id, %s);
+    END""" % FOLDED_NAME,
+    """CREATE TRIGGER IF NOT EXISTS diettracker_meal_fts_delete AFTER DELETE ON diettracker_meal BEGIN
+        DELETE FROM diettracker_meal_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diettracker_meal_fts_update AFTER UPDATE OF name ON diettracker_meal BEGIN
+        DELETE FROM diettracker_meal_fts WHERE rowid = old.id;
+        INSERT INTO diettracker_meal_fts(rowid, name) VALUES (new.id, %s);
+    END""" % FOLDED_NAME,
+    """INSERT INTO diettracker_meal_fts(rowid, name)
+        SELECT id, replace(replace(name, 'ł', 'l'), 'Ł', 'L') FROM diettracker_meal""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS diettracker_meal_fts_update",
+    "DROP TRIGGER IF EXISTS diettracker_meal_fts_delete",
+    "DROP TRIGGER IF EXISTS diettracker_meal_fts_insert",
+    "DROP TABLE IF EXISTS diettracker_meal_fts",
+]
+
+
+def count_popularity(apps, schema_editor):
+    Meal = apps.get_model('diettracker', 'Meal')
+    UserMeal = apps.get_model('diettracker', 'UserMeal')
+    links = UserMeal.objects.filter(meal=OuterRef('pk')).order_by().values('meal').annotate(total=Count('id')).values('total')
+    Meal.objects.filter(usermeal__isnull=False).update(popularity=Subquery(links))
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0012_weightentry_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['-popularity', 'id'], name='meal_popularity_id_idx'),
+        ),
+        migrations.RunPython(count_popularity, migrations.RunPython.noop),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0013_meal_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consumption',
+            index=models.Index(fields=['user', 'date'], name='consumption_user_date_idx'),
+        ),
+    ]
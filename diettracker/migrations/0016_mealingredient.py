@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0015_dailycompliance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField()),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='diettracker.food')),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='diettracker.meal')),
+            ],
+            options={
+                'unique_together': {('meal', 'food')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:15
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0016_mealingredient'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumption',
+            name='import_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True),
+        ),
+        migrations.AlterField(
+            model_name='weightentry',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AddConstraint(
+            model_name='consumption',
+            constraint=models.UniqueConstraint(fields=('user', 'import_key'), name='consumption_user_import_key'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0018_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodFacetCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calories_bucket', models.PositiveSmallIntegerField()),
+                ('protein_bucket', models.PositiveSmallIntegerField()),
+                ('carbohydrates_bucket', models.PositiveSmallIntegerField()),
+                ('fat_bucket', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField()),
+            ],
+            options={
+                'unique_together': {('calories_bucket', 'protein_bucket', 'carbohydrates_bucket', 'fat_bucket')},
+            },
+        ),
+    ]
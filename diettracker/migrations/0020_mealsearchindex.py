@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+import diettracker.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diettracker', '0019_foodfacetcell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealSearchIndex',
+            fields=[
+                ('meal', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='diettracker.meal')),
+                ('name', diettracker.models.FullTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'diettracker_meal_fts',
+                'managed': False,
+            },
+        ),
+    ]
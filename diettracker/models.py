@@ -28,6 +28,7 @@ class Food(models.Model):
     """
     Model reprezentujący produkt spożywczy.
     """
+    code = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name = models.CharField(max_length=100)
     calories = models.FloatField()
     protein = models.FloatField()
@@ -36,18 +37,60 @@ class Food(models.Model):
 
     class Meta:
         app_label = 'diettracker'
+        # Indeksy pod sortowanie i stronicowanie kluczem w FoodView
+        indexes = [
+            models.Index(fields=['name', 'id'], name='food_name_id_idx'),
+            models.Index(fields=['calories', 'id'], name='food_calories_id_idx'),
+            models.Index(fields=['protein', 'id'], name='food_protein_id_idx'),
+            models.Index(fields=['carbohydrates', 'id'], name='food_carbohydrates_id_idx'),
+            models.Index(fields=['fat', 'id'], name='food_fat_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class FoodFacetCell(models.Model):
+    """
+    Model ten służy do przechowywania liczby produktów w jednej kombinacji przedziałów kalorii i makroskładników
+    (diettracker.facets), przeliczanej przy imporcie katalogu
+    """
+    calories_bucket = models.PositiveSmallIntegerField()
+    protein_bucket = models.PositiveSmallIntegerField()
+    carbohydrates_bucket = models.PositiveSmallIntegerField()
+    fat_bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('calories_bucket', 'protein_bucket', 'carbohydrates_bucket', 'fat_bucket')
+        app_label = 'diettracker'
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Model ten służy do przechowywania postępu importu katalogu produktów, aby przerwany import można było wznowić
+    """
+    source = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    offset = models.BigIntegerField(default=0)
+    rows_imported = models.BigIntegerField(default=0)
+    rows_rejected = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'diettracker'
+
+
 class WeightEntry(models.Model):
     """
     Model ten służy do przechowywania wpisów użytkowników dotyczących ich wagi
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     weight = models.FloatField()
-    date = models.DateField(auto_now_add=True)
+    # Domyślnie dzisiejsza data; import historii (diettracker.history_import) zapisuje wpisy z wcześniejszych dni
+    date = models.DateField(default=datetime.date.today)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('user', 'date')
@@ -65,8 +108,73 @@ class Consumption(models.Model):
     fat = models.PositiveIntegerField()
     carbohydrates = models.PositiveIntegerField()
     protein = models.PositiveIntegerField()
+    # Klucz wpisu zaimportowanego z pliku - ponowny import tego samego pliku aktualizuje wpisy zamiast je dublować
+    import_key = models.CharField(max_length=40, null=True, blank=True, editable=False)
+
+    class Meta:
+        app_label = 'diettracker'
+        indexes = [
+            # Raporty i podsumowania grupują spożycie użytkownika po dniach (diettracker.reports)
+            models.Index(fields=['user', 'date'], name='consumption_user_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'import_key'], name='consumption_user_import_key'),
+        ]
+
+
+class DailySummary(models.Model):
+    """
+    Model ten służy do przechowywania dziennych sum kalorii i makroskładników użytkownika, aktualizowanych razem z wpisami Consumption
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    calories = models.IntegerField(default=0)
+    fat = models.IntegerField(default=0)
+    carbohydrates = models.IntegerField(default=0)
+    protein = models.IntegerField(default=0)
+    entries = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'date')
+        app_label = 'diettracker'
+
+
+class DailyCompliance(models.Model):
+    """
+    Model ten służy do przechowywania oceny zgodności dnia użytkownika z jego dietą (0-100), wyliczanej poleceniem score_compliance
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    score = models.FloatField()
+    limits_met = models.PositiveSmallIntegerField()
+    limits_checked = models.PositiveSmallIntegerField()
+    # Moment odczytu podsumowania, na podstawie którego wyliczono ocenę - późniejsza zmiana DailySummary wymaga przeliczenia
+    computed_at = models.DateTimeField()
 
     class Meta:
+        unique_together = ('user', 'date')
+        app_label = 'diettracker'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Model ten służy do przechowywania odpowiedzi na żądania zapisu wysłane z kluczem idempotencji (diettracker.idempotency),
+    aby ponowione żądanie otrzymało tę samą odpowiedź bez ponownego zapisu
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    # Skrót metody, ścieżki i treści żądania - ten sam klucz z inną treścią jest odrzucany
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    body = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
         app_label = 'diettracker'
 
 class Meal(models.Model):
@@ -76,6 +184,12 @@ class Meal(models.Model):
     protein = models.FloatField(blank=True, null=True)
     carbohydrates = models.FloatField(blank=True, null=True)
     fat = models.FloatField(blank=True, null=True)
+    popularity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-popularity', 'id'], name='meal_popularity_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -84,6 +198,54 @@ class Meal(models.Model):
     def is_added_by_user(self, user):
         return UserMeal.objects.filter(user=user, meal=self).exists()
 
+class FullTextField(models.TextField):
+    """
+    Kolumna tabeli pełnotekstowej SQLite FTS5 - obsługuje lookup match (np. name__match='"zup"*').
+    """
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s MATCH %s' % (lhs, rhs), (*lhs_params, *rhs_params)
+
+
+class MealSearchIndex(models.Model):
+    """
+    Model ten opisuje indeks pełnotekstowy nazw posiłków (tabela FTS5 diettracker_meal_fts z migracji 0013, tylko SQLite),
+    aby wyszukiwanie mogło złączyć go z posiłkami jednym JOIN. rank to trafność bm25 - im mniejsza, tym lepiej.
+    """
+    meal = models.OneToOneField(Meal, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                db_constraint=False, related_name='search_index')
+    name = FullTextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'diettracker_meal_fts'
+        app_label = 'diettracker'
+
+
+class MealIngredient(models.Model):
+    """
+    Model ten służy do przechowywania składników posiłku-przepisu (produkt i jego ilość w gramach).
+    Sumy kalorii i makroskładników posiłku przechowywane są w Meal i przeliczane przez diettracker.recipes
+    """
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='ingredients')
+    food = models.ForeignKey(Food, on_delete=models.CASCADE)
+    amount = models.FloatField()
+
+    class Meta:
+        unique_together = ('meal', 'food')
+        app_label = 'diettracker'
+
+    def __str__(self):
+        return '%s (%gg)' % (self.food.name, self.amount)
+
 class UserMeal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
@@ -0,0 +1,238 @@
+"""
+Kolumnowa migawka katalogu produktów do obliczeń na całym katalogu (filtry i ranking po makroskładnikach) bez tworzenia
+obiektów modelu Food.
+
+Plik settings.NUTRIENT_STORE_PATH (przebudowuje go import_off) zawiera identyfikatory (int64), kolumny CALORIES,
+PROTEIN, CARBOHYDRATES i FAT (float32 na 100 g) oraz nazwy zapisane jako przesunięcia (int64) i jeden blok bajtów UTF-8.
+Procesy mapują plik w pamięć (mmap) tylko do odczytu, więc wszystkie korzystają z jednej kopii w pamięci podręcznej
+systemu plików. Nowa migawka zapisywana jest obok i podmieniana przez os.replace - procesy wczytują ją przy następnym
+zapytaniu, a wcześniej zmapowany plik pozostaje poprawny do końca jego użycia. Żądania nigdy nie zapisują migawki
+(robią to import_off i komenda rebuild_food_facets) - bez pliku katalog jest pusty.
+
+Układ pliku: MAGIC, długość nagłówka (uint32), nagłówek JSON z położeniem kolumn, a dalej kolumny wyrównane do ALIGNMENT bajtów.
+"""
+import io
+import json
+import logging
+import mmap
+import operator
+import os
+import struct
+import tempfile
+import threading
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from diettracker.models import Food
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DTNUTR01'
+ALIGNMENT = 64
+MACROS = ('calories', 'protein', 'carbohydrates', 'fat')
+
+LOOKUPS = {'gte': operator.ge, 'gt': operator.gt, 'lte': operator.le, 'lt': operator.lt}
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _write_columns(output, ids, values, offsets):
+    """
+    Zapisuje nagłówek i kolumny liczbowe migawki; blok nazw (offsets[-1] bajtów) dopisuje wywołujący.
+    """
+    columns = [('id', ids)] + [(macro, np.ascontiguousarray(values[:, i])) for i, macro in enumerate(MACROS)]
+    columns.append(('name_offsets', offsets))
+    layout, position = {}, 0
+    for name, array in columns:
+        layout[name] = [array.dtype.str, position, len(array)]
+        position += array.nbytes + _padding(array.nbytes)
+    header = json.dumps({'count': len(ids), 'columns': layout, 'names': [position, int(offsets[-1])]}).encode()
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    output.write(prefix + b'\0' * _padding(len(prefix)))
+    for name, array in columns:
+        output.write(array.tobytes())
+        output.write(b'\0' * _padding(array.nbytes))
+
+
+def write_nutrient_store(path, queryset=None, chunk_size=50000):
+    """
+    Zapisuje migawkę produktów (domyślnie całego katalogu) do pliku path. Zwraca liczbę zapisanych produktów.
+    """
+    queryset = Food.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values_list('id', 'name', *MACROS).iterator(chunk_size=chunk_size)
+    ids, values, lengths = [], [], []
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryFile(dir=directory) as names:
+        # Nazwy trafiają od razu do pliku tymczasowego, w pamięci zostają tylko kolumny liczbowe
+        for chunk in _chunks(rows, chunk_size):
+            encoded = [row[1].encode() for row in chunk]
+            ids.append(np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)))
+            values.append(np.array([row[2:] for row in chunk], dtype=np.float32))
+            lengths.append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(chunk)))
+            names.write(b''.join(encoded))
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+        values = np.concatenate(values) if values else np.empty((0, len(MACROS)), dtype=np.float32)
+        offsets = np.concatenate(([0], np.cumsum(np.concatenate(lengths) if lengths else []))).astype(np.int64)
+
+        # Każdy zapis ma własny plik tymczasowy - równoległe przebudowy nie nadpisują sobie nawzajem danych
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.nutrient_store.', delete=False) as output:
+            try:
+                _write_columns(output, ids, values, offsets)
+                names.seek(0)
+                while True:
+                    block = names.read(1 << 20)
+                    if not block:
+                        break
+                    output.write(block)
+                output.flush()
+                os.fsync(output.fileno())
+            except BaseException:
+                output.close()
+                os.unlink(output.name)
+                raise
+    os.replace(output.name, path)
+    return len(ids)
+
+
+class NutrientStore:
+    def __init__(self, path=None, buffer=None):
+        if buffer is None:
+            with open(path, 'rb') as source:
+                buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = buffer
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("Plik %s nie jest migawką katalogu produktów" % path)
+        header_length, = struct.unpack_from('<I', self.buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.buffer[start:start + header_length])
+        base = start + header_length + _padding(start + header_length)
+
+        self.columns = {
+            name: np.frombuffer(self.buffer, dtype=np.dtype(dtype), count=count, offset=base + offset)
+            for name, (dtype, offset, count) in header['columns'].items()
+        }
+        self.ids = self.columns['id']
+        self.name_offsets = self.columns['name_offsets']
+        names_offset, names_length = header['names']
+        self.names = memoryview(self.buffer)[base + names_offset:base + names_offset + names_length]
+
+    @classmethod
+    def empty(cls):
+        """
+        Migawka bez produktów (w pamięci), używana, gdy plik migawki jeszcze nie istnieje.
+        """
+        output = io.BytesIO()
+        _write_columns(output, np.empty(0, dtype=np.int64), np.empty((0, len(MACROS)), dtype=np.float32),
+                       np.zeros(1, dtype=np.int64))
+        return cls(buffer=output.getvalue())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, name):
+        if name not in MACROS:
+            raise ValueError("Nieznana kolumna: %s" % name)
+        return self.columns[name]
+
+    def name(self, position):
+        return bytes(self.names[self.name_offsets[position]:self.name_offsets[position + 1]]).decode()
+
+    def mask(self, **filters):
+        """
+        Maska produktów spełniających filtry w stylu ORM, np. protein__gte=20, fat__lt=5, calories__range=(100, 300).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for lookup, value in filters.items():
+            field, _, kind = lookup.partition('__')
+            column = self.column(field)
+            if kind == 'range':
+                low, high = value
+                mask &= (column >= low) & (column <= high)
+            elif kind in LOOKUPS:
+                mask &= LOOKUPS[kind](column, value)
+            else:
+                raise ValueError("Nieobsługiwany filtr: %s" % lookup)
+        return mask
+
+    def top(self, order_by, limit, mask=None):
+        """
+        Zwraca pozycje co najwyżej limit produktów (spośród maski) o największej ('-kolumna') lub najmniejszej wartości
+        kolumny; remisy rozstrzyga id.
+        """
+        if limit <= 0:
+            return np.empty(0, dtype=np.int64)
+        positions = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        column = self.column(order_by.lstrip('-'))
+        values = column[positions]
+        if order_by.startswith('-'):
+            values = -values
+        if limit < len(positions):
+            selected = np.argpartition(values, limit - 1)[:limit]
+            # Produkty z tą samą wartością co ostatni wybrany muszą konkurować po id
+            boundary = values[selected].max()
+            selected = np.union1d(selected, np.flatnonzero(values == boundary))
+        else:
+            selected = np.arange(len(positions))
+        order = np.lexsort((self.ids[positions[selected]], values[selected]))[:limit]
+        return positions[selected[order]]
+
+    def rows(self, positions):
+        return [
+            {'id': int(self.ids[position]), 'name': self.name(position),
+             **{macro: round(float(self.columns[macro][position]), 2) for macro in MACROS}}
+            for position in positions
+        ]
+
+    def query(self, order_by='-protein', limit=20, **filters):
+        """
+        Filtruje i sortuje cały katalog; zwraca listę słowników z id, nazwą i wartościami na 100 g.
+        """
+        return self.rows(self.top(order_by, limit, self.mask(**filters) if filters else None))
+
+
+def store_path():
+    return str(settings.NUTRIENT_STORE_PATH)
+
+
+def rebuild_nutrient_store():
+    """
+    Zapisuje migawkę katalogu od nowa; procesy serwera zmapują ją przy następnym zapytaniu.
+    """
+    path = store_path()
+    write_nutrient_store(path)
+    store = NutrientStore(path)
+    with _lock:
+        _loaded[path] = (os.stat(path).st_mtime_ns, store)
+    return store
+
+
+def get_nutrient_store():
+    """
+    Zwraca zmapowaną migawkę katalogu (ponownie, jeśli plik się zmienił) albo pustą migawkę, gdy pliku nie ma.
+    """
+    path = store_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        logger.warning('Brak migawki katalogu %s - uruchom manage.py rebuild_food_facets', path)
+        return NutrientStore.empty()
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            loaded = _loaded[path] = (mtime, NutrientStore(path))
+    return loaded[1]
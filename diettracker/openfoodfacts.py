@@ -0,0 +1,118 @@
+"""
+Parsowanie eksportu OpenFoodFacts (plik CSV rozdzielany tabulatorami).
+
+Funkcje z tego modułu nie korzystają z Django, dzięki czemu mogą być wykonywane w procesach roboczych importu.
+"""
+import csv
+
+KJ_PER_KCAL = 4.184
+
+# Kolumny eksportu, z których budujemy rekord Food; przy kilku nazwach wygrywa pierwsza niepusta wartość
+OFF_COLUMNS = {
+    'code': ('code',),
+    'name': ('product_name_pl', 'product_name'),
+    'calories': ('energy-kcal_100g',),
+    'energy_kj': ('energy_100g', 'energy-kj_100g'),
+    'protein': ('proteins_100g',),
+    'carbohydrates': ('carbohydrates_100g',),
+    'fat': ('fat_100g',),
+}
+
+CODE_MAX_LENGTH = 64
+NAME_MAX_LENGTH = 100
+MAX_CALORIES = 900.0
+MAX_MACRO = 100.0
+
+
+def resolve_columns(header_line):
+    """
+    Zwraca słownik pole -> lista indeksów kolumn na podstawie nagłówka eksportu.
+    """
+    header = header_line.decode('utf-8').rstrip('\r\n').split('\t')
+    positions = {name: index for index, name in enumerate(header)}
+    columns = {}
+    for field, names in OFF_COLUMNS.items():
+        columns[field] = [positions[name] for name in names if name in positions]
+    missing = [field for field in ('code', 'name', 'protein', 'carbohydrates', 'fat') if not columns[field]]
+    if missing or not (columns['calories'] or columns['energy_kj']):
+        raise ValueError("Nagłówek pliku nie zawiera wymaganych kolumn: %s" % ', '.join(missing or ['energy']))
+    return columns
+
+
+def _first(row, indices):
+    for index in indices:
+        if index < len(row) and row[index].strip():
+            return row[index].strip()
+    return None
+
+
+def _number(value):
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    if number != number or number < 0:
+        return None
+    return number
+
+
+def parse_row(row, columns):
+    """
+    Zamienia wiersz eksportu na krotkę (code, name, calories, protein, carbohydrates, fat) lub None, jeśli wiersz jest niepoprawny.
+    """
+    code = _first(row, columns['code'])
+    name = _first(row, columns['name'])
+    if not code or not name or len(code) > CODE_MAX_LENGTH:
+        return None
+
+    calories = _number(_first(row, columns['calories']))
+    if calories is None:
+        energy_kj = _number(_first(row, columns['energy_kj']))
+        if energy_kj is not None:
+            calories = energy_kj / KJ_PER_KCAL
+    protein = _number(_first(row, columns['protein']))
+    carbohydrates = _number(_first(row, columns['carbohydrates']))
+    fat = _number(_first(row, columns['fat']))
+
+    if calories is None or protein is None or carbohydrates is None or fat is None:
+        return None
+    if calories > MAX_CALORIES or max(protein, carbohydrates, fat) > MAX_MACRO:
+        return None
+    if protein + carbohydrates + fat > MAX_MACRO + 1:
+        return None
+
+    return code, name[:NAME_MAX_LENGTH], round(calories, 1), round(protein, 1), round(carbohydrates, 1), round(fat, 1)
+
+
+def parse_chunk(lines, columns):
+    """
+    Parsuje paczkę surowych linii pliku. Zwraca krotkę (poprawne wiersze, liczba odrzuconych wierszy).
+    """
+    reader = csv.reader((line.decode('utf-8', 'replace') for line in lines), delimiter='\t', quoting=csv.QUOTE_NONE)
+    rows = []
+    rejected = 0
+    for row in reader:
+        parsed = parse_row(row, columns)
+        if parsed is None:
+            rejected += 1
+        else:
+            rows.append(parsed)
+    return rows, rejected
+
+
+def iter_chunks(file, chunk_size):
+    """
+    Czyta plik binarny paczkami po chunk_size linii. Zwraca pary (linie, pozycja w pliku za ostatnią linią paczki).
+    """
+    offset = file.tell()
+    lines = []
+    for line in file:
+        offset += len(line)
+        lines.append(line)
+        if len(lines) >= chunk_size:
+            yield lines, offset
+            lines = []
+    if lines:
+        yield lines, offset
@@ -0,0 +1,149 @@
+"""
+Pamięć podręczna całych stron i fragmentów szablonów.
+
+CachedPageMixin zapamiętuje w cache gotową odpowiedź GET widoku - dla niezalogowanych użytkowników, a w widokach
+z cache_authenticated = True także dla zalogowanych (strony statyczne, które różnią się tylko stanem zalogowania).
+Fragmenty szablonów zapamiętuje wbudowany znacznik {% cache %}; procesor kontekstu page_cache_context udostępnia
+szablonom czas przechowywania fragmentów i wersję, którą fragmenty dokładają do swoich wartości vary_on, np.
+{% cache fragment_cache_timeout navigation user.is_authenticated page_cache_version %} w base.html.
+
+Klucze zawierają wersję (page_cache_version) trzymaną we współdzielonym cache, którą podbija bump_page_cache_version
+(np. komenda clear_page_cache po wdrożeniu nowych szablonów); widoki mogą też dołożyć własne wersje danych (FoodView -
+wersję katalogu produktów). Nie są zapamiętywane odpowiedzi ustawiające ciasteczka ani strony, które użyły tokenu CSRF.
+Liczniki trafień i chybień stron (w pamięci procesu) wystawiane są pod /metrics.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+from django.utils.functional import SimpleLazyObject
+
+from diettracker.food_cache import initial_version
+
+PAGE_CACHE_VERSION_KEY = 'page_cache_version'
+DEFAULT_PAGE_TIMEOUT = 60 * 15
+DEFAULT_FRAGMENT_TIMEOUT = 60 * 60
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def record(self, kind, hit):
+        with self.lock:
+            self.counts[(kind, 'hits' if hit else 'misses')] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+
+
+stats = CacheStats()
+
+
+def page_cache_version():
+    return cache.get_or_set(PAGE_CACHE_VERSION_KEY, initial_version, None)
+
+
+def bump_page_cache_version():
+    """
+    Unieważnia wszystkie zapamiętane strony i fragmenty.
+    """
+    try:
+        cache.incr(PAGE_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(PAGE_CACHE_VERSION_KEY, initial_version(), None)
+
+
+def _digest(parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def page_cache_context(request):
+    """
+    Procesor kontekstu dla znacznika {% cache %} - wersja jest odczytywana dopiero przy renderowaniu fragmentu.
+    """
+    return {
+        'page_cache_version': SimpleLazyObject(page_cache_version),
+        'fragment_cache_timeout': getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_FRAGMENT_TIMEOUT),
+    }
+
+
+class CachedPageMixin:
+    page_cache_timeout = DEFAULT_PAGE_TIMEOUT
+    # Czy zapamiętywać stronę także dla zalogowanych - tylko dla stron, które poza stanem zalogowania nie zależą od użytkownika
+    cache_authenticated = False
+
+    def get_page_cache_vary(self, request):
+        """
+        Dodatkowe wartości klucza strony (np. wersje danych wyświetlanych na stronie).
+        """
+        return []
+
+    def get_page_cache_key(self, request):
+        parts = [request.get_full_path(), request.headers.get('Accept', ''), request.user.is_authenticated,
+                 *self.get_page_cache_vary(request)]
+        return 'page:%s:%s:%s' % (page_cache_version(), self.__class__.__name__, _digest(parts))
+
+    def is_page_cacheable(self, request, response):
+        return (response.status_code == 200 and not response.streaming and not response.cookies
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'))
+
+    def store_page(self, request, key, response):
+        if isinstance(response, SimpleTemplateResponse):
+            response.render()
+        if self.is_page_cacheable(request, response):
+            cache.set(key, (response.content, response['Content-Type']), self.page_cache_timeout)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated and not self.cache_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key(request)
+        cached = cache.get(key)
+        stats.record('page', cached is not None)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Page-Cache'] = 'hit'
+            if self.view_is_async:
+                async def hit():
+                    return response
+                return hit()
+            return response
+
+        if self.view_is_async:
+            async def miss():
+                return self.store_page(request, key, await super(CachedPageMixin, self).dispatch(request, *args, **kwargs))
+            return miss()
+        return self.store_page(request, key, super().dispatch(request, *args, **kwargs))
+
+
+def render_metrics():
+    """
+    Trafienia, chybienia i współczynnik trafień pamięci podręcznej stron w formacie tekstowym Prometheusa.
+    """
+    counts = stats.snapshot()
+    lines = []
+    for name, kind, description in [('hits', 'counter', 'Odpowiedzi obsłużone z pamięci podręcznej.'),
+                                    ('misses', 'counter', 'Odpowiedzi renderowane od nowa.'),
+                                    ('hit_ratio', 'gauge', 'Udział trafień w odczytach pamięci podręcznej.')]:
+        metric = 'diettracker_page_cache_%s%s' % (name, '_total' if kind == 'counter' else '')
+        lines.extend(['# HELP %s %s' % (metric, description), '# TYPE %s %s' % (metric, kind)])
+        hits, misses = counts.get(('page', 'hits'), 0), counts.get(('page', 'misses'), 0)
+        if name == 'hit_ratio':
+            value = '%.4f' % (hits / (hits + misses) if hits + misses else 0)
+        else:
+            value = '%d' % (hits if name == 'hits' else misses)
+        lines.append('%s{cache="page"} %s' % (metric, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,150 @@
+"""
+Stronicowanie kluczem (keyset) - kolejna strona wybierana jest warunkiem na wartości sortowania ostatniego wiersza,
+a nie przez OFFSET, więc odczyt dalekich stron kosztuje tyle samo co pierwszej.
+"""
+import base64
+import json
+
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Stronicuje queryset posortowany po jednym polu, z kluczem głównym jako drugim kryterium, aby kolejność była stabilna.
+    ordering ma postać 'calories' lub '-calories'.
+    """
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        self.per_page = per_page
+
+    def encode_cursor(self, obj, before=False):
+        payload = [self.field, getattr(obj, self.field), obj.pk, before]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            field, value, pk, before = json.loads(base64.urlsafe_b64decode(padded))
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if field != self.field:
+            raise InvalidCursor(cursor)
+        return value, pk, bool(before)
+
+    def _filtered(self, cursor):
+        before = False
+        queryset = self.queryset
+        if cursor:
+            value, pk, before = self.decode_cursor(cursor)
+            # Dla strony poprzedniej idziemy w odwrotnym kierunku i odwracamy wynik
+            greater = self.descending == before
+            lookup = 'gt' if greater else 'lt'
+            queryset = queryset.filter(
+                Q(**{'%s__%s' % (self.field, lookup): value}) | Q(**{self.field: value, 'pk__%s' % lookup: pk})
+            )
+
+        reverse = self.descending != before
+        prefix = '-' if reverse else ''
+        return queryset.order_by(prefix + self.field, prefix + 'pk')[:self.per_page + 1], before
+
+    def _page(self, rows, cursor, before):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows, None, None)
+        has_next = has_more if not before else True
+        has_previous = bool(cursor) if not before else has_more
+        next_cursor = self.encode_cursor(rows[-1]) if has_next else None
+        previous_cursor = self.encode_cursor(rows[0], before=True) if has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, before = self._filtered(cursor)
+        return self._page(list(queryset), cursor, before)
+
+    async def apage(self, cursor=None):
+        queryset, before = self._filtered(cursor)
+        return self._page([obj async for obj in queryset], cursor, before)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, który zapamiętuje liczbę wyników w cache pod podanym kluczem, zamiast liczyć COUNT(*) przy każdej stronie.
+    Klucz powinien zawierać wersję danych, aby zmiana danych unieważniała zapamiętane liczby.
+    """
+    def __init__(self, object_list, per_page, count_cache_key, count_timeout=600, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout
+        self.prefetched = {}
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.count_cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_cache_key, count, self.count_timeout)
+        return count
+
+    async def acount(self):
+        if 'count' not in self.__dict__:
+            count = await cache.aget(self.count_cache_key)
+            if count is None:
+                count = await self.object_list.acount()
+                await cache.aset(self.count_cache_key, count, self.count_timeout)
+            self.__dict__['count'] = count
+        return self.count
+
+    async def aprefetch_page(self, number):
+        """
+        Asynchronicznie wczytuje liczbę wyników i wiersze strony, tak aby późniejsze page(number) nie odpytywało bazy.
+        """
+        await self.acount()
+        try:
+            number = self.validate_number(number)
+        except InvalidPage:
+            return
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        self.prefetched[number] = [obj async for obj in self.object_list[bottom:top]]
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number in self.prefetched:
+            return self._get_page(self.prefetched[number], number, self)
+        return super().page(number)
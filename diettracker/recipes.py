@@ -0,0 +1,91 @@
+"""
+Posiłki-przepisy złożone z produktów (MealIngredient). Sumy kalorii i makroskładników przepisu są zapisane w wierszu Meal,
+więc zapisanie spożycia posiłku nadal odczytuje tylko jeden wiersz. Zmiana jednego składnika aktualizuje sumy o różnicę,
+a zmiana wartości produktów (np. przy imporcie katalogu) przelicza wszystkie przepisy, w których występują, jednym UPDATE.
+"""
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from diettracker.meal_library import bump_meal_catalogue_version, invalidate_meal_library
+from diettracker.models import Meal, MealIngredient, UserMeal
+
+MACROS = ('calories', 'protein', 'carbohydrates', 'fat')
+
+# Liczba posiłków przeliczanych jednym zapytaniem UPDATE
+RECOMPUTE_BATCH_SIZE = 500
+
+
+def _ingredient_total(macro):
+    totals = (
+        MealIngredient.objects.filter(meal=OuterRef('pk')).order_by().values('meal')
+        .annotate(total=Sum(F('food__%s' % macro) * F('amount') / 100.0, output_field=FloatField()))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=FloatField()), Value(0.0))
+
+
+def _invalidate(meal_ids):
+    owners = Meal.objects.filter(pk__in=meal_ids).values_list('user_id', flat=True)
+    linked = UserMeal.objects.filter(meal_id__in=meal_ids).values_list('user_id', flat=True)
+    invalidate_meal_library(*set(owners) | set(linked))
+    bump_meal_catalogue_version()
+
+
+def recompute_meals(meal_ids):
+    """
+    Przelicza sumy podanych posiłków od nowa na podstawie ich składników. Zwraca liczbę zaktualizowanych posiłków.
+    """
+    meal_ids = sorted(set(meal_ids))
+    updated = 0
+    with transaction.atomic():
+        for start in range(0, len(meal_ids), RECOMPUTE_BATCH_SIZE):
+            batch = meal_ids[start:start + RECOMPUTE_BATCH_SIZE]
+            updated += Meal.objects.filter(pk__in=batch).update(**{macro: _ingredient_total(macro) for macro in MACROS})
+            _invalidate(batch)
+    return updated
+
+
+def recompute_meals_for_foods(food_ids):
+    """
+    Przelicza wszystkie przepisy, w których występuje któryś z podanych produktów.
+    """
+    meal_ids = MealIngredient.objects.filter(food_id__in=food_ids).values_list('meal_id', flat=True).distinct()
+    return recompute_meals(list(meal_ids))
+
+
+def _apply_delta(meal, food, grams):
+    Meal.objects.filter(pk=meal.pk).update(**{
+        macro: Coalesce(F(macro), Value(0.0)) + (getattr(food, macro) or 0) * grams / 100.0 for macro in MACROS
+    })
+    _invalidate([meal.pk])
+
+
+def set_ingredient(meal, food, amount):
+    """
+    Dodaje produkt do przepisu lub zmienia jego ilość i aktualizuje sumy posiłku o różnicę.
+    Pierwszy składnik zastępuje ręcznie wpisane wartości posiłku, więc wtedy sumy liczone są od nowa.
+    """
+    with transaction.atomic():
+        had_ingredients = meal.ingredients.exists()
+        ingredient, created = MealIngredient.objects.select_for_update().get_or_create(
+            meal=meal, food=food, defaults={'amount': amount}
+        )
+        previous = 0 if created else ingredient.amount
+        if not created:
+            ingredient.amount = amount
+            ingredient.save(update_fields=['amount'])
+        if had_ingredients:
+            _apply_delta(meal, food, amount - previous)
+        else:
+            recompute_meals([meal.pk])
+    return ingredient
+
+
+def remove_ingredient(ingredient):
+    with transaction.atomic():
+        ingredient.delete()
+        if ingredient.meal.ingredients.exists():
+            _apply_delta(ingredient.meal, ingredient.food, -ingredient.amount)
+        else:
+            recompute_meals([ingredient.meal_id])
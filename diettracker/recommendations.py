@@ -0,0 +1,197 @@
+"""
+Podpowiedzi produktów i posiłków, które najlepiej wypełniają pozostały na dziś limit kalorii i makroskładników.
+
+Produkty wyszukiwane są w indeksie najbliższych sąsiadów zbudowanym nad udziałami tłuszczu, węglowodanów i białka
+w energii 100 g produktu (punkty w przestrzeni 3D), przeszukiwanym drzewem KD (scipy cKDTree). Indeks zapisywany jest
+do pliku settings.FOOD_INDEX_PATH przez import_off lub komendę rebuild_food_index, a każdy proces wczytuje go ponownie,
+gdy plik się zmieni. Żądania nigdy nie budują indeksu - bez pliku podpowiedzi produktów są puste.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import cKDTree
+
+from diettracker.models import Food
+
+logger = logging.getLogger(__name__)
+
+MACROS = ('calories', 'fat', 'carbohydrates', 'protein')
+
+# Energia z grama tłuszczu, węglowodanów i białka (kcal)
+MACRO_KCAL = np.array([9.0, 4.0, 4.0])
+
+# Udziały w energii przyjmowane dla makroskładników, dla których dieta nie określa limitu
+DEFAULT_SHARES = np.array([0.3, 0.5, 0.2])
+
+MIN_PORTION = 10
+MAX_PORTION = 500
+PORTION_STEP = 5
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+_loaded = {}
+
+
+class FoodIndex:
+    def __init__(self, ids, macros):
+        # macros: wartości na 100 g w kolejności MACROS
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.macros = np.asarray(macros, dtype=np.float64).reshape(-1, len(MACROS))
+        energy = self.macros[:, 1:] * MACRO_KCAL
+        self.points = energy / energy.sum(axis=1, keepdims=True) if len(self.ids) else np.empty((0, 3))
+        self.tree = cKDTree(self.points) if len(self.ids) else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, queryset=None, chunk_size=50000):
+        """
+        Buduje indeks z produktów, które mają kalorie i niezerową energię z makroskładników.
+        """
+        queryset = Food.objects.all() if queryset is None else queryset
+        rows = queryset.filter(calories__gt=0).exclude(fat=0, carbohydrates=0, protein=0).values_list('id', *MACROS)
+        data = np.array(list(rows.iterator(chunk_size=chunk_size)), dtype=np.float64).reshape(-1, len(MACROS) + 1)
+        return cls(data[:, 0], data[:, 1:])
+
+    def save(self, path):
+        temporary = '%s.tmp.npz' % path
+        np.savez(temporary, ids=self.ids, macros=self.macros)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'], data['macros'])
+
+    def nearest(self, point, count):
+        """
+        Zwraca pozycje (w tablicach indeksu) count produktów o składzie najbliższym punktowi, od najbliższego.
+        """
+        count = min(count, len(self))
+        if not count:
+            return np.empty(0, dtype=np.int64)
+        _, positions = self.tree.query(point, k=count)
+        return np.atleast_1d(positions)
+
+
+def index_path():
+    return str(settings.FOOD_INDEX_PATH)
+
+
+def rebuild_food_index():
+    """
+    Buduje indeks produktów od nowa i zapisuje go do pliku; procesy serwera wczytają go przy następnym zapytaniu.
+    """
+    # Równoległe przebudowy w jednym procesie czytałyby cały katalog kilka razy
+    with _build_lock:
+        index = FoodIndex.build()
+        path = index_path()
+        index.save(path)
+        with _lock:
+            _loaded[path] = (os.stat(path).st_mtime_ns, index)
+    return index
+
+
+def get_food_index():
+    """
+    Zwraca indeks produktów wczytany z pliku (ponownie, jeśli plik się zmienił) albo pusty indeks, gdy pliku nie ma.
+    """
+    path = index_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        logger.warning('Brak indeksu podpowiedzi %s - uruchom manage.py rebuild_food_index', path)
+        return FoodIndex([], [])
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            loaded = _loaded[path] = (mtime, FoodIndex.load(path))
+    return loaded[1]
+
+
+def target_shares(remaining):
+    """
+    Zwraca (kalorie, udziały tłuszczu, węglowodanów i białka w energii) dla pozostałego limitu albo None,
+    gdy nie da się go określić. Makroskładniki bez limitu dzielą resztę energii w proporcjach DEFAULT_SHARES.
+    """
+    grams = np.array([np.nan if remaining.get(macro) is None else max(0, remaining[macro]) for macro in MACROS[1:]],
+                     dtype=np.float64)
+    known = ~np.isnan(grams)
+    calories = remaining.get('calories')
+    if calories is None:
+        if not known.all():
+            return None
+        calories = float((grams * MACRO_KCAL).sum())
+    if calories <= 0:
+        return None
+
+    shares = np.where(known, np.nan_to_num(grams) * MACRO_KCAL / calories, 0)
+    rest = max(0.0, 1 - shares.sum())
+    if not known.all():
+        shares[~known] = DEFAULT_SHARES[~known] / DEFAULT_SHARES[~known].sum() * rest
+    if shares.sum() <= 0:
+        return None
+    return float(calories), shares / shares.sum()
+
+
+def portion_error(values, remaining):
+    """
+    Względne odchylenie wartości porcji od pozostałego limitu, liczone dla makroskładników, które mają limit.
+    Przekroczenie limitu liczy się podwójnie.
+    """
+    errors = np.zeros(len(values))
+    for column, macro in enumerate(MACROS):
+        target = remaining.get(macro)
+        if target is None:
+            continue
+        target = max(0, target)
+        difference = values[:, column] - target
+        errors += np.where(difference > 0, 2, 1) * np.abs(difference) / max(target, 1)
+    return errors
+
+
+def recommend_foods(remaining, limit=5, candidates=50, index=None):
+    """
+    Zwraca listę słowników z produktem, sugerowaną porcją w gramach i jej wartościami, najlepiej wypełniających
+    pozostały limit (remaining - słownik MACROS, None oznacza brak limitu).
+    """
+    target = target_shares(remaining)
+    if target is None:
+        return []
+    calories, shares = target
+    index = get_food_index() if index is None else index
+    positions = index.nearest(shares, candidates)
+    if not len(positions):
+        return []
+
+    per_100g = index.macros[positions]
+    amounts = np.clip(np.round(100 * calories / per_100g[:, 0] / PORTION_STEP) * PORTION_STEP, MIN_PORTION, MAX_PORTION)
+    values = per_100g * amounts[:, None] / 100
+    order = np.argsort(portion_error(values, remaining), kind='stable')[:limit]
+
+    foods = Food.objects.in_bulk([int(index.ids[positions[i]]) for i in order])
+    recommendations = []
+    for i in order:
+        food = foods.get(int(index.ids[positions[i]]))
+        if food is None:
+            continue
+        recommendation = {'id': food.id, 'name': food.name, 'amount': int(amounts[i])}
+        recommendation.update({macro: round(float(value), 1) for macro, value in zip(MACROS, values[i])})
+        recommendations.append(recommendation)
+    return recommendations
+
+
+def recommend_meals(meals, remaining, limit=3):
+    """
+    Wybiera z posiłków użytkownika (np. z get_meal_library) te, które najlepiej wypełniają pozostały limit.
+    """
+    if not meals or target_shares(remaining) is None:
+        return []
+    values = np.array([[getattr(meal, macro) or 0 for macro in MACROS] for meal in meals], dtype=np.float64)
+    order = np.argsort(portion_error(values, remaining), kind='stable')[:limit]
+    return [{'id': meals[i].id, 'name': meals[i].name, **{macro: float(values[i, column]) for column, macro in enumerate(MACROS)}}
+            for i in order]
@@ -0,0 +1,126 @@
+"""
+Raporty spożycia za dowolny zakres dat. Sumy dzienne liczone są w bazie jednym zapytaniem GROUP BY po Consumption
+(korzysta z indeksu consumption_user_date_idx), a sumy okresów (tygodni, miesięcy) składane są z kilkuset wierszy dziennych.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Count, Sum
+
+from diettracker.models import Consumption, Diet
+
+MACROS = ('calories', 'fat', 'carbohydrates', 'protein')
+
+# Limity diety odpowiadające poszczególnym makroskładnikom: (pole minimum, pole maksimum)
+DIET_LIMITS = {
+    'calories': ('min_calories', 'max_calories'),
+    'fat': (None, 'max_fat'),
+    'carbohydrates': (None, 'max_carbohydrates'),
+    'protein': ('min_protein', 'max_protein'),
+}
+
+# Najdłuższy zakres raportu w dniach
+MAX_RANGE_DAYS = 5 * 366
+
+
+def week_bounds(day):
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def month_bounds(day):
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def day_bounds(day):
+    return day, day
+
+
+PERIOD_BOUNDS = {'day': day_bounds, 'week': week_bounds, 'month': month_bounds}
+
+
+def daily_rows(user, start, end):
+    """
+    Zwraca sumy makroskładników i liczbę wpisów dla każdego dnia z zakresu, w którym użytkownik coś spożył.
+    """
+    return list(
+        Consumption.objects.filter(user=user, date__range=(start, end))
+        .values('date')
+        .annotate(**{macro: Sum(macro) for macro in MACROS}, entries=Count('id'))
+        .order_by('date')
+    )
+
+
+def diet_limits(diet):
+    if diet is None:
+        return None
+    return {macro: {'min': getattr(diet, low) if low else None, 'max': getattr(diet, high)}
+            for macro, (low, high) in DIET_LIMITS.items()}
+
+
+def compare(value, limits):
+    """
+    Porównuje wartość z limitami diety: 'below', 'above', 'ok' albo None, gdy dla makroskładnika nie ustawiono limitu.
+    """
+    low, high = limits['min'], limits['max']
+    if low is None and high is None:
+        return None
+    if low is not None and value < low:
+        return 'below'
+    if high is not None and value > high:
+        return 'above'
+    return 'ok'
+
+
+def summarize(days, limits):
+    """
+    Sumy, średnie na dzień z wpisami oraz porównanie średnich z limitami diety dla listy wierszy dziennych.
+    """
+    totals = {macro: sum(day[macro] for day in days) for macro in MACROS}
+    logged = len(days)
+    averages = {macro: round(totals[macro] / logged, 1) if logged else 0 for macro in MACROS}
+    summary = {'days_logged': logged, 'entries': sum(day['entries'] for day in days), 'totals': totals, 'averages': averages}
+    if limits is not None:
+        summary['limits'] = {macro: compare(averages[macro], limits[macro]) for macro in MACROS} if logged else {}
+        summary['days_within_limits'] = sum(
+            1 for day in days if all(compare(day[macro], limits[macro]) in ('ok', None) for macro in MACROS)
+        )
+    return summary
+
+
+def nutrition_report(user, start, end, period='day', diet=None):
+    """
+    Buduje raport spożycia użytkownika od start do end włącznie, z sumami dziennymi i sumami okresów (period).
+    diet domyślnie jest pierwszą dietą użytkownika; brak diety oznacza brak porównania z limitami.
+    """
+    if period not in PERIOD_BOUNDS:
+        raise ValueError(period)
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError((start, end))
+    if diet is None:
+        diet = Diet.objects.filter(user=user).first()
+    limits = diet_limits(diet)
+
+    days = daily_rows(user, start, end)
+    if limits is not None:
+        for day in days:
+            day['limits'] = {macro: compare(day[macro], limits[macro]) for macro in MACROS}
+
+    bounds = PERIOD_BOUNDS[period]
+    periods = {}
+    for day in days:
+        periods.setdefault(bounds(day['date']), []).append(day)
+    period_rows = [
+        dict(summarize(rows, limits), start=max(first, start), end=min(last, end))
+        for (first, last), rows in sorted(periods.items())
+    ]
+
+    return dict(summarize(days, limits), start=start, end=end, period=period, diet=limits, days=days, periods=period_rows)
+
+
+def report_range(span, day):
+    """
+    Zwraca zakres (start, end) tygodnia lub miesiąca zawierającego dany dzień.
+    """
+    return PERIOD_BOUNDS[span](day or date.today())
@@ -0,0 +1,103 @@
+"""
+Kierowanie odczytów do replik bazy danych (settings.REPLICA_DATABASES).
+
+Do repliki trafiają tylko odczyty modeli diettracker wykonywane w trakcie żądań tylko do odczytu (GET i HEAD - oznacza je
+replica_routing_middleware) albo wewnątrz bloku replica_reads(). Sesje i użytkownicy zawsze czytani są z bazy głównej.
+Odczyty wracają do bazy głównej, gdy:
+- żądanie wykonało już zapis (kolejne odczyty w tym samym żądaniu widzą zapisane dane),
+- trwa transakcja na bazie głównej,
+- klient wysłał niedawno żądanie zapisujące - po każdym POST ustawiane jest ciasteczko STICKY_COOKIE, które przez
+  settings.REPLICA_STICKY_SECONDS sekund kieruje odczyty tego klienta do bazy głównej (odczyt własnych zapisów mimo
+  opóźnienia replikacji).
+"""
+import contextlib
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'primary_until'
+DEFAULT_STICKY_SECONDS = 10
+ROUTED_APP_LABELS = {'diettracker'}
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = True
+
+
+current_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """
+    Odczyty modeli diettracker wewnątrz bloku mogą trafić do repliki (do pierwszego zapisu).
+    """
+    token = current_routing.set(RoutingState())
+    try:
+        yield
+    finally:
+        current_routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is None or not state.replica or model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        replicas = replica_aliases()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.replica = False
+        # Obiekt odczytany z repliki zapisujemy w bazie głównej (bez tego Django użyłby bazy, z której pochodzi)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Repliki są kopiami bazy głównej - schemat zmieniają tylko migracje na bazie głównej
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def reads_from_replica(request):
+    return request.method in ('GET', 'HEAD') and not is_pinned(request)
+
+
+def pin_to_primary(request, response):
+    """
+    Po żądaniu zapisującym kieruje na chwilę odczyty klienta do bazy głównej.
+    """
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or not replica_aliases():
+        return response
+    seconds = sticky_seconds()
+    response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+    return response
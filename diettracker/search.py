@@ -0,0 +1,90 @@
+"""
+Wyszukiwanie produktów po nazwie z użyciem indeksu pełnotekstowego (SQLite FTS5, patrz migracja 0009_food_fts).
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.expressions import RawSQL
+
+from diettracker.models import Food
+
+MAX_RESULTS = 50
+
+# Wpływ popularności posiłku (liczby dodań do list użytkowników) na ranking - rank z bm25 jest ujemny, im mniejszy tym lepiej
+MEAL_POPULARITY_WEIGHT = 0.1
+
+FOOD_FTS_SQL = (
+    "SELECT f.* FROM diettracker_food f "
+    "JOIN diettracker_food_fts fts ON fts.rowid = f.id "
+    "WHERE diettracker_food_fts MATCH %s "
+    "ORDER BY fts.rank LIMIT %s"
+)
+
+FOOD_MATCH_SQL = "SELECT rowid FROM diettracker_food_fts WHERE diettracker_food_fts MATCH %s"
+
+
+def fold(text):
+    """
+    Sprowadza tekst do małych liter bez polskich znaków diakrytycznych ("Łosoś wędzony" -> "losos wedzony").
+    """
+    text = text.replace('ł', 'l').replace('Ł', 'L')
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def match_query(query):
+    """
+    Buduje zapytanie FTS5, w którym każde słowo jest dopasowywane jako prefiks ("wędz łos" -> '"wedz"* "los"*').
+    """
+    tokens = re.findall(r'\w+', fold(query))
+    return ' '.join('"%s"*' % token for token in tokens)
+
+
+def search_food(query, limit=10):
+    """
+    Zwraca listę produktów pasujących do zapytania, od najlepiej dopasowanych.
+    """
+    limit = max(1, min(limit, MAX_RESULTS))
+    fts_query = match_query(query)
+    if not fts_query:
+        return []
+    if connection.vendor != 'sqlite':
+        queryset = Food.objects.all()
+        for token in re.findall(r'\w+', query):
+            queryset = queryset.filter(name__icontains=token)
+        return list(queryset.order_by('name')[:limit])
+    return list(Food.objects.raw(FOOD_FTS_SQL, [fts_query, limit]))
+
+
+def filter_foods(queryset, query):
+    """
+    Zawęża queryset produktów do pasujących do zapytania, bez zmiany jego sortowania.
+    """
+    fts_query = match_query(query)
+    if not fts_query:
+        return queryset.none()
+    if connection.vendor != 'sqlite':
+        for token in re.findall(r'\w+', query):
+            queryset = queryset.filter(name__icontains=token)
+        return queryset
+    return queryset.filter(id__in=RawSQL(FOOD_MATCH_SQL, [fts_query]))
+
+
+def search_meals(queryset, query):
+    """
+    Zawęża queryset posiłków do pasujących do zapytania i sortuje je według trafności oraz popularności.
+    """
+    fts_query = match_query(query)
+    if not fts_query:
+        return queryset.none()
+    if connection.vendor != 'sqlite':
+        for token in re.findall(r'\w+', query):
+            queryset = queryset.filter(name__icontains=token)
+        return queryset.order_by('-popularity', 'id')
+    # Jedno złączenie z indeksem (MealSearchIndex) - MATCH wykonywany jest raz, a nie osobno dla każdego posiłku
+    return queryset.filter(search_index__name__match=fts_query).annotate(
+        search_rank=ExpressionWrapper(F('search_index__rank') * (1 + MEAL_POPULARITY_WEIGHT * F('popularity')),
+                                      output_field=FloatField()),
+    ).order_by('search_rank', 'id')
@@ -0,0 +1,34 @@
+// Podpowiedzi produktów dla pola FoodAutocompleteWidget - lista pobierana z /food/search/ w trakcie pisania
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-autocomplete-url]').forEach(function (input) {
+        var target = document.getElementById(input.dataset.target);
+        var options = document.getElementById(input.getAttribute('list'));
+        var timer = null;
+
+        input.addEventListener('input', function () {
+            target.value = '';
+            options.querySelectorAll('option').forEach(function (option) {
+                if (option.value === input.value) {
+                    target.value = option.dataset.id;
+                }
+            });
+            if (target.value || input.value.length < 2) {
+                return;
+            }
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value))
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        options.innerHTML = '';
+                        data.results.forEach(function (food) {
+                            var option = document.createElement('option');
+                            option.value = food.name;
+                            option.dataset.id = food.id;
+                            options.appendChild(option);
+                        });
+                    });
+            }, 200);
+        });
+    });
+});
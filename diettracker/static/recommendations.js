@@ -0,0 +1,21 @@
+// Lista produktów i posiłków pasujących do pozostałego limitu - pobierana z /consumption/recommendations/ po wczytaniu strony
+document.addEventListener('DOMContentLoaded', function () {
+    var list = document.getElementById('recommendations');
+    if (!list) {
+        return;
+    }
+    fetch(list.dataset.url)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+            data.meals.forEach(function (meal) {
+                var item = document.createElement('li');
+                item.textContent = meal.name + ' - ' + Math.round(meal.calories) + ' kcal';
+                list.appendChild(item);
+            });
+            data.foods.forEach(function (food) {
+                var item = document.createElement('li');
+                item.textContent = food.name + ' (' + food.amount + 'g) - ' + Math.round(food.calories) + ' kcal';
+                list.appendChild(item);
+            });
+        });
+});
@@ -0,0 +1,120 @@
+"""
+Utrzymywanie tabeli DailySummary - dziennych sum spożycia użytkownika.
+
+Funkcje record_consumption i discard_consumption należy wywoływać w tej samej transakcji, w której tworzony
+lub usuwany jest wpis Consumption.
+"""
+import collections
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from diettracker.models import Consumption, DailySummary
+
+MACROS = ('calories', 'fat', 'carbohydrates', 'protein')
+
+
+def _apply(user_id, day, totals, entries, sign):
+    changes = {field: F(field) + sign * totals[field] for field in MACROS}
+    updated = DailySummary.objects.filter(user_id=user_id, date=day).update(
+        entries=F('entries') + sign * entries, updated_at=timezone.now(), **changes
+    )
+    if not updated:
+        # Brak wiersza podsumowania (np. dane sprzed wprowadzenia tabeli) - liczymy dzień od nowa
+        rebuild_days([(user_id, day)])
+
+
+def _stored_totals(consumption):
+    # Consumption przechowuje wartości całkowite, a instancja po create może mieć jeszcze wartości float
+    return {field: int(getattr(consumption, field)) for field in MACROS}
+
+
+def record_consumption(consumption):
+    _apply(consumption.user_id, consumption.date, _stored_totals(consumption), 1, 1)
+
+
+def discard_consumption(consumption):
+    _apply(consumption.user_id, consumption.date, _stored_totals(consumption), 1, -1)
+
+
+def record_consumptions(consumptions):
+    """
+    Dolicza wiele nowych wpisów naraz - jedna aktualizacja na każdą parę (użytkownik, dzień).
+    """
+    days = collections.defaultdict(collections.Counter)
+    for consumption in consumptions:
+        totals = days[(consumption.user_id, consumption.date)]
+        totals.update(_stored_totals(consumption))
+        totals['entries'] += 1
+    for (user_id, day), totals in days.items():
+        _apply(user_id, day, totals, totals['entries'], 1)
+
+
+def _summaries(queryset):
+    rows = queryset.values('user_id', 'date').annotate(
+        total_calories=Sum('calories'), total_fat=Sum('fat'), total_carbohydrates=Sum('carbohydrates'),
+        total_protein=Sum('protein'), total_entries=Count('id'),
+    ).order_by()
+    return [
+        DailySummary(user_id=row['user_id'], date=row['date'], calories=row['total_calories'], fat=row['total_fat'],
+                     carbohydrates=row['total_carbohydrates'], protein=row['total_protein'], entries=row['total_entries'])
+        for row in rows
+    ]
+
+
+def rebuild_days(days, batch_size=500):
+    """
+    Przelicza podsumowania podanych par (user_id, date) na podstawie wpisów Consumption - jedno zapytanie GROUP BY
+    na każdą paczkę dni użytkownika.
+    """
+    dates_by_user = collections.defaultdict(set)
+    for user_id, day in days:
+        dates_by_user[user_id].add(day)
+    with transaction.atomic():
+        for user_id, dates in dates_by_user.items():
+            dates = sorted(dates)
+            for start in range(0, len(dates), batch_size):
+                batch = dates[start:start + batch_size]
+                summaries = _summaries(Consumption.objects.filter(user_id=user_id, date__in=batch))
+                if summaries:
+                    DailySummary.objects.bulk_create(
+                        summaries, update_conflicts=True, unique_fields=['user', 'date'],
+                        update_fields=list(MACROS) + ['entries', 'updated_at'],
+                    )
+                present = {summary.date for summary in summaries}
+                empty = [day for day in batch if day not in present]
+                if empty:
+                    DailySummary.objects.filter(user_id=user_id, date__in=empty).delete()
+
+
+def rebuild_summaries(user_ids=None, batch_size=1000):
+    """
+    Odbudowuje całą tabelę podsumowań (lub podsumowania wybranych użytkowników) jednym zapytaniem GROUP BY.
+    """
+    consumption = Consumption.objects.all()
+    summaries = DailySummary.objects.all()
+    if user_ids is not None:
+        consumption = consumption.filter(user_id__in=user_ids)
+        summaries = summaries.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        summaries.delete()
+        created = DailySummary.objects.bulk_create(_summaries(consumption), batch_size=batch_size)
+    return len(created)
+
+
+def daily_totals(user, day):
+    """
+    Zwraca słownik sum makroskładników użytkownika dla danego dnia (zera, jeśli nic nie spożyto).
+    """
+    summary = DailySummary.objects.filter(user=user, date=day).values(*MACROS).first()
+    return summary or dict.fromkeys(MACROS, 0)
+
+
+async def adaily_totals(user, day):
+    summary = await DailySummary.objects.filter(user=user, date=day).values(*MACROS).afirst()
+    return summary or dict.fromkeys(MACROS, 0)
+
+
+def summaries_between(user, start, end):
+    return DailySummary.objects.filter(user=user, date__range=(start, end)).order_by('date')
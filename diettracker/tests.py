@@ -11,10 +11,35 @@ from django.utils import timezone
 from django.test import RequestFactory, TestCase
 from diettracker.views import ConsumptionListView, MealEditView, MealDeleteView, MealListView, FoodView, HomeView
 from diettracker.forms import EditMealForm, MealForm
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import redirect
 
 
+@pytest.fixture(scope='session', autouse=True)
+def test_cache(tmp_path_factory):
+    # Testy mają własny katalog cache - nie czyszczą współdzielonej pamięci podręcznej serwera (CACHE_DIR/Redis)
+    from django.test import override_settings
+    location = tmp_path_factory.mktemp('django_cache')
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                               'LOCATION': location}}):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(test_cache):
+    from django.core.cache import cache
+    from diettracker.food_cache import food_cache
+    cache.clear()
+    food_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def food_index_path(settings, tmp_path):
+    settings.FOOD_INDEX_PATH = tmp_path / 'food_index.npz'
+    settings.NUTRIENT_STORE_PATH = tmp_path / 'nutrient_store.bin'
+    return settings.FOOD_INDEX_PATH
+
+
 @pytest.mark.django_db
 def test_home_view(client):
     response = client.get(reverse('index'))
@@ -58,12 +83,12 @@ def test_weight_chart_view_redirects_to_login_page_when_not_logged_in():
 
 
 @pytest.mark.django_db
-def test_weight_chart_view_displays_chart_when_logged_in():
+def test_weight_chart_view_displays_chart_when_logged_in(monkeypatch):
     user = User.objects.create_user(username='testuser', password='testpassword')
 
     weight_entry_mock = WeightEntry.objects.create(user=user, weight=70, date=date(2023, 1, 1))
 
-    WeightEntry.objects.filter = MagicMock(return_value=[weight_entry_mock])
+    monkeypatch.setattr(WeightEntry.objects, 'filter', MagicMock(return_value=[weight_entry_mock]))
 
     client = Client()
     client.force_login(user)
@@ -468,3 +493,1083 @@ def test_meal_list_view_post_authenticated_user_missing_data():
     assert response.status_code == 400
 
 
+
+
+OFF_HEADER = 'code\tproduct_name\tenergy-kcal_100g\tenergy_100g\tproteins_100g\tcarbohydrates_100g\tfat_100g\n'
+
+
+def write_off_export(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(OFF_HEADER)
+        for row in rows:
+            f.write('\t'.join(row) + '\n')
+
+
+@pytest.mark.django_db
+def test_import_off_creates_food_and_rejects_invalid_rows(tmp_path):
+    from django.core.management import call_command
+    from diettracker.models import ImportCheckpoint
+    path = tmp_path / 'off.csv'
+    write_off_export(path, [
+        ('001', 'Twaróg półtłusty', '133', '', '18', '3.7', '4'),
+        ('002', 'Sok jabłkowy', '', '188', '0.1', '11', '0'),
+        ('003', '', '100', '', '1', '1', '1'),
+        ('004', 'Błędny produkt', '120', '', 'abc', '1', '1'),
+        ('005', 'Za dużo makro', '120', '', '90', '90', '1'),
+    ])
+
+    call_command('import_off', str(path), workers=0, chunk_size=2, verbosity=0)
+
+    assert Food.objects.count() == 2
+    juice = Food.objects.get(code='002')
+    assert juice.calories == 44.9
+    checkpoint = ImportCheckpoint.objects.get()
+    assert checkpoint.completed
+    assert checkpoint.rows_imported == 2
+    assert checkpoint.rows_rejected == 3
+
+
+@pytest.mark.django_db
+def test_import_off_resumes_from_checkpoint_without_duplicates(tmp_path):
+    from django.core.management import call_command
+    from diettracker.models import ImportCheckpoint
+    path = tmp_path / 'off.csv'
+    write_off_export(path, [(str(i), 'Produkt %d' % i, '100', '', '5', '10', '2') for i in range(10)])
+
+    call_command('import_off', str(path), workers=0, chunk_size=4, verbosity=0)
+    checkpoint = ImportCheckpoint.objects.get()
+    # Symulacja przerwanego importu: punkt kontrolny po pierwszej paczce
+    first_chunk_end = len(OFF_HEADER.encode()) + sum(len(('\t'.join((str(i), 'Produkt %d' % i, '100', '', '5', '10', '2')) + '\n').encode()) for i in range(4))
+    ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(offset=first_chunk_end, rows_imported=4, completed=False)
+    Food.objects.filter(code__in=[str(i) for i in range(4, 10)]).delete()
+
+    call_command('import_off', str(path), workers=2, chunk_size=4, verbosity=0)
+
+    assert Food.objects.count() == 10
+    checkpoint.refresh_from_db()
+    assert checkpoint.rows_imported == 10
+    assert checkpoint.completed
+
+
+@pytest.mark.django_db
+def test_food_search_matches_prefix_without_polish_diacritics(client):
+    salmon = Food.objects.create(name='Łosoś wędzony', calories=162, protein=21.5, carbohydrates=0, fat=8.4)
+    Food.objects.create(name='Masło ekstra', calories=748, protein=0.7, carbohydrates=0.7, fat=82.5)
+
+    response = client.get(reverse('food_search'), {'q': 'losos wedz'})
+
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json()['results']] == [salmon.id]
+
+    salmon.name = 'Pstrąg'
+    salmon.save()
+    assert client.get(reverse('food_search'), {'q': 'losos'}).json()['results'] == []
+    assert client.get(reverse('food_search'), {'q': 'pstrag'}).json()['results'][0]['id'] == salmon.id
+
+
+@pytest.mark.django_db
+def test_consumption_form_does_not_render_food_catalogue(client):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    food = Food.objects.create(name='Jabłko', calories=52, protein=0.3, carbohydrates=14, fat=0.2)
+
+    response = client.get(reverse('consumption'))
+    assert response.status_code == 200
+    assert 'Jabłko' not in response.content.decode()
+
+    response = client.post(reverse('consumption'), {'food': food.id, 'amount': 200})
+    assert response.status_code == 302
+    assert Consumption.objects.get(user=user).calories == 104
+
+
+@pytest.mark.django_db
+def test_food_view_keyset_pagination_walks_all_rows_in_order(client, monkeypatch):
+    monkeypatch.setattr(FoodView, 'page_size', 3)
+    for i in range(7):
+        Food.objects.create(name='Produkt %d' % i, calories=100, protein=i % 3, carbohydrates=10, fat=1)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {'sort': '-protein', 'format': 'json'}
+        if cursor:
+            params['cursor'] = cursor
+        data = client.get(reverse('food'), params).json()
+        seen.extend((item['protein'], item['id']) for item in data['results'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    expected = list(Food.objects.order_by('-protein', '-id').values_list('protein', 'id'))
+    assert seen == expected
+
+    previous = client.get(reverse('food'), {'sort': '-protein', 'format': 'json', 'cursor': data['previous_cursor']}).json()
+    assert [(item['protein'], item['id']) for item in previous['results']] == expected[3:6]
+
+
+@pytest.mark.django_db
+def test_food_view_rejects_unknown_sort_and_cursor(client):
+    assert client.get(reverse('food'), {'sort': 'password'}).status_code == 400
+    assert client.get(reverse('food'), {'cursor': 'nie-kursor'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_daily_summary_follows_consumption_create_and_delete(client):
+    from diettracker.models import DailySummary
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    food = Food.objects.create(name='Ryż', calories=130, protein=2.7, carbohydrates=28, fat=0.3)
+    meal = Meal.objects.create(user=user, name='Owsianka', calories=350, protein=12, carbohydrates=60, fat=7)
+
+    client.post(reverse('consumption'), {'food': food.id, 'amount': 150})
+    client.post(reverse('consumption'), {'meal': meal.id})
+
+    summary = DailySummary.objects.get(user=user, date=date.today())
+    assert (summary.calories, summary.protein, summary.entries) == (195 + 350, 4 + 12, 2)
+    response = client.get(reverse('consumption'))
+    assert response.context['total_calories'] == 545
+
+    consumption = Consumption.objects.get(user=user, name='Owsianka')
+    client.post(reverse('consumption_list'), {'delete_consumption': consumption.id})
+
+    summary.refresh_from_db()
+    assert (summary.calories, summary.protein, summary.entries) == (195, 4, 1)
+
+
+@pytest.mark.django_db
+def test_rebuild_daily_summaries_command():
+    from django.core.management import call_command
+    from diettracker.models import DailySummary
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Consumption.objects.create(user=user, date=date(2024, 1, 1), calories=500, fat=10, carbohydrates=50, protein=30)
+    Consumption.objects.create(user=user, date=date(2024, 1, 1), calories=200, fat=5, carbohydrates=20, protein=10)
+    Consumption.objects.create(user=user, date=date(2024, 1, 2), calories=100, fat=1, carbohydrates=10, protein=5)
+
+    call_command('rebuild_daily_summaries')
+
+    totals = list(DailySummary.objects.filter(user=user).order_by('date').values_list('date', 'calories', 'entries'))
+    assert totals == [(date(2024, 1, 1), 700, 2), (date(2024, 1, 2), 100, 1)]
+
+
+@pytest.mark.django_db
+def test_weight_chart_view_renders_png_with_etag(client):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    for day, weight in [(1, 70.0), (2, 69.5), (3, 69.8)]:
+        entry = WeightEntry.objects.create(user=user, weight=weight)
+        WeightEntry.objects.filter(pk=entry.pk).update(date=date(2024, 1, day))
+
+    response = client.get(reverse('weight_chart'))
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'image/png'
+    assert response.content.startswith(b'\x89PNG')
+
+    cached = client.get(reverse('weight_chart'), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert cached.status_code == 304
+
+    entry = WeightEntry.objects.filter(user=user).first()
+    entry.weight = 71.0
+    entry.save()
+    changed = client.get(reverse('weight_chart'), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert changed.status_code == 200
+    assert changed['ETag'] != response['ETag']
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    import numpy as np
+    from diettracker.timeseries import lttb
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    y[500] = 10
+
+    selected = lttb(x, y, 50)
+
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 500 in selected
+    assert list(selected) == sorted(selected)
+
+
+@pytest.mark.django_db
+def test_weight_data_view_downsamples_range(client):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    start = date(2020, 1, 1)
+    for day in range(400):
+        entry = WeightEntry.objects.create(user=user, weight=80 - day * 0.01)
+        WeightEntry.objects.filter(pk=entry.pk).update(date=start + datetime.timedelta(days=day))
+
+    response = client.get(reverse('weight_data'), {'start': '2020-01-01', 'end': '2020-12-31', 'points': 20})
+
+    data = response.json()
+    assert data['total'] == 366
+    assert len(data['points']) == 20
+    assert data['points'][0]['date'] == '2020-01-01'
+    assert data['points'][-1]['date'] == '2020-12-31'
+    assert len(data['buckets']) == 20
+    assert data['buckets'][0]['max'] == 80
+    assert client.get(reverse('weight_data'), {'start': '01.01.2020'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_meal_consumption_form_uses_cached_meal_library(client, django_assert_num_queries, django_capture_on_commit_callbacks):
+    from diettracker.forms import MealConsumptionForm
+    from diettracker.models import UserMeal
+    owner = User.objects.create_user(username='owner', password='testpassword')
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    own_meal = Meal.objects.create(user=user, name='Jajecznica', calories=300)
+    shared_meal = Meal.objects.create(user=owner, name='Leczo', calories=400)
+    Meal.objects.create(user=owner, name='Cudzy posiłek', calories=100)
+    UserMeal.objects.create(user=user, meal=shared_meal)
+
+    MealConsumptionForm(user=user)
+    with django_assert_num_queries(0):
+        form = MealConsumptionForm({'meal': shared_meal.id}, user=user)
+        assert form.is_valid()
+    assert form.cleaned_data['meal'].calories == 400
+    assert {meal_id for meal_id, name in form.fields['meal'].choices if meal_id} == {own_meal.id, shared_meal.id}
+
+    client.force_login(owner)
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('meal_edit', kwargs={'pk': shared_meal.pk}), {'name': 'Leczo', 'calories': 450})
+
+    form = MealConsumptionForm({'meal': shared_meal.id}, user=user)
+    assert form.is_valid()
+    assert form.cleaned_data['meal'].calories == 450
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('meal_delete', kwargs={'pk': shared_meal.pk}))
+    assert not MealConsumptionForm({'meal': shared_meal.id}, user=user).is_valid()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_meal_library_is_invalidated_after_meal_is_written(client, monkeypatch):
+    from django.core.cache import cache
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    meal = Meal.objects.create(user=user, name='Leczo', calories=400)
+    client.force_login(user)
+    # Stan posiłku w bazie w chwili unieważnienia - równoległy odczyt po unieważnieniu musi już widzieć zapis
+    seen = []
+    delete_many = cache.delete_many
+
+    def recording_delete_many(keys):
+        seen.append(list(Meal.objects.filter(pk=meal.pk).values_list('calories', flat=True)))
+        return delete_many(keys)
+    monkeypatch.setattr(cache, 'delete_many', recording_delete_many)
+
+    client.post(reverse('meal_edit', kwargs={'pk': meal.pk}), {'name': 'Leczo', 'calories': 450})
+    client.post(reverse('meal_delete', kwargs={'pk': meal.pk}))
+    assert seen == [[450.0], []]
+
+
+@pytest.mark.django_db
+def test_all_meals_search_ranks_by_relevance_and_popularity(client):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Meal.objects.create(user=user, name='Sałatka grecka', calories=250)
+    popular = Meal.objects.create(user=user, name='Sałatka jarzynowa', calories=300, popularity=20)
+    Meal.objects.create(user=user, name='Zupa pomidorowa', calories=150)
+
+    response = client.get(reverse('all_meals'), {'search': 'salat'})
+
+    meals = list(response.context['meals'])
+    assert len(meals) == 2
+    assert meals[0] == popular
+
+
+@pytest.mark.django_db
+def test_meal_search_joins_full_text_index_once(client, django_assert_num_queries):
+    from diettracker.search import search_meals
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    for i in range(30):
+        Meal.objects.create(user=user, name='Zupa %d' % i, calories=100, popularity=i % 3)
+
+    queryset = search_meals(Meal.objects.all(), 'zupa')
+    sql = str(queryset.query)
+    assert sql.count('MATCH') == 1 and 'JOIN "diettracker_meal_fts"' in sql
+    # Indeks przeszukiwany jest raz, a posiłki odczytywane po kluczu - bez podzapytania dla każdego wiersza
+    plan = queryset.explain()
+    assert 'VIRTUAL TABLE INDEX' in plan and 'CORRELATED' not in plan
+    assert [meal.popularity for meal in queryset[:10]] == [2] * 10
+
+    client.get(reverse('all_meals'), {'search': 'zupa'})
+    with django_assert_num_queries(1):
+        response = client.get(reverse('all_meals'), {'search': 'zupa', 'page': 3})
+    assert [meal.name for meal in response.context['meals']] == [meal.name for meal in queryset[20:30]]
+
+
+@pytest.mark.django_db
+def test_all_meals_count_is_cached_until_catalogue_changes(client, django_assert_num_queries, django_capture_on_commit_callbacks):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    for i in range(12):
+        Meal.objects.create(user=user, name='Posiłek %d' % i, calories=100)
+
+    client.get(reverse('all_meals'))
+    with django_assert_num_queries(1):
+        response = client.get(reverse('all_meals'), {'page': 2})
+    assert response.context['paginator'].count == 12
+
+    client.force_login(user)
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('meal_list'), {'name': 'Nowy', 'calories': 100})
+    client.logout()
+    assert client.get(reverse('all_meals')).context['paginator'].count == 13
+
+
+@pytest.mark.django_db
+def test_bulk_consumption_creates_valid_entries_and_reports_errors(client, django_assert_max_num_queries):
+    import json
+    from diettracker.models import DailySummary
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    food = Food.objects.create(name='Banan', calories=89, protein=1.1, carbohydrates=23, fat=0.3)
+    meal = Meal.objects.create(user=user, name='Kanapka', calories=250, protein=10, carbohydrates=30, fat=8)
+    entries = [
+        {'food': food.id, 'amount': 200, 'date': '2024-03-01'},
+        {'meal': meal.id, 'date': '2024-03-01'},
+        {'name': 'Kawa z mlekiem', 'calories': 40, 'fat': 2, 'date': '2024-03-02'},
+        {'food': 999999, 'amount': 100},
+        {'meal': meal.id, 'calories': 100, 'name': 'Oba'},
+        'nie-obiekt',
+    ]
+
+    with django_assert_max_num_queries(20):
+        response = client.post(reverse('consumption_bulk'), json.dumps({'entries': entries}), content_type='application/json')
+
+    assert response.status_code == 201
+    data = response.json()
+    assert [item['index'] for item in data['created']] == [0, 1, 2]
+    assert [error['index'] for error in data['errors']] == [3, 4, 5]
+    assert 'food' in data['errors'][0]['errors']
+    assert Consumption.objects.filter(user=user).count() == 3
+    assert DailySummary.objects.get(user=user, date=date(2024, 3, 1)).calories == 178 + 250
+    assert DailySummary.objects.get(user=user, date=date(2024, 3, 2)).entries == 1
+
+
+@pytest.mark.django_db
+def test_bulk_consumption_rejects_anonymous_and_malformed_requests(client):
+    assert client.post(reverse('consumption_bulk'), '[]', content_type='application/json').status_code == 403
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    assert client.post(reverse('consumption_bulk'), '{', content_type='application/json').status_code == 400
+    assert client.post(reverse('consumption_bulk'), '[]', content_type='application/json').status_code == 400
+
+
+@pytest.mark.django_db
+def test_asgi_requests_are_served_by_async_views():
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+    from diettracker.async_views import AsyncFoodView, AsyncConsumptionView, AsyncAllMealsView, AsyncWeightDataView
+    from diettracker.summaries import record_consumption
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Food.objects.create(name='Gruszka', calories=57, protein=0.4, carbohydrates=15, fat=0.1)
+    Meal.objects.create(user=user, name='Naleśniki', calories=450)
+    record_consumption(Consumption.objects.create(user=user, date=date.today(), calories=700, fat=30, carbohydrates=60, protein=20))
+    client = AsyncClient()
+
+    anonymous = async_to_sync(client.get)(reverse('consumption'))
+    assert anonymous.status_code == 302
+
+    food = async_to_sync(client.get)(reverse('food'), {'format': 'json'})
+    assert food.resolver_match.func.view_class is AsyncFoodView
+    assert [item['name'] for item in food.json()['results']] == ['Gruszka']
+
+    meals = async_to_sync(client.get)(reverse('all_meals'))
+    assert meals.resolver_match.func.view_class is AsyncAllMealsView
+    assert [meal.name for meal in meals.context['meals']] == ['Naleśniki']
+
+    client.force_login(user)
+    consumption = async_to_sync(client.get)(reverse('consumption'))
+    assert consumption.resolver_match.func.view_class is AsyncConsumptionView
+    assert consumption.context['total_calories'] == 700
+
+    weight = async_to_sync(client.get)(reverse('weight_data'))
+    assert weight.resolver_match.func.view_class is AsyncWeightDataView
+    assert weight.json()['total'] == 0
+
+
+@pytest.mark.django_db
+def test_asgi_food_view_uses_page_and_food_caches():
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+    from diettracker.food_cache import food_cache
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    for name in ('Gruszka', 'Jabłko'):
+        Food.objects.create(name=name, calories=57, protein=0.4, carbohydrates=15, fat=0.1)
+    client = AsyncClient()
+    client.force_login(user)
+
+    first = async_to_sync(client.get)(reverse('food'), {'format': 'json'}).json()
+    hits = food_cache.stats()['hits']
+    # Zalogowany użytkownik nie dostaje zapamiętanej całej strony - produkty pochodzą ze strony identyfikatorów w cache
+    assert async_to_sync(client.get)(reverse('food'), {'format': 'json'}).json() == first
+    assert food_cache.stats()['hits'] == hits + 2
+    assert async_to_sync(client.get)(reverse('food'), {'cursor': 'zły'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_benchmark_paths_stay_within_query_budgets():
+    import random
+    from diettracker.benchmarks import QUERY_BUDGETS, run_paths, seed_foods, seed_meals, seed_user
+    rng = random.Random(0)
+    seed_foods(50, rng)
+    seed_meals(30, User.objects.create_user(username='owner', password='testpassword'), rng)
+    user = seed_user('bench', 30, rng)
+
+    results = run_paths(user, Food.objects.first(), 1, {'food_rows': 50, 'history': '30_days'})
+
+    assert {result['name'] for result in results} == set(QUERY_BUDGETS)
+    assert [result['name'] for result in results if not result['ok']] == []
+
+
+@pytest.mark.django_db
+def test_request_metrics_middleware_reports_timings_and_repeated_queries(settings):
+    from diettracker.instrumentation import RequestStats, reset_metrics
+    reset_metrics()
+    settings.METRICS_TOKEN = 'sekret'
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client = Client()
+    client.force_login(user)
+
+    response = client.get(reverse('consumption'))
+    assert response.status_code == 200
+    timing = response['Server-Timing']
+    assert timing.startswith('sql;dur=') and 'view;dur=' in timing and 'tpl;dur=' in timing and 'total;dur=' in timing
+    assert '"0 queries"' not in timing
+
+    # Metryki nie są publiczne - tylko z tokenem albo dla administratora
+    assert client.get(reverse('metrics')).status_code == 403
+    assert client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer zły').status_code == 403
+    metrics = client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer sekret').content.decode()
+    assert 'diettracker_request_duration_seconds_count{view="consumption"} 1' in metrics
+    assert 'diettracker_view_duration_seconds_count{view="consumption"} 1' in metrics
+    assert 'diettracker_template_duration_seconds_bucket{view="consumption",le="+Inf"} 1' in metrics
+    user.is_staff = True
+    user.save()
+    assert client.get(reverse('metrics')).status_code == 200
+
+    # Czas widoku nie obejmuje zapytań SQL ani szablonów wykonanych w jego trakcie
+    stats = RequestStats()
+    with stats.measure_view():
+        stats.sql_time += 10
+        stats.template_time += 10
+    assert stats.view_time < 1
+
+    stats = RequestStats()
+    stats.statements.update(['SELECT 1'] * 5 + ['SELECT 2'])
+    assert stats.repeated_queries() == [('SELECT 1', 5)]
+
+
+@pytest.mark.django_db
+def test_nutrition_report_groups_consumption_by_day_and_period(django_assert_num_queries):
+    from diettracker.reports import nutrition_report
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Diet.objects.create(user=user, min_calories=1500, max_calories=2500, max_fat=80)
+    for day, calories, fat in [(date(2024, 3, 4), 1000, 50), (date(2024, 3, 4), 1200, 20), (date(2024, 3, 6), 1400, 90),
+                               (date(2024, 3, 11), 2000, 60), (date(2024, 2, 1), 9999, 99)]:
+        Consumption.objects.create(user=user, date=day, calories=calories, fat=fat, carbohydrates=100, protein=50)
+
+    with django_assert_num_queries(2):
+        report = nutrition_report(user, date(2024, 3, 1), date(2024, 3, 31), 'week')
+
+    assert [(day['date'], day['calories'], day['entries']) for day in report['days']] == [
+        (date(2024, 3, 4), 2200, 2), (date(2024, 3, 6), 1400, 1), (date(2024, 3, 11), 2000, 1)]
+    assert report['days'][1]['limits']['calories'] == 'below'
+    assert [(week['start'], week['totals']['calories'], week['averages']['calories']) for week in report['periods']] == [
+        (date(2024, 3, 4), 3600, 1800.0), (date(2024, 3, 11), 2000, 2000.0)]
+    assert report['periods'][0]['limits']['fat'] == 'ok'
+    assert report['days_within_limits'] == 2
+
+
+@pytest.mark.django_db
+def test_nutrition_report_view_ranges():
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Consumption.objects.create(user=user, date=date(2024, 3, 6), calories=700, fat=10, carbohydrates=80, protein=30)
+    client = Client()
+    client.force_login(user)
+
+    week = client.get(reverse('report_week'), {'date': '2024-03-08'}).json()
+    assert (week['start'], week['end'], week['totals']['calories']) == ('2024-03-04', '2024-03-10', 700)
+    month = client.get(reverse('report_month'), {'date': '2024-02-15'}).json()
+    assert (month['start'], month['end'], month['days_logged']) == ('2024-02-01', '2024-02-29', 0)
+    assert client.get(reverse('report'), {'start': '2024-03-10', 'end': '2024-03-01'}).status_code == 400
+    assert client.get(reverse('report'), {'start': '2024-01-01', 'end': '2024-12-31', 'period': 'year'}).status_code == 400
+
+
+def test_exponential_trend_matches_recursive_smoothing_with_gaps():
+    import numpy as np
+    from diettracker.analytics import exponential_trend, moving_average
+    days = np.array([0, 1, 2, 5, 6, 20])
+    weights = np.array([80.0, 81.0, 79.0, 80.5, 80.0, 78.0])
+
+    expected = [weights[0]]
+    for gap, weight in zip(np.diff(days), weights[1:]):
+        decay = 0.9 ** gap
+        expected.append(decay * expected[-1] + (1 - decay) * weight)
+    assert np.allclose(exponential_trend(days, weights), expected)
+    assert np.allclose(moving_average(days, weights, 7), [80.0, 80.5, 80.0, 80.125, 80.1, 78.0])
+
+
+@pytest.mark.django_db
+def test_weight_trend_view_reports_rate_and_energy_balance(client):
+    from diettracker.summaries import record_consumption
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    start = date(2024, 1, 1)
+    for day in range(28):
+        entry = WeightEntry.objects.create(user=user, weight=80 - day * 0.1)
+        WeightEntry.objects.filter(pk=entry.pk).update(date=start + datetime.timedelta(days=day))
+        record_consumption(Consumption.objects.create(user=user, date=start + datetime.timedelta(days=day), calories=2000,
+                                                      fat=60, carbohydrates=250, protein=100))
+
+    data = client.get(reverse('weight_trend'), {'points': 10}).json()
+
+    assert data['total'] == 28 and len(data['points']) == 10
+    assert data['points'][-1]['average_7'] == 77.6
+    assert -0.7 < data['weekly_rate'] < -0.5
+    balance = data['energy_balance']
+    assert balance['average_intake'] == 2000 and balance['daily_balance'] < 0
+    assert balance['estimated_expenditure'] == 2000 - balance['daily_balance']
+
+
+@pytest.mark.django_db
+def test_score_compliance_command_rescores_only_changed_days():
+    from django.core.management import call_command
+    from diettracker.models import DailyCompliance
+    from diettracker.summaries import record_consumption
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Diet.objects.create(user=user, min_calories=1500, max_calories=2000, max_fat=80)
+    for day, calories in [(date(2024, 1, 1), 1800), (date(2024, 1, 2), 2500)]:
+        record_consumption(Consumption.objects.create(user=user, date=day, calories=calories, fat=40, carbohydrates=200, protein=90))
+
+    call_command('score_compliance', workers=1)
+    scores = dict(DailyCompliance.objects.values_list('date', 'score'))
+    assert scores == {date(2024, 1, 1): 100.0, date(2024, 1, 2): 87.5}
+    first_run = dict(DailyCompliance.objects.values_list('date', 'computed_at'))
+
+    record_consumption(Consumption.objects.create(user=user, date=date(2024, 1, 1), calories=500, fat=60, carbohydrates=50, protein=20))
+    call_command('score_compliance', workers=1)
+
+    rescored = DailyCompliance.objects.get(date=date(2024, 1, 1))
+    assert (rescored.score, rescored.limits_met, rescored.limits_checked) == (80.0, 0, 2)
+    assert rescored.computed_at > first_run[date(2024, 1, 1)]
+    assert DailyCompliance.objects.get(date=date(2024, 1, 2)).computed_at == first_run[date(2024, 1, 2)]
+
+
+@pytest.mark.django_db
+def test_recommend_foods_fills_remaining_budget_from_index():
+    import numpy as np
+    from diettracker.recommendations import FoodIndex, recommend_foods, recommend_meals, target_shares
+    Food.objects.create(name='Oliwa', calories=884, protein=0, carbohydrates=0, fat=100)
+    chicken = Food.objects.create(name='Pierś z kurczaka', calories=110, protein=23, carbohydrates=0, fat=2)
+    rice = Food.objects.create(name='Ryż', calories=130, protein=3, carbohydrates=28, fat=0.3)
+    Food.objects.create(name='Woda', calories=0, protein=0, carbohydrates=0, fat=0)
+    index = FoodIndex.build()
+    assert len(index) == 3
+
+    remaining = {'calories': 220, 'fat': None, 'carbohydrates': None, 'protein': 46}
+    assert np.allclose(target_shares(remaining)[1], [0.06, 0.10, 0.84], atol=0.01)
+    best = recommend_foods(remaining, limit=2, index=index)
+    assert [food['id'] for food in best] == [chicken.id, rice.id]
+    assert (best[0]['amount'], best[0]['protein']) == (200, 46.0)
+
+    carbs = recommend_foods({'calories': 390, 'fat': 5, 'carbohydrates': 90, 'protein': 10}, limit=1, index=index)
+    assert (carbs[0]['id'], carbs[0]['amount']) == (rice.id, 300)
+
+    meals = [Meal(id=1, name='Makaron', calories=700, protein=20), Meal(id=2, name='Sałatka', calories=250, protein=40)]
+    assert [meal['name'] for meal in recommend_meals(meals, remaining)] == ['Sałatka', 'Makaron']
+
+
+@pytest.mark.django_db
+def test_recommendation_view_uses_index_file_and_reloads_it(client, food_index_path):
+    import io
+    import os
+    from django.core.management import call_command
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    Diet.objects.create(user=user, max_calories=2000, max_protein=100)
+    Food.objects.create(name='Twaróg', calories=100, protein=18, carbohydrates=3, fat=1.5)
+    client.force_login(user)
+
+    # Bez pliku indeksu żądanie nie przegląda katalogu - podpowiedzi produktów są puste
+    data = client.get(reverse('recommendations')).json()
+    assert data['remaining']['calories'] == 2000
+    assert data['foods'] == []
+    assert not os.path.exists(food_index_path)
+
+    call_command('rebuild_food_index', stdout=io.StringIO())
+    assert [food['name'] for food in client.get(reverse('recommendations')).json()['foods']] == ['Twaróg']
+
+    from diettracker.recommendations import rebuild_food_index
+    Food.objects.create(name='Skyr', calories=65, protein=11, carbohydrates=4, fat=0.2)
+    rebuild_food_index()
+    assert {food['name'] for food in client.get(reverse('recommendations')).json()['foods']} == {'Twaróg', 'Skyr'}
+
+
+@pytest.mark.django_db
+def test_meal_ingredients_view_keeps_denormalized_totals(client, django_capture_on_commit_callbacks):
+    from diettracker.models import MealIngredient
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    meal = Meal.objects.create(user=user, name='Owsianka', calories=999)
+    oats = Food.objects.create(name='Płatki owsiane', calories=370, protein=13, carbohydrates=60, fat=7)
+    milk = Food.objects.create(name='Mleko', calories=50, protein=3.4, carbohydrates=4.8, fat=2)
+    url = reverse('meal_ingredients', kwargs={'pk': meal.pk})
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(url, {'food': oats.pk, 'amount': 50})
+        client.post(url, {'food': milk.pk, 'amount': 200})
+        client.post(url, {'food': milk.pk, 'amount': 250})
+    meal.refresh_from_db()
+    assert (meal.calories, round(meal.protein, 2), round(meal.fat, 2)) == (310.0, 15.0, 8.5)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(url, {'remove': MealIngredient.objects.get(food=oats).pk})
+    meal.refresh_from_db()
+    assert (meal.calories, meal.carbohydrates) == (125.0, 12.0)
+    assert client.post(url, {'remove': 'abc'}).status_code == 400
+
+    # Sumy przepisu nie są edytowane ręcznie - formularz edycji zmienia tylko nazwę
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('meal_edit', kwargs={'pk': meal.pk}), {'name': 'Owsianka z mlekiem', 'calories': 1})
+    meal.refresh_from_db()
+    assert (meal.name, meal.calories) == ('Owsianka z mlekiem', 125.0)
+
+    other = User.objects.create_user(username='other', password='testpassword')
+    client.force_login(other)
+    assert client.post(url, {'food': oats.pk, 'amount': 50}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_import_off_recomputes_recipes_using_changed_foods(tmp_path):
+    from django.core.management import call_command
+    from diettracker.recipes import set_ingredient
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    cheese = Food.objects.create(code='001', name='Twaróg', calories=100, protein=18, carbohydrates=3, fat=1)
+    bread = Food.objects.create(code='002', name='Chleb', calories=250, protein=8, carbohydrates=50, fat=2)
+    sandwich = Meal.objects.create(user=user, name='Kanapka', calories=0)
+    set_ingredient(sandwich, cheese, 100)
+    set_ingredient(sandwich, bread, 60)
+    untouched = Meal.objects.create(user=user, name='Chleb', calories=0)
+    set_ingredient(untouched, bread, 100)
+
+    path = tmp_path / 'off.csv'
+    write_off_export(path, [('001', 'Twaróg chudy', '90', '', '20', '3', '0.5'), ('002', 'Chleb', '250', '', '8', '50', '2')])
+    call_command('import_off', str(path), workers=0, verbosity=0)
+
+    sandwich.refresh_from_db()
+    assert (sandwich.calories, sandwich.protein) == (240.0, 24.8)
+    untouched.refresh_from_db()
+    assert untouched.calories == 250.0
+
+
+@pytest.mark.django_db
+def test_food_cache_evicts_least_recently_used_and_follows_catalogue_version(django_assert_num_queries, monkeypatch,
+                                                                              django_capture_on_commit_callbacks):
+    from diettracker import food_cache as module
+    from diettracker.food_cache import FoodCache, bump_food_catalogue_version, food_catalogue_version
+    monkeypatch.setattr(module, 'VERSION_CHECK_INTERVAL', 0)
+    foods = [Food.objects.create(name='Produkt %d' % i, calories=100, protein=1, carbohydrates=1, fat=1) for i in range(3)]
+    food_cache = FoodCache(maxsize=2)
+    version = food_catalogue_version()
+
+    with django_assert_num_queries(1):
+        assert set(food_cache.get_many([foods[0].pk, foods[1].pk])) == {foods[0].pk, foods[1].pk}
+        assert food_cache.get(foods[0].pk).name == 'Produkt 0'
+    food_cache.get(foods[2].pk)
+    assert food_cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2, 'version': version}
+    with django_assert_num_queries(1):
+        food_cache.get(foods[1].pk)
+
+    Food.objects.filter(pk=foods[0].pk).update(name='Nowa nazwa')
+    with django_capture_on_commit_callbacks(execute=True):
+        bump_food_catalogue_version()
+    assert food_cache.get(foods[0].pk).name == 'Nowa nazwa'
+    assert food_cache.stats()['version'] == version + 1
+
+
+@pytest.mark.django_db
+def test_food_cache_follows_version_bumped_by_another_process(monkeypatch):
+    from django.core.cache import caches
+    from diettracker import food_cache as module
+    from diettracker.food_cache import CATALOGUE_VERSION_KEY, food_catalogue_version, get_food
+    monkeypatch.setattr(module, 'VERSION_CHECK_INTERVAL', 0)
+    food = Food.objects.create(name='Produkt', calories=100, protein=1, carbohydrates=1, fat=1)
+    assert get_food(food.pk).name == 'Produkt'
+
+    # Osobna instancja backendu cache - tak jak w procesie import_off
+    other_process_cache = caches.create_connection('default')
+    Food.objects.filter(pk=food.pk).update(name='Nowa nazwa')
+    other_process_cache.incr(CATALOGUE_VERSION_KEY)
+    assert get_food(food.pk).name == 'Nowa nazwa'
+
+    # Utrata klucza wersji nie przywraca wersji sprzed zmiany
+    version = food_catalogue_version()
+    other_process_cache.delete(CATALOGUE_VERSION_KEY)
+    assert food_catalogue_version() > version
+
+
+@pytest.mark.django_db
+def test_food_view_and_consumption_form_read_foods_from_cache(client, django_assert_num_queries, settings):
+    from diettracker.forms import ConsumptionForm
+    for i in range(3):
+        Food.objects.create(name='Produkt %d' % i, calories=100, protein=1, carbohydrates=1, fat=1)
+    first = client.get(reverse('food'), {'format': 'json'}).json()
+
+    with django_assert_num_queries(0):
+        warm = client.get(reverse('food'), {'format': 'json'}).json()
+        form = ConsumptionForm({'food': first['results'][0]['id'], 'amount': 100})
+        assert form.is_valid()
+    assert warm == first
+    assert not ConsumptionForm({'food': 999999, 'amount': 100}).is_valid()
+    settings.METRICS_TOKEN = 'sekret'
+    assert 'diettracker_food_cache_hits_total' in client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer sekret').content.decode()
+
+
+@pytest.mark.django_db
+def test_export_view_streams_csv_and_gzipped_ndjson(client):
+    import gzip
+    import json
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    other = User.objects.create_user(username='other', password='testpassword')
+    client.force_login(user)
+    Consumption.objects.create(user=user, date=date(2024, 1, 2), name='Jabłko, duże', calories=80, fat=0, carbohydrates=20, protein=1)
+    Consumption.objects.create(user=user, date=date(2024, 1, 1), name='Owsianka', calories=350, fat=7, carbohydrates=60, protein=12)
+    Consumption.objects.create(user=other, date=date(2024, 1, 1), name='Cudze', calories=1, fat=0, carbohydrates=0, protein=0)
+
+    response = client.get(reverse('export', kwargs={'kind': 'consumption'}))
+    assert response.streaming
+    assert response['Content-Disposition'] == 'attachment; filename="consumption.csv"'
+    assert b''.join(response.streaming_content).decode().splitlines() == [
+        'date,name,calories,fat,carbohydrates,protein', '2024-01-01,Owsianka,350,7,60,12', '2024-01-02,"Jabłko, duże",80,0,20,1']
+
+    response = client.get(reverse('export', kwargs={'kind': 'weight'}), {'format': 'ndjson', 'gzip': '1'})
+    assert response['Content-Type'] == 'application/gzip'
+    assert gzip.decompress(b''.join(response.streaming_content)) == b''
+
+    entry = WeightEntry.objects.create(user=user, weight=72.5)
+    response = client.get(reverse('export', kwargs={'kind': 'weight'}), {'format': 'ndjson', 'gzip': '1'})
+    lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{'date': entry.date.isoformat(), 'weight': 72.5}]
+
+    assert client.get(reverse('export', kwargs={'kind': 'users'})).status_code == 400
+
+
+@pytest.mark.django_db
+def test_history_import_upserts_weight_rows_and_reports_rejected(client):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    WeightEntry.objects.create(user=user, date=date(2024, 1, 2), weight=90)
+
+    upload = SimpleUploadedFile('weight.csv', '﻿date,weight\n2024-01-01,80.5\n2024-01-02,81\n2024-01-03,abc\n2024-01-04,82\n'.encode())
+    response = client.post(reverse('history_import', kwargs={'kind': 'weight'}), {'file': upload})
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary['inserted'], summary['updated'], summary['rejected']) == (2, 1, 1)
+    assert summary['errors'][0]['line'] == 4 and 'weight' in summary['errors'][0]['errors']
+    assert dict(WeightEntry.objects.filter(user=user).values_list('date', 'weight')) == {
+        date(2024, 1, 1): 80.5, date(2024, 1, 2): 81, date(2024, 1, 4): 82}
+
+    response = client.post(reverse('history_import', kwargs={'kind': 'weight'}), 'x', content_type='text/plain')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_history_import_of_consumption_is_idempotent_and_rebuilds_summaries(client):
+    from diettracker.history_import import import_history
+    from diettracker.models import DailySummary
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    body = '\n'.join([
+        '{"date": "2024-01-01", "name": "Owsianka", "calories": 350, "fat": 7, "carbohydrates": 60, "protein": 12}',
+        '{"date": "2024-01-01", "name": "Owsianka", "calories": 300.4}',
+        '',
+        '[1, 2]',
+        '{"date": "2024-01-02", "name": "Jabłko", "calories": 80}',
+    ])
+    response = client.post(reverse('history_import', kwargs={'kind': 'consumption'}), body, content_type='application/x-ndjson')
+    assert response.json() == {'inserted': 3, 'updated': 0, 'rejected': 1, 'errors': [
+        {'line': 4, 'errors': {'__all__': [{'message': "Wiersz musi być obiektem JSON.", 'code': 'invalid'}]}}]}
+    assert DailySummary.objects.get(user=user, date=date(2024, 1, 1)).calories == 650
+
+    # Ponowny import tego samego pliku (z poprawioną wartością) aktualizuje wpisy zamiast je dublować
+    summary = import_history(user, 'consumption', [line.encode() + b'\n' for line in body.replace('80', '95').split('\n')], 'ndjson', chunk_size=2)
+    assert (summary['inserted'], summary['updated'], summary['rejected']) == (0, 3, 1)
+    assert Consumption.objects.filter(user=user).count() == 3
+    assert DailySummary.objects.get(user=user, date=date(2024, 1, 2)).calories == 95
+
+
+@pytest.mark.django_db
+def test_idempotency_key_replays_consumption_post_without_second_write(client, django_assert_num_queries,
+                                                                      django_capture_on_commit_callbacks):
+    from django.core.cache import cache
+    from diettracker.models import IdempotencyKey
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    meal = Meal.objects.create(user=user, name='Owsianka', calories=350, fat=7, carbohydrates=60, protein=12)
+    url = reverse('consumption')
+    data = {'meal': meal.id, 'idempotency_key': 'abc-meal'}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        first = client.post(url, data)
+    assert first.status_code == 302
+    # Ponowienie: zapamiętana odpowiedź z cache, bez zapytań o wpisy i bez ponownego zapisu
+    with django_assert_num_queries(2):
+        replay = client.post(url, data)
+    assert (replay.status_code, replay['Location'], replay['Idempotent-Replayed']) == (302, first['Location'], 'true')
+    assert Consumption.objects.filter(user=user).count() == 1
+
+    cache.clear()
+    assert client.post(url, data).status_code == 302
+    assert Consumption.objects.filter(user=user).count() == 1
+    assert client.post(url, {'meal': meal.id, 'idempotency_key': 'abc-meal', 'x': '1'}).status_code == 422
+
+    IdempotencyKey.objects.update(expires_at=timezone.now())
+    cache.clear()
+    assert client.post(url, data).status_code == 302
+    assert Consumption.objects.filter(user=user).count() == 2
+
+
+@pytest.mark.django_db
+def test_idempotency_key_replays_meal_delete_and_add_to_library(client):
+    from diettracker.models import UserMeal
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    other = User.objects.create_user(username='other', password='testpassword')
+    client.force_login(user)
+    own_meal = Meal.objects.create(user=user, name='Leczo', calories=400)
+    shared_meal = Meal.objects.create(user=other, name='Sałatka', calories=250)
+
+    # Ponowione usunięcie dostaje pierwotne przekierowanie zamiast 404
+    url = reverse('meal_delete', kwargs={'pk': own_meal.pk})
+    first = client.post(url, {'idempotency_key': 'abc-delete'})
+    replay = client.post(url, {'idempotency_key': 'abc-delete'})
+    assert (first.status_code, replay.status_code, replay['Idempotent-Replayed']) == (302, 302, 'true')
+    assert not Meal.objects.filter(pk=own_meal.pk).exists()
+
+    # Ponowione dodanie posiłku do listy nie kończy się błędem "już dodany" i nie podbija popularności drugi raz
+    data = {'meal_id': shared_meal.pk, 'idempotency_key': 'abc-add'}
+    assert client.post(reverse('all_meals'), data).status_code == 200
+    replay = client.post(reverse('all_meals'), data)
+    assert (replay.status_code, replay['Idempotent-Replayed']) == (200, 'true')
+    assert UserMeal.objects.filter(user=user, meal=shared_meal).count() == 1
+    assert Meal.objects.get(pk=shared_meal.pk).popularity == 1
+
+@pytest.mark.django_db
+def test_idempotency_key_is_not_claimed_by_rejected_request(client):
+    import json
+    from diettracker.models import IdempotencyKey
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    url = reverse('consumption_bulk')
+    invalid = json.dumps([{'name': 'Jabłko'}])
+    valid = json.dumps([{'name': 'Jabłko', 'calories': 80}])
+
+    response = client.post(url, invalid, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc-bulk')
+    assert response.status_code == 400
+    assert not IdempotencyKey.objects.exists()
+
+    # Poprawione żądanie z tym samym kluczem jest wykonywane, a nie odrzucane jako niezgodne z pierwszym (422)
+    response = client.post(url, valid, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc-bulk')
+    assert response.status_code == 201
+    replay = client.post(url, valid, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc-bulk')
+    assert (replay.status_code, replay['Idempotent-Replayed']) == (201, 'true')
+    assert Consumption.objects.filter(user=user).count() == 1
+
+
+@pytest.mark.django_db
+def test_weight_update_upserts_todays_entry(client):
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    for weight in ('80.5', '79.5'):
+        assert client.post(reverse('update_weight'), {'weight': weight}).status_code == 302
+    assert list(WeightEntry.objects.filter(user=user).values_list('weight', flat=True)) == [79.5]
+
+
+def test_replica_router_reads_from_replica_until_first_write(settings):
+    from diettracker.routers import ReplicaRouter, replica_reads
+    settings.REPLICA_DATABASES = ['replica1']
+    router = ReplicaRouter()
+    assert router.db_for_read(Food) is None
+    with replica_reads():
+        assert router.db_for_read(Food) == 'replica1'
+        assert router.db_for_read(User) is None
+        assert router.db_for_write(Food) == 'default'
+        assert router.db_for_read(Food) is None
+    assert router.allow_migrate('replica1', 'diettracker') is False
+
+
+def test_replica_routing_middleware_pins_client_to_primary_after_post(settings):
+    from diettracker.middleware import replica_routing_middleware
+    from diettracker.routers import STICKY_COOKIE, ReplicaRouter
+    settings.REPLICA_DATABASES = ['replica1']
+    routed = []
+
+    def view(request):
+        routed.append(ReplicaRouter().db_for_read(Meal))
+        return HttpResponse()
+
+    middleware = replica_routing_middleware(view)
+    factory = RequestFactory()
+    middleware(factory.get('/food/'))
+    response = middleware(factory.post('/consumption/'))
+    cookie = response.cookies[STICKY_COOKIE]
+    assert cookie['max-age'] == 10
+    request = factory.get('/food/')
+    request.COOKIES[STICKY_COOKIE] = cookie.value
+    middleware(request)
+    assert routed == ['replica1', None, None]
+
+
+@pytest.mark.django_db
+def test_nutrient_store_filters_and_ranks_mapped_snapshot(tmp_path):
+    from diettracker.nutrient_store import NutrientStore, write_nutrient_store
+    twarog = Food.objects.create(name='Twaróg chudy', calories=99, protein=18, carbohydrates=3.5, fat=0.5)
+    kurczak = Food.objects.create(name='Pierś z kurczaka', calories=110, protein=23, carbohydrates=0, fat=1.5)
+    Food.objects.create(name='Masło', calories=740, protein=0.7, carbohydrates=0.7, fat=82)
+    tofu = Food.objects.create(name='Tofu', calories=130, protein=18, carbohydrates=2, fat=7)
+
+    path = tmp_path / 'store.bin'
+    assert write_nutrient_store(path, chunk_size=2) == 4
+    store = NutrientStore(path)
+    assert store.name(1) == 'Pierś z kurczaka'
+    assert [row['id'] for row in store.query('-protein', 3)] == [kurczak.id, twarog.id, tofu.id]
+    assert store.query('calories', 5, protein__gte=18, fat__lt=5) == [
+        {'id': twarog.id, 'name': 'Twaróg chudy', 'calories': 99.0, 'protein': 18.0, 'carbohydrates': 3.5, 'fat': 0.5},
+        {'id': kurczak.id, 'name': 'Pierś z kurczaka', 'calories': 110.0, 'protein': 23.0, 'carbohydrates': 0.0, 'fat': 1.5},
+    ]
+    assert store.query('-protein', 2, calories__range=(100, 200)) == store.rows(store.top('-protein', 2, store.mask(calories__gte=100, calories__lte=200)))
+    with pytest.raises(ValueError):
+        store.query('name', 1)
+
+
+@pytest.mark.django_db
+def test_failed_nutrient_store_write_keeps_previous_snapshot(tmp_path, monkeypatch):
+    import os
+    from diettracker.nutrient_store import NutrientStore, write_nutrient_store
+    Food.objects.create(name='Twaróg', calories=99, protein=18, carbohydrates=3.5, fat=0.5)
+    path = tmp_path / 'store.bin'
+    write_nutrient_store(path)
+    Food.objects.create(name='Skyr', calories=63, protein=11, carbohydrates=4, fat=0)
+
+    def failing_fsync(fd):
+        raise OSError('brak miejsca na dysku')
+    monkeypatch.setattr(os, 'fsync', failing_fsync)
+    with pytest.raises(OSError):
+        write_nutrient_store(path)
+    # Nieudany zapis nie podmienia migawki ani nie zostawia plików tymczasowych
+    assert len(NutrientStore(path)) == 1
+    assert os.listdir(tmp_path) == ['store.bin']
+
+
+@pytest.mark.django_db
+def test_food_ranking_view_reads_rebuilt_snapshot(client, settings):
+    import io
+    import os
+    from django.core.management import call_command
+    from diettracker.nutrient_store import rebuild_nutrient_store
+    Food.objects.create(name='Twaróg', calories=99, protein=18, carbohydrates=3.5, fat=0.5)
+    # Bez pliku migawki żądanie nie zapisuje jej samo - ranking jest pusty
+    assert client.get(reverse('food_ranking'), {'order': '-protein'}).json()['results'] == []
+    assert not os.path.exists(settings.NUTRIENT_STORE_PATH)
+
+    call_command('rebuild_food_facets', stdout=io.StringIO())
+    response = client.get(reverse('food_ranking'), {'order': '-protein', 'fat__lte': '1'})
+    assert [food['name'] for food in response.json()['results']] == ['Twaróg']
+
+    Food.objects.create(name='Skyr', calories=63, protein=11, carbohydrates=4, fat=0)
+    assert [food['name'] for food in client.get(reverse('food_ranking'), {'fat__lte': '1'}).json()['results']] == ['Twaróg']
+    rebuild_nutrient_store()
+    assert [food['name'] for food in client.get(reverse('food_ranking'), {'fat__lte': '1'}).json()['results']] == ['Twaróg', 'Skyr']
+    assert client.get(reverse('food_ranking'), {'protein__gte': 'x'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_food_view_filters_macro_ranges_with_precomputed_facets(client, django_assert_max_num_queries):
+    from diettracker.facets import rebuild_food_facets
+    Food.objects.create(name='Twaróg chudy', calories=99, protein=18, carbohydrates=3.5, fat=0.5)
+    Food.objects.create(name='Pierś z kurczaka', calories=110, protein=23, carbohydrates=0, fat=1.5)
+    Food.objects.create(name='Twaróg tłusty', calories=175, protein=16, carbohydrates=3, fat=10)
+    Food.objects.create(name='Masło', calories=740, protein=0.7, carbohydrates=0.7, fat=82)
+    assert rebuild_food_facets() == 4
+
+    data = client.get(reverse('food'), {'format': 'json', 'protein_min': '15', 'fat_max': '5', 'sort': 'name'}).json()
+    assert [food['name'] for food in data['results']] == ['Pierś z kurczaka', 'Twaróg chudy']
+    # Faseta tłuszczu uwzględnia filtr białka, ale nie własny filtr tłuszczu
+    assert [bucket['count'] for bucket in data['facets']['fat']] == [1, 1, 0, 0, 1, 0, 0, 0, 0]
+    assert sum(bucket['count'] for bucket in data['facets']['protein']) == 2
+    assert data['facets']['calories'][1] == {'min': 50, 'max': 100, 'count': 1}
+
+    # Kostka faset jest w cache - odpowiedź nie liczy przedziałów zapytaniami COUNT
+    with django_assert_max_num_queries(1):
+        client.get(reverse('food'), {'format': 'json', 'protein_min': '20'})
+
+    data = client.get(reverse('food'), {'format': 'json', 'q': 'twarog', 'fat_max': '5'}).json()
+    assert [food['name'] for food in data['results']] == ['Twaróg chudy']
+    assert [bucket['count'] for bucket in data['facets']['fat']] == [1, 0, 0, 0, 1, 0, 0, 0, 0]
+    assert client.get(reverse('food'), {'protein_min': 'abc'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_stored_facet_cube_follows_rebuild_in_another_process(django_capture_on_commit_callbacks):
+    from django.core.cache import caches
+    from diettracker import facets
+    from diettracker.food_cache import CATALOGUE_VERSION_KEY
+    from diettracker.models import FoodFacetCell
+    Food.objects.create(name='Twaróg chudy', calories=99, protein=18, carbohydrates=3.5, fat=0.5)
+    with django_capture_on_commit_callbacks(execute=True):
+        facets.rebuild_food_facets()
+    assert facets.stored_cube().sum() == 1
+
+    # import_off w osobnym procesie: nowa tabela komórek i podbita wersja w jego instancji cache
+    FoodFacetCell.objects.update(count=3)
+    caches.create_connection('default').incr(CATALOGUE_VERSION_KEY)
+    assert facets.stored_cube().sum() == 3
+
+
+@pytest.mark.django_db
+def test_static_and_catalogue_pages_are_served_from_page_cache(client, django_capture_on_commit_callbacks, settings):
+    import io
+    from django.core.management import call_command
+    from diettracker.food_cache import bump_food_catalogue_version
+    from diettracker.page_cache import page_cache_version
+    assert client.get(reverse('diets'))['X-Page-Cache'] == 'miss'
+    cached = client.get(reverse('diets'))
+    assert cached['X-Page-Cache'] == 'hit'
+    assert 'Dieta paleo' in cached.content.decode()
+
+    user = User.objects.create_user(username='testuser', password='testpassword')
+    client.force_login(user)
+    # Zalogowany użytkownik dostaje osobną wersję strony (inna nawigacja), a katalogu produktów nie zapamiętujemy dla niego wcale
+    assert client.get(reverse('diets'))['X-Page-Cache'] == 'miss'
+    assert 'X-Page-Cache' not in client.get(reverse('food'))
+    client.logout()
+
+    client.get(reverse('food'))
+    assert client.get(reverse('food'))['X-Page-Cache'] == 'hit'
+    with django_capture_on_commit_callbacks(execute=True):
+        bump_food_catalogue_version()
+    assert client.get(reverse('food'))['X-Page-Cache'] == 'miss'
+
+    version = page_cache_version()
+    output = io.StringIO()
+    call_command('clear_page_cache', stdout=output)
+    assert str(version + 1) in output.getvalue()
+    assert client.get(reverse('diets'))['X-Page-Cache'] == 'miss'
+    settings.METRICS_TOKEN = 'sekret'
+    metrics = client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer sekret').content.decode()
+    assert 'diettracker_page_cache_hit_ratio{cache="page"}' in metrics
+
+
+@pytest.mark.django_db
+def test_navigation_fragment_is_cached_per_authentication_state(client):
+    from django.core.cache import cache
+    from django.core.cache.utils import make_template_fragment_key
+    from diettracker.page_cache import page_cache_version
+    users = [User.objects.create_user(username=name, password='testpassword') for name in ('anna', 'jan')]
+    version = page_cache_version()
+
+    assert 'Logowanie' in client.get(reverse('bmi')).content.decode()
+    assert 'Logowanie' in cache.get(make_template_fragment_key('navigation', [False, version]))
+    # Zalogowani użytkownicy mają identyczną nawigację - jeden wpis w cache dla wszystkich
+    for user in users:
+        client.force_login(user)
+        assert 'Profil' in client.get(reverse('profile')).content.decode()
+    assert 'Profil' in cache.get(make_template_fragment_key('navigation', [True, version]))
@@ -0,0 +1,65 @@
+"""
+Zmniejszanie liczby punktów szeregów czasowych (np. historii wagi) przed wysłaniem ich do wykresu.
+"""
+import numpy as np
+
+
+def bucket_edges(length, buckets):
+    """
+    Zwraca indeksy początków kolejnych kubełków przy podziale length punktów na buckets możliwie równych części.
+    """
+    buckets = max(1, min(buckets, length))
+    return np.linspace(0, length, buckets + 1).astype(np.int64)[:-1]
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: wybiera threshold punktów zachowujących kształt wykresu.
+    Zwraca tablicę indeksów wybranych punktów (zawsze z pierwszym i ostatnim).
+
+    Pętla przebiega po kubełkach, a nie po punktach - pola trójkątów w kubełku liczone są wektorowo.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    # Punkty pośrednie (bez pierwszego i ostatniego) dzielimy na threshold - 2 kubełki
+    starts = 1 + bucket_edges(length - 2, threshold - 2)
+    ends = np.append(starts[1:], length - 1)
+    counts = ends - starts
+    mean_x = np.add.reduceat(x[1:-1], starts - 1) / counts
+    mean_y = np.add.reduceat(y[1:-1], starts - 1) / counts
+    # Dla każdego kubełka punktem odniesienia jest średnia następnego kubełka, a dla ostatniego - ostatni punkt
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        area = np.abs(
+            (x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def bucket_stats(y, buckets):
+    """
+    Dzieli szereg na kubełki i zwraca krotkę (indeksy początków, indeksy końców włącznie, minima, maksima, średnie).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if not len(y):
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty, empty, empty
+    starts = bucket_edges(len(y), buckets)
+    ends = np.append(starts[1:], len(y))
+    minima = np.minimum.reduceat(y, starts)
+    maxima = np.maximum.reduceat(y, starts)
+    means = np.add.reduceat(y, starts) / (ends - starts)
+    return starts, ends - 1, minima, maxima, means
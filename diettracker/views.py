@@ -4,37 +4,63 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectdjango.settings')
 django.setup()
 from django.shortcuts import render, redirect
-from matplotlib.figure import Figure
-import io
+import hashlib
+import json
 import random
 from datetime import datetime, timedelta, date
-from django.db.models import Max, Min
-from django.db import IntegrityError
-import tempfile
+from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Min
+from django.db import IntegrityError, transaction
 from django.urls import reverse_lazy, reverse
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views import View
 from django.views.generic import ListView, DetailView, UpdateView, DeleteView
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseRedirect
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
-from diettracker.models import Food, Consumption, Diet, WeightEntry, Meal, UserMeal
-from diettracker.forms import LoginForm, RegisterForm, DietForm, WeightUpdateForm, DietForm, BMICalculatorForm, ConsumptionForm, MealForm, EditMealForm, MealConsumptionForm, AddMealForm
+from diettracker.models import Food, Consumption, Diet, WeightEntry, Meal, MealIngredient, UserMeal, DailyCompliance
+from diettracker.forms import LoginForm, RegisterForm, DietForm, WeightUpdateForm, DietForm, BMICalculatorForm, ConsumptionForm, MealForm, EditMealForm, MealConsumptionForm, AddMealForm, BulkConsumptionEntryForm, MealIngredientForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import FormMixin
 from django.shortcuts import get_object_or_404
+from diettracker.search import search_food, search_meals, filter_foods, fold
+from diettracker.pagination import KeysetPage, KeysetPaginator, InvalidCursor, CachedCountPaginator
+from diettracker.summaries import daily_totals, record_consumption, record_consumptions, discard_consumption
+from diettracker.charts import render_weight_chart
+from diettracker.meal_library import (get_meal_library, invalidate_meal_library, meal_catalogue_version, meal_library_users,
+                                      bump_meal_catalogue_version)
+from diettracker.timeseries import lttb, bucket_stats
+from diettracker.instrumentation import can_read_metrics, render_metrics
+from diettracker.reports import nutrition_report, report_range
+from diettracker.analytics import weight_trends, weight_series, exponential_trend
+from diettracker.recommendations import recommend_foods, recommend_meals
+from diettracker.recipes import set_ingredient, remove_ingredient
+from diettracker.exports import EXPORTS, export_stream
+from diettracker.history_import import FORMATS, IMPORTS, import_history
+from diettracker.idempotency import IdempotentMixin
+from diettracker.nutrient_store import MACROS as STORE_MACROS, get_nutrient_store
+from diettracker.facets import facet_counts, queryset_cube, stored_cube
+from diettracker.page_cache import CachedPageMixin, render_metrics as render_page_cache_metrics
+from diettracker.food_cache import food_cache, food_catalogue_version, get_foods, render_metrics as render_food_cache_metrics
+import numpy as np
+
+class HomeView(CachedPageMixin, View):
+    cache_authenticated = True
 
-class HomeView(View):
     def get(self, request):
         return render(request, 'base.html')
 
-class SuccessView(View):
+class SuccessView(CachedPageMixin, View):
+    cache_authenticated = True
+
     def get(self, request):
         return render(request, 'success.html')
 
@@ -45,7 +71,9 @@ class ProfileView(View):
     def get(self, request):
         return render(request, 'profile.html')
 
-class DietView(View):
+class DietView(CachedPageMixin, View):
+    cache_authenticated = True
+
     def get(self, request):
         return render(request, 'diets.html')
 
@@ -68,7 +96,9 @@ class LoginView(View):
         return render(request, 'login.html', {'form': form})
 
 
-class BMIView(View):
+class BMIView(CachedPageMixin, View):
+    cache_authenticated = True
+
     def get(self, request):
         form = BMICalculatorForm()
         return render(request, 'bmi.html', {'form': form})
@@ -76,25 +106,36 @@ class BMIView(View):
 
 
 
-class ConsumptionView(LoginRequiredMixin, View):
+def remaining_macros(totals, user_diet):
+    """
+    Zwraca słownik z ilością kalorii i makroskładników, które użytkownik może jeszcze dziś zjeść (None - brak limitu).
+    """
+    return {
+        'calories': max(0, user_diet.max_calories - totals['calories']) if user_diet and user_diet.max_calories is not None else None,
+        'fat': user_diet.max_fat - totals['fat'] if user_diet and user_diet.max_fat is not None else None,
+        'carbohydrates': max(0, user_diet.max_carbohydrates - totals['carbohydrates']) if user_diet and user_diet.max_carbohydrates is not None else None,
+        'protein': max(0, user_diet.max_protein - totals['protein']) if user_diet and user_diet.max_protein is not None else None,
+    }
+
+
+class ConsumptionView(LoginRequiredMixin, IdempotentMixin, View):
     def get(self, request):
         user = request.user
 
-        today_consumption = Consumption.objects.filter(user=user, date=date.today()).values('calories', 'fat', 'carbohydrates', 'protein')
-        total_calories = sum(item['calories'] for item in today_consumption)
-        total_fat = sum(item['fat'] for item in today_consumption)
-        total_carbohydrates = sum(item['carbohydrates'] for item in today_consumption)
-        total_protein = sum(item['protein'] for item in today_consumption)
-
+        totals = daily_totals(user, date.today())
         user_diet = Diet.objects.filter(user=user).first()
+        meal_consumption_form = MealConsumptionForm(user=user)
+        return render(request, 'consumption.html', self.get_context_data(totals, user_diet, meal_consumption_form))
 
-        remaining_calories = max(0, user_diet.max_calories - total_calories) if user_diet and user_diet.max_calories is not None else None
-        remaining_fat = user_diet.max_fat - total_fat if user_diet and user_diet.max_fat is not None else None
-        remaining_carbohydrates = max(0, user_diet.max_carbohydrates - total_carbohydrates) if user_diet and user_diet.max_carbohydrates is not None else None
-        remaining_protein = max(0, user_diet.max_protein - total_protein) if user_diet and user_diet.max_protein is not None else None
+    def get_context_data(self, totals, user_diet, meal_consumption_form):
+        total_calories = totals['calories']
+        total_fat = totals['fat']
+        total_carbohydrates = totals['carbohydrates']
+        total_protein = totals['protein']
+
+        remaining = remaining_macros(totals, user_diet)
 
         consumption_form = ConsumptionForm()
-        meal_consumption_form = MealConsumptionForm(user=user)
 
         context = {
             'form': consumption_form,
@@ -103,12 +144,12 @@ class ConsumptionView(LoginRequiredMixin, View):
             'total_fat': total_fat,
             'total_carbohydrates': total_carbohydrates,
             'total_protein': total_protein,
-            'remaining_calories': remaining_calories,
-            'remaining_fat': remaining_fat,
-            'remaining_carbohydrates': remaining_carbohydrates,
-            'remaining_protein': remaining_protein
+            'remaining_calories': remaining['calories'],
+            'remaining_fat': remaining['fat'],
+            'remaining_carbohydrates': remaining['carbohydrates'],
+            'remaining_protein': remaining['protein']
         }
-        return render(request, 'consumption.html', context)
+        return context
 
     def post(self, request):
         consumption_form = ConsumptionForm(request.POST)
@@ -117,16 +158,17 @@ class ConsumptionView(LoginRequiredMixin, View):
         if 'meal' in request.POST:
             if meal_consumption_form.is_valid():
                 user_id = request.user.id
-                meal_id = meal_consumption_form.cleaned_data['meal'].id
-                meal = Meal.objects.get(pk=meal_id)
+                meal = meal_consumption_form.cleaned_data['meal']
                 amount = 1
                 calories = meal.calories
                 fat = meal.fat if meal.fat is not None else 0
                 carbohydrates = meal.carbohydrates if meal.carbohydrates is not None else 0
                 protein = meal.protein if meal.protein is not None else 0
                 name = meal.name
-                consumption = Consumption.objects.create(user_id=user_id, date=date.today(), calories=calories, fat=fat,
-                                                         carbohydrates=carbohydrates, protein=protein, name=name)
+                with transaction.atomic():
+                    consumption = Consumption.objects.create(user_id=user_id, date=date.today(), calories=calories, fat=fat,
+                                                             carbohydrates=carbohydrates, protein=protein, name=name)
+                    record_consumption(consumption)
                 return redirect('consumption')
 
         elif 'food' in request.POST:
@@ -139,8 +181,10 @@ class ConsumptionView(LoginRequiredMixin, View):
                 carbohydrates = (food.carbohydrates / 100) * amount
                 protein = (food.protein / 100) * amount
                 name = f"{food.name} ({amount}g)"
-                consumption = Consumption.objects.create(user_id=user_id, date=date.today(), calories=calories, fat=fat,
-                                                         carbohydrates=carbohydrates, protein=protein, name=name)
+                with transaction.atomic():
+                    consumption = Consumption.objects.create(user_id=user_id, date=date.today(), calories=calories, fat=fat,
+                                                             carbohydrates=carbohydrates, protein=protein, name=name)
+                    record_consumption(consumption)
                 return redirect('consumption')
 
         elif 'consumption_id' in request.POST:
@@ -156,6 +200,151 @@ class ConsumptionView(LoginRequiredMixin, View):
         return HttpResponseBadRequest("Błąd przetwarzania formularza")
 
 
+class RecommendationView(LoginRequiredMixin, View):
+    """
+    Produkty (z sugerowaną porcją) i posiłki użytkownika, które najlepiej wypełniają pozostały na dziś limit, w formacie JSON.
+    """
+    raise_exception = True
+
+    def get(self, request):
+        user_diet = Diet.objects.filter(user=request.user).first()
+        remaining = remaining_macros(daily_totals(request.user, date.today()), user_diet)
+        return JsonResponse({
+            'remaining': remaining,
+            'foods': recommend_foods(remaining),
+            'meals': recommend_meals(get_meal_library(request.user), remaining),
+        })
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Eksport spożycia, historii wagi lub posiłków użytkownika jako CSV lub NDJSON (parametr format), strumieniowany
+    bez budowania całej odpowiedzi w pamięci. Z parametrem gzip=1 plik jest kompresowany w locie.
+    """
+    content_types = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson; charset=utf-8'}
+
+    def get(self, request, kind):
+        output_format = request.GET.get('format', 'csv')
+        if kind not in EXPORTS or output_format not in self.content_types:
+            return HttpResponseBadRequest("Nieprawidłowy rodzaj lub format eksportu")
+        compress = request.GET.get('gzip') == '1'
+
+        filename = '%s.%s' % (kind, output_format)
+        content_type = self.content_types[output_format]
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(export_stream(request.user, kind, output_format, compress), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+
+class BulkConsumptionView(LoginRequiredMixin, IdempotentMixin, View):
+    raise_exception = True
+    max_entries = 500
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowy JSON.'}, status=400)
+        entries = payload.get('entries') if isinstance(payload, dict) else payload
+        if not isinstance(entries, list) or not entries:
+            return JsonResponse({'error': 'Oczekiwano niepustej listy wpisów.'}, status=400)
+        if len(entries) > self.max_entries:
+            return JsonResponse({'error': 'Maksymalna liczba wpisów w jednym żądaniu to %d.' % self.max_entries}, status=400)
+
+        forms = [BulkConsumptionEntryForm(entry) if isinstance(entry, dict) else None for entry in entries]
+        valid_forms = [(index, form) for index, form in enumerate(forms) if form is not None and form.is_valid()]
+
+        # Wszystkie produkty jednym zapytaniem; posiłki z biblioteki użytkownika (cache)
+        food_ids = {form.cleaned_data['food'] for index, form in valid_forms if form.cleaned_data['food'] is not None}
+        foods = Food.objects.in_bulk(food_ids) if food_ids else {}
+        meals = {}
+        if any(form.cleaned_data['meal'] is not None for index, form in valid_forms):
+            meals = {meal.id: meal for meal in get_meal_library(request.user)}
+
+        today = date.today()
+        consumptions = []
+        indexes = []
+        for index, form in valid_forms:
+            data = form.cleaned_data
+            consumption = Consumption(user_id=request.user.id, date=data['date'] or today)
+            if data['food'] is not None:
+                food = foods.get(data['food'])
+                if food is None:
+                    form.add_error('food', "Nieprawidłowy identyfikator produktu.")
+                    continue
+                amount = data['amount']
+                consumption.calories = (food.calories / 100) * amount
+                consumption.fat = (food.fat / 100) * amount
+                consumption.carbohydrates = (food.carbohydrates / 100) * amount
+                consumption.protein = (food.protein / 100) * amount
+                consumption.name = f"{food.name} ({amount}g)"
+            elif data['meal'] is not None:
+                meal = meals.get(data['meal'])
+                if meal is None:
+                    form.add_error('meal', "Nieprawidłowy identyfikator posiłku.")
+                    continue
+                consumption.calories = meal.calories
+                consumption.fat = meal.fat if meal.fat is not None else 0
+                consumption.carbohydrates = meal.carbohydrates if meal.carbohydrates is not None else 0
+                consumption.protein = meal.protein if meal.protein is not None else 0
+                consumption.name = meal.name
+            else:
+                consumption.calories = data['calories']
+                consumption.fat = data['fat'] or 0
+                consumption.carbohydrates = data['carbohydrates'] or 0
+                consumption.protein = data['protein'] or 0
+                consumption.name = data['name']
+            consumptions.append(consumption)
+            indexes.append(index)
+
+        with transaction.atomic():
+            created = Consumption.objects.bulk_create(consumptions)
+            record_consumptions(created)
+
+        errors = []
+        for index, form in enumerate(forms):
+            if form is None:
+                errors.append({'index': index, 'errors': {'__all__': [{'message': "Wpis musi być obiektem JSON.", 'code': 'invalid'}]}})
+            elif form.errors:
+                errors.append({'index': index, 'errors': form.errors.get_json_data()})
+        return JsonResponse({
+            'created': [{'index': index, 'id': consumption.id} for index, consumption in zip(indexes, created)],
+            'errors': errors,
+        }, status=201 if created else 400)
+
+
+class HistoryImportView(LoginRequiredMixin, View):
+    """
+    Import historii wagi lub spożycia z pliku CSV albo NDJSON - przesłanego jako pole file formularza lub jako ciało żądania
+    (Content-Type text/csv lub application/x-ndjson). Zwraca podsumowanie dodanych, zaktualizowanych i odrzuconych wierszy.
+    Bez IdempotentMixin: import aktualizuje istniejące wpisy (dzień i nazwa) zamiast je dublować, więc ponowienie nie
+    zmienia danych, a odcisk żądania wymagałby wczytania całego pliku do pamięci.
+    """
+    raise_exception = True
+    content_types = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+    extensions = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+
+    def post(self, request, kind):
+        if kind not in IMPORTS:
+            return JsonResponse({'error': 'Nieprawidłowy rodzaj importu.'}, status=404)
+        upload = request.FILES.get('file')
+        if upload is not None:
+            stream = upload
+            input_format = request.POST.get('format') or self.extensions.get(os.path.splitext(upload.name)[1].lstrip('.').lower())
+        else:
+            # Ciało żądania czytane jest strumieniowo, bez wczytywania całego pliku do pamięci
+            stream = request
+            input_format = self.content_types.get(request.content_type)
+        if input_format not in FORMATS:
+            return JsonResponse({'error': 'Obsługiwane formaty to CSV i NDJSON.'}, status=400)
+
+        summary = import_history(request.user, kind, stream, input_format)
+        return JsonResponse(summary, status=400 if 'error' in summary else 200)
+
+
 class RegisterView(View):
     def get(self, request):
         form = RegisterForm()
@@ -173,6 +362,10 @@ class RegisterView(View):
 
 
 def update_diet(request):
+    """
+    Ustawia limity diety użytkownika. Bez klucza idempotencji - użytkownik ma jedną dietę, którą zapis nadpisuje
+    podanymi wartościami, więc ponowione żądanie zostawia ten sam stan.
+    """
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
@@ -188,10 +381,12 @@ def update_diet(request):
             diet = form.save(commit=False)
             diet.user = user
             diet.save()
+            # Oceny zgodności liczone były według poprzednich limitów - score_compliance przeliczy je od nowa
+            DailyCompliance.objects.filter(user=user).delete()
             return redirect('success')
     return render(request, 'update_diet.html', {'form': form})
 
-class WeightUpdateView(View):
+class WeightUpdateView(IdempotentMixin, View):
     @method_decorator(login_required)
     def get(self, request):
         form = WeightUpdateForm()
@@ -204,12 +399,9 @@ class WeightUpdateView(View):
             weight = form.cleaned_data['weight']
             user = request.user
             today = timezone.now().date()
-            try:
-                existing_weight = WeightEntry.objects.get(user=user, date=today)
-                existing_weight.weight = weight
-                existing_weight.save()
-            except WeightEntry.DoesNotExist:
-                WeightEntry.objects.create(user=user, date=today, weight=weight)
+            # Jedno zapytanie INSERT ... ON CONFLICT DO UPDATE - równoczesne zapisy tego samego dnia nie kończą się IntegrityError
+            WeightEntry.objects.bulk_create([WeightEntry(user=user, date=today, weight=weight)], update_conflicts=True,
+                                            unique_fields=['user', 'date'], update_fields=['weight', 'updated_at'])
             return redirect('success')
         return render(request, 'update_weight.html', {'form': form})
 
@@ -220,35 +412,304 @@ class LogoutView(View):
 
 
 class WeightChartView(LoginRequiredMixin, View):
+    cache_timeout = 60 * 60 * 24
+    max_points = 500
+    # Zmieniana przy zmianie wyglądu wykresu, aby nie serwować starych obrazków z cache i przeglądarek
+    chart_version = 2
+
     def get(self, request):
-        weight_entries = WeightEntry.objects.filter(user=request.user)
+        weight_entries = request.user.weightentry_set.all()
+        stats = weight_entries.aggregate(count=Count('id'), earliest_date=Min('date'), latest_date=Max('date'),
+                                         last_change=Max('updated_at'))
 
-        if len(weight_entries) < 2 or weight_entries.aggregate(earliest_date=Min('date'), latest_date=Max('date'))['earliest_date'] == weight_entries.aggregate(earliest_date=Min('date'), latest_date=Max('date'))['latest_date']:
+        if stats['count'] < 2 or stats['earliest_date'] == stats['latest_date']:
             return render(request, 'weight_chart.html', {'chart_data': None})
-        else:
-            dates = [entry.date for entry in weight_entries]
-            weights = [entry.weight for entry in weight_entries]
 
-            plt.plot(dates, weights)
-            plt.xlabel('Data')
-            plt.ylabel('Waga')
-            plt.title('Waga w zależności od czasu')
+        # Wersja wykresu zmienia się przy każdym dodaniu, edycji i usunięciu wpisu wagi
+        version = hashlib.md5(('%d:%d:%d:%s' % (self.chart_version, request.user.id, stats['count'],
+                                                stats['last_change'].isoformat())).encode()).hexdigest()
+        etag = quote_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
 
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+        cache_key = 'weight_chart:%d:%s' % (request.user.id, version)
+        chart_data = cache.get(cache_key)
+        if chart_data is None:
+            days, weights = weight_series(request.user)
+            trend = exponential_trend(days, weights)
+            selected = lttb(days, weights, self.max_points)
+            chart_data = render_weight_chart([date.fromordinal(int(day)) for day in days[selected]], weights[selected],
+                                             trend[selected])
+            cache.set(cache_key, chart_data, self.cache_timeout)
+
+        response = HttpResponse(chart_data, content_type='image/png')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def parse_date_param(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+class WeightTrendView(LoginRequiredMixin, View):
+    """
+    Średnie kroczące, wygładzony trend wagi, tempo zmian i szacowany bilans energetyczny w formacie JSON.
+    Szereg jest zmniejszany algorytmem LTTB do parametru points.
+    """
+    default_points = 500
+    max_points = 2000
 
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                chart_path = temp_file.name
-                plt.savefig(chart_path)
+    def get(self, request):
+        try:
+            start = parse_date_param(request.GET['start']) if request.GET.get('start') else None
+            end = parse_date_param(request.GET['end']) if request.GET.get('end') else None
+            points = max(3, min(int(request.GET.get('points', self.default_points)), self.max_points))
+            rate_window = max(2, int(request.GET.get('window', 28)))
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowe parametry zapytania")
+
+        trends = weight_trends(request.user, start, end, rate_window)
+        selected = lttb(trends['days'], trends['weights'], points)
+        series = [
+            {'date': date.fromordinal(int(trends['days'][i])).isoformat(), 'weight': float(trends['weights'][i]),
+             'average_7': round(float(trends['average_7'][i]), 2), 'average_30': round(float(trends['average_30'][i]), 2),
+             'trend': round(float(trends['trend'][i]), 2)}
+            for i in selected
+        ]
+        return JsonResponse({
+            'total': len(trends['days']),
+            'points': series,
+            'weekly_rate': None if trends['weekly_rate'] is None else round(trends['weekly_rate'], 3),
+            'energy_balance': trends['energy_balance'],
+        })
+
+
+class WeightDataView(LoginRequiredMixin, View):
+    default_points = 200
+    max_points = 2000
 
-            with open(chart_path, 'rb') as f:
-                chart_data = f.read()
+    def get_queryset(self):
+        """
+        Zwraca queryset wpisów z zakresu dat oraz docelową liczbę punktów; rzuca ValueError przy błędnych parametrach.
+        """
+        weight_entries = WeightEntry.objects.filter(user=self.request.user)
+        start = self.request.GET.get('start')
+        end = self.request.GET.get('end')
+        points = int(self.request.GET.get('points', self.default_points))
+        if start:
+            weight_entries = weight_entries.filter(date__gte=parse_date_param(start))
+        if end:
+            weight_entries = weight_entries.filter(date__lte=parse_date_param(end))
+        points = max(3, min(points, self.max_points))
+        return weight_entries.order_by('date').values_list('date', 'weight'), points
 
-            response = HttpResponse(chart_data, content_type='image/png')
-            return response
-class FoodView(ListView):
+    def get(self, request):
+        try:
+            weight_entries, points = self.get_queryset()
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowe parametry zapytania")
+        return self.render_series(list(weight_entries), points)
+
+    def render_series(self, rows, points):
+        dates = [row[0] for row in rows]
+        weights = np.array([row[1] for row in rows], dtype=np.float64)
+        selected = lttb([day.toordinal() for day in dates], weights, points)
+        starts, ends, minima, maxima, means = bucket_stats(weights, points)
+
+        return JsonResponse({
+            'total': len(rows),
+            'points': [{'date': dates[i].isoformat(), 'weight': float(weights[i])} for i in selected],
+            'buckets': [
+                {'start': dates[first].isoformat(), 'end': dates[last].isoformat(),
+                 'min': float(low), 'max': float(high), 'mean': round(float(mean), 2)}
+                for first, last, low, high, mean in zip(starts, ends, minima, maxima, means)
+            ],
+        })
+
+
+class NutritionReportView(LoginRequiredMixin, View):
+    """
+    Raport spożycia w formacie JSON. Z span='week' lub 'month' obejmuje tydzień lub miesiąc zawierający dzień z parametru
+    date (domyślnie dziś), bez span - zakres start-end pogrupowany według parametru period (day, week, month).
+    """
+    raise_exception = True
+    span = None
+
+    def get_range(self):
+        if self.span:
+            day = self.request.GET.get('date')
+            start, end = report_range(self.span, parse_date_param(day) if day else None)
+            return start, end, self.request.GET.get('period', 'day')
+        return (parse_date_param(self.request.GET.get('start', '')), parse_date_param(self.request.GET.get('end', '')),
+                self.request.GET.get('period', 'week'))
+
+    def get(self, request):
+        try:
+            start, end, period = self.get_range()
+            report = nutrition_report(request.user, start, end, period)
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowy zakres dat lub okres.'}, status=400)
+        return JsonResponse(report)
+
+
+def food_as_dict(food):
+    return {'id': food.id, 'name': food.name, 'calories': food.calories, 'protein': food.protein,
+            'carbohydrates': food.carbohydrates, 'fat': food.fat}
+
+
+class FoodView(CachedPageMixin, ListView):
     model = Food
     template_name = 'food.html'
     context_object_name = 'foods'
+    page_size = 50
+    page_cache_timeout = 60 * 60
+    sort_fields = ['name', 'calories', 'protein', 'carbohydrates', 'fat']
+
+    def get(self, request, *args, **kwargs):
+        sort = request.GET.get('sort', 'name')
+        if sort.lstrip('-') not in self.sort_fields:
+            return HttpResponseBadRequest("Nieprawidłowe sortowanie")
+        self.sort = sort
+        try:
+            self.ranges = self.get_ranges()
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowy zakres wartości")
+        self.query = request.GET.get('q', '').strip()
+        self.object_list = self.get_queryset()
+        try:
+            page = self.get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Nieprawidłowy kursor")
+        self.facets = self.get_facets()
+        return self.render_to_response(self.get_context_data(page=page))
+
+    def get_page_cache_vary(self, request):
+        # Zapamiętana strona katalogu traci ważność razem z wersją katalogu produktów (import_off)
+        return [food_catalogue_version()]
+
+    def get_ranges(self):
+        """
+        Zakresy wartości na 100 g z parametrów <makroskładnik>_min i <makroskładnik>_max, np. protein_min=20&fat_max=5.
+        """
+        ranges = {}
+        for field in self.sort_fields[1:]:
+            low, high = (self.request.GET.get('%s_%s' % (field, bound), '').strip() for bound in ('min', 'max'))
+            if low or high:
+                ranges[field] = (float(low) if low else None, float(high) if high else None)
+        return ranges
+
+    def get_search_queryset(self):
+        queryset = Food.objects.all()
+        return filter_foods(queryset, self.query) if self.query else queryset
+
+    def get_queryset(self):
+        queryset = self.get_search_queryset()
+        for field, (low, high) in self.ranges.items():
+            if low is not None:
+                queryset = queryset.filter(**{'%s__gte' % field: low})
+            if high is not None:
+                queryset = queryset.filter(**{'%s__lte' % field: high})
+        return queryset
+
+    def get_facets(self):
+        """
+        Liczby produktów w przedziałach makroskładników - z kostki zapisanej przy imporcie, a przy wyszukiwaniu po nazwie
+        z jednego zapytania GROUP BY po wynikach wyszukiwania.
+        """
+        cube = queryset_cube(self.get_search_queryset()) if self.query else stored_cube()
+        return facet_counts(cube, self.ranges)
+
+    def get_page(self, cursor):
+        """
+        Strona katalogu: identyfikatory produktów i kursory zapamiętywane są w cache dla bieżącej wersji katalogu,
+        a same produkty odczytywane z pamięci podręcznej produktów.
+        """
+        filters = json.dumps([self.query, sorted(self.ranges.items()), cursor or ''])
+        cache_key = 'food_page:%s:%s:%s' % (food_catalogue_version(), self.sort, hashlib.md5(filters.encode()).hexdigest())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            ids, next_cursor, previous_cursor = cached
+            return KeysetPage(get_foods(ids), next_cursor, previous_cursor)
+        page = self.get_paginator().page(cursor)
+        food_cache.put_many(page.object_list)
+        cache.set(cache_key, ([food.pk for food in page.object_list], page.next_cursor, page.previous_cursor), self.page_cache_timeout)
+        return page
+
+    def get_paginator(self):
+        return KeysetPaginator(self.object_list, self.sort, self.page_size)
+
+    def get_context_data(self, page, **kwargs):
+        kwargs['object_list'] = page.object_list
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'page': page,
+            'sort': self.sort,
+            'sort_fields': self.sort_fields,
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+            'query': self.query,
+            'range_fields': [(field, *self.ranges.get(field, (None, None))) for field in self.sort_fields[1:]],
+            'facets': self.facets,
+            'filter_query': self.request.GET.copy(),
+        })
+        for name in ('sort', 'cursor', 'format'):
+            context['filter_query'].pop(name, None)
+        context['filter_query'] = context['filter_query'].urlencode()
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json' or self.request.accepts('application/json') and not self.request.accepts('text/html'):
+            results = [food_as_dict(food) for food in context['foods']]
+            return JsonResponse({'results': results, 'sort': self.sort, 'facets': context['facets'],
+                                 'next_cursor': context['next_cursor'], 'previous_cursor': context['previous_cursor']})
+        return super().render_to_response(context, **response_kwargs)
+
+
+class FoodSearchView(View):
+    def get(self, request):
+        query = request.GET.get('q', '')
+        try:
+            limit = int(request.GET.get('limit', 10))
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowy limit")
+        results = [food_as_dict(food) for food in search_food(query, limit)]
+        return JsonResponse({'results': results})
+
+
+class FoodRankingView(View):
+    """
+    Ranking produktów całego katalogu według makroskładnika (order, np. -protein) z filtrami zakresów wartości na 100 g
+    (np. protein__gte=20&fat__lt=5), liczony na migawce kolumnowej zamiast przez ORM.
+    """
+    max_limit = 100
+
+    def get(self, request):
+        order = request.GET.get('order', '-protein')
+        filters = {}
+        try:
+            limit = min(int(request.GET.get('limit', 20)), self.max_limit)
+            for lookup, value in request.GET.items():
+                if lookup.partition('__')[0] in STORE_MACROS:
+                    filters[lookup] = float(value)
+            results = get_nutrient_store().query(order, limit, **filters)
+        except ValueError:
+            return HttpResponseBadRequest("Nieprawidłowe parametry rankingu")
+        return JsonResponse({'results': results})
+
+
+class MetricsView(View):
+    """
+    Histogramy czasów żądań i zapytań SQL w formacie tekstowym Prometheusa (dla administratorów i z METRICS_TOKEN).
+    """
+    def get(self, request):
+        if not can_read_metrics(request):
+            raise PermissionDenied
+        return HttpResponse(render_metrics() + render_food_cache_metrics() + render_page_cache_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 '''
 class WeightHistoryListView(ListView):
@@ -273,7 +734,7 @@ class WeightHistoryListView(ListView):
 '''
 
 
-class MealListView(LoginRequiredMixin, ListView):
+class MealListView(LoginRequiredMixin, IdempotentMixin, ListView):
     model = Meal
     template_name = 'meal.html'
     context_object_name = 'meals'
@@ -300,11 +761,17 @@ class MealListView(LoginRequiredMixin, ListView):
             meal = form.save(commit=False)
             meal.user = request.user
             meal.save()
+            invalidate_meal_library(request.user.id)
+            bump_meal_catalogue_version()
             return redirect('meal_list')
         else:
             return HttpResponseBadRequest("Błąd przetwarzania formularza.")
 
 class MealEditView(LoginRequiredMixin, UpdateView):
+    """
+    Edycja posiłku. Bez IdempotentMixin - zapis ustawia podane wartości, więc ponowione żądanie zostawia ten sam stan
+    i zwraca to samo przekierowanie.
+    """
     model = Meal
     form_class = EditMealForm
     template_name = 'meal_edit.html'
@@ -326,17 +793,73 @@ class MealEditView(LoginRequiredMixin, UpdateView):
         else:
             return self.form_invalid(form)
 
-class MealDeleteView(LoginRequiredMixin, DeleteView):
+    def form_valid(self, form):
+        user_ids = meal_library_users(self.object)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            invalidate_meal_library(*user_ids)
+            bump_meal_catalogue_version()
+        return response
+
+class MealIngredientsView(LoginRequiredMixin, IdempotentMixin, View):
+    """
+    Składniki posiłku-przepisu: dodanie produktu (lub zmiana jego ilości) i usunięcie składnika aktualizują sumy posiłku.
+    Ponowione usunięcie składnika z tym samym kluczem dostaje pierwotne przekierowanie zamiast 404.
+    """
+    def get_meal(self, pk):
+        return get_object_or_404(Meal, pk=pk, user=self.request.user)
+
+    def get(self, request, pk):
+        meal = self.get_meal(pk)
+        return render(request, 'meal_ingredients.html', self.get_context_data(meal, MealIngredientForm()))
+
+    def get_context_data(self, meal, form):
+        return {'meal': meal, 'ingredients': meal.ingredients.select_related('food').order_by('id'), 'form': form}
+
+    def post(self, request, pk):
+        meal = self.get_meal(pk)
+        if 'remove' in request.POST:
+            try:
+                ingredient_id = int(request.POST['remove'])
+            except ValueError:
+                return HttpResponseBadRequest("Nieprawidłowy identyfikator składnika")
+            ingredient = get_object_or_404(MealIngredient, pk=ingredient_id, meal=meal)
+            remove_ingredient(ingredient)
+            return redirect('meal_ingredients', pk=meal.pk)
+
+        form = MealIngredientForm(request.POST)
+        if not form.is_valid():
+            return render(request, 'meal_ingredients.html', self.get_context_data(meal, form), status=400)
+        set_ingredient(meal, form.cleaned_data['food'], form.cleaned_data['amount'])
+        return redirect('meal_ingredients', pk=meal.pk)
+
+class MealDeleteView(LoginRequiredMixin, IdempotentMixin, DeleteView):
+    """
+    Usunięcie posiłku; ponowione żądanie z tym samym kluczem dostaje pierwotne przekierowanie zamiast 404.
+    """
     model = Meal
     success_url = reverse_lazy('meal_list')
 
     def get_queryset(self):
         return Meal.objects.filter(user=self.request.user)
 
+    def form_valid(self, form):
+        user_ids = meal_library_users(self.object)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            invalidate_meal_library(*user_ids)
+            bump_meal_catalogue_version()
+        return response
+
     def delete(self, request, *args, **kwargs):
         self.object = self.get_object()
         success_url = self.get_success_url()
-        self.object.delete()
+        user_ids = meal_library_users(self.object)
+        with transaction.atomic():
+            self.object.delete()
+            invalidate_meal_library(*user_ids)
+            bump_meal_catalogue_version()
+        return HttpResponseRedirect(success_url)
 
 class ConsumptionListView(LoginRequiredMixin, View):
     def get(self, request):
@@ -353,29 +876,43 @@ class ConsumptionListView(LoginRequiredMixin, View):
         if 'delete_consumption' in request.POST:
             consumption_id = request.POST.get('delete_consumption')
             try:
-                consumption = Consumption.objects.get(id=consumption_id)
-                consumption.delete()
-            except Consumption.DoesNotExist:
+                with transaction.atomic():
+                    consumption = Consumption.objects.select_for_update().get(id=consumption_id, user=request.user)
+                    consumption.delete()
+                    discard_consumption(consumption)
+            except (Consumption.DoesNotExist, ValueError):
                 pass
         return HttpResponseRedirect(reverse('consumption_list'))
 
 
-class AllMealsView(ListView):
+class AllMealsView(IdempotentMixin, ListView):
+    """
+    Katalog posiłków wszystkich użytkowników z wyszukiwaniem. POST dodaje posiłek do listy użytkownika - ponowione
+    żądanie z tym samym kluczem dostaje pierwotną odpowiedź zamiast błędu o już dodanym posiłku.
+    """
     model = Meal
     template_name = 'all_meals.html'
     context_object_name = 'meals'
     paginate_by = 10
+    paginator_class = CachedCountPaginator
 
     def get_queryset(self):
         queryset = super().get_queryset()
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-        return queryset
+            return search_meals(queryset, search_query)
+        return queryset.order_by('-popularity', 'id')
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        search_query = ' '.join(fold(self.request.GET.get('search') or '').split())
+        count_cache_key = 'meal_count:%s:%s' % (meal_catalogue_version(), hashlib.md5(search_query.encode()).hexdigest())
+        return self.paginator_class(queryset, per_page, count_cache_key, orphans=orphans,
+                                    allow_empty_first_page=allow_empty_first_page, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['add_meal_form'] = AddMealForm()
+        context['search'] = self.request.GET.get('search', '')
         return context
 
     def post(self, request, *args, **kwargs):
@@ -385,7 +922,10 @@ class AllMealsView(ListView):
             user = request.user
             try:
                 meal = Meal.objects.get(pk=meal_id)
-                UserMeal.objects.create(user=user, meal=meal)
+                with transaction.atomic():
+                    UserMeal.objects.create(user=user, meal=meal)
+                    Meal.objects.filter(pk=meal.pk).update(popularity=F('popularity') + 1)
+                invalidate_meal_library(user.id)
             except Meal.DoesNotExist:
                 pass
             except IntegrityError:
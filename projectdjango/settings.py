@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'diettracker.middleware.request_metrics_middleware',
+    'diettracker.middleware.replica_routing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,22 +50,77 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'diettracker.middleware.async_urlconf_middleware',
+    'diettracker.middleware.view_timing_middleware',
 ]
 
 ROOT_URLCONF = 'projectdjango.urls'
 
+# URLconf z asynchronicznymi widokami, używany przy uruchomieniu przez ASGI (projectdjango/asgi.py)
+ASYNC_ROOT_URLCONF = 'projectdjango.urls_async'
+
+# Pamięć podręczna współdzielona przez wszystkie procesy serwera i komendy manage.py - przez nią docierają do procesów
+# nowe wersje katalogu produktów (import_off) i stron (clear_page_cache). Z REDIS_URL używany jest Redis (wymaga pakietu
+# redis), a bez niego katalog plików CACHE_DIR na tej samej maszynie.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'django_cache'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+# Plik indeksu produktów używanego przez podpowiedzi (diettracker.recommendations), przebudowywany przez import_off
+FOOD_INDEX_PATH = BASE_DIR / 'food_index.npz'
+
+# Kolumnowa migawka katalogu produktów mapowana w pamięć przez procesy serwera (diettracker.nutrient_store), zapisywana przez import_off
+NUTRIENT_STORE_PATH = BASE_DIR / 'nutrient_store.bin'
+
+# Maksymalna liczba produktów w pamięci podręcznej katalogu w każdym procesie (diettracker.food_cache)
+FOOD_CACHE_SIZE = 10000
+
+# Jak długo (w sekundach) pamiętane są odpowiedzi na żądania z kluczem idempotencji (diettracker.idempotency)
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# Czas (w sekundach) przechowywania fragmentów szablonów w cache (diettracker.page_cache)
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Token, z którym (nagłówek Authorization: Bearer <token>) /metrics jest dostępne bez logowania, np. dla Prometheusa;
+# bez tokenu metryki widzą tylko administratorzy
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Od ilu wykonań tego samego zapytania SQL w jednym żądaniu zgłaszany jest wzorzec N+1
+REPEATED_QUERY_THRESHOLD = 5
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Backend Django mierzący czas renderowania szablonów (diettracker.instrumentation)
+        'BACKEND': 'diettracker.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Skompilowane szablony trzymane są w pamięci procesu (przy DEBUG przeładowywane po zmianie pliku)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'diettracker.idempotency.new_idempotency_key',
+                'diettracker.page_cache.page_cache_context',
             ],
         },
     },
@@ -82,6 +139,19 @@ DATABASES = {
     }
 }
 
+# Repliki bazy tylko do odczytu (diettracker.routers), podawane jako ścieżki plików SQLite rozdzielone przecinkami, np.
+# lokalnie kopia bazy: cp db.sqlite3 replica.sqlite3 && REPLICA_DATABASE_PATHS=replica.sqlite3 python manage.py runserver
+REPLICA_DATABASES = []
+for number, path in enumerate(filter(None, os.environ.get('REPLICA_DATABASE_PATHS', '').split(',')), 1):
+    alias = 'replica%d' % number
+    DATABASES[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['diettracker.routers.ReplicaRouter']
+
+# Przez ile sekund po żądaniu zapisującym odczyty klienta trafiają do bazy głównej zamiast do repliki
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
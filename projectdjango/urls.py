@@ -17,8 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from diettracker import views
-from diettracker.views import (LoginView, RegisterView, SuccessView, ProfileView, WeightUpdateView, ConsumptionView, update_diet, LogoutView, WeightChartView, HomeView, DietView,
-                               BMIView, FoodView, MealListView, MealEditView, MealDeleteView, ConsumptionListView, AllMealsView)
+from diettracker.views import (LoginView, RegisterView, SuccessView, ProfileView, WeightUpdateView, ConsumptionView, RecommendationView, BulkConsumptionView, ExportView, HistoryImportView, update_diet, LogoutView, WeightChartView, WeightDataView, WeightTrendView, NutritionReportView, HomeView, DietView,
+                               BMIView, FoodView, FoodSearchView, FoodRankingView, MetricsView, MealListView, MealEditView, MealIngredientsView, MealDeleteView, ConsumptionListView, AllMealsView)
 
 
 urlpatterns = [
@@ -30,16 +30,29 @@ urlpatterns = [
     path('profile/', ProfileView.as_view(), name='profile'),
     path('update_weight/',WeightUpdateView.as_view(), name='update_weight'),
     path('consumption/',ConsumptionView.as_view(), name='consumption'),
+    path('consumption/recommendations/', RecommendationView.as_view(), name='recommendations'),
+    path('export/<str:kind>/', ExportView.as_view(), name='export'),
+    path('import/<str:kind>/', HistoryImportView.as_view(), name='history_import'),
+    path('api/consumption/bulk/', BulkConsumptionView.as_view(), name='consumption_bulk'),
     path('update_diet/', update_diet, name='update_diet'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('weight_chart/', WeightChartView.as_view(), name='weight_chart'),
+    path('weight_chart/data/', WeightDataView.as_view(), name='weight_data'),
+    path('weight_chart/trend/', WeightTrendView.as_view(), name='weight_trend'),
+    path('reports/', NutritionReportView.as_view(), name='report'),
+    path('reports/week/', NutritionReportView.as_view(span='week'), name='report_week'),
+    path('reports/month/', NutritionReportView.as_view(span='month'), name='report_month'),
     path('diets/', DietView.as_view(), name='diets'),
     path('bmi/', BMIView.as_view(), name='bmi'),
     path('food/', FoodView.as_view(), name='food'),
+    path('food/search/', FoodSearchView.as_view(), name='food_search'),
+    path('food/ranking/', FoodRankingView.as_view(), name='food_ranking'),
     path('meal/', MealListView.as_view(), name='meal_list'),
     path('meal/<int:pk>/edit/', MealEditView.as_view(), name='meal_edit'),
+    path('meal/<int:pk>/ingredients/', MealIngredientsView.as_view(), name='meal_ingredients'),
     path('meal/<int:pk>/delete/', MealDeleteView.as_view(), name='meal_delete'),
     path('consumption_list/', ConsumptionListView.as_view(), name='consumption_list'),
     path('all_meals', AllMealsView.as_view(), name='all_meals'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
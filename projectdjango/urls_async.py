@@ -0,0 +1,19 @@
+"""
+URLconf używany przy obsłudze przez ASGI - taki sam jak projectdjango.urls, ale z asynchronicznymi wersjami
+najczęściej odczytywanych widoków (diettracker.async_views).
+"""
+from django.urls import path
+
+from diettracker.async_views import (AsyncConsumptionView, AsyncConsumptionListView, AsyncFoodView, AsyncAllMealsView,
+                                     AsyncWeightDataView)
+from projectdjango.urls import urlpatterns as sync_urlpatterns
+
+async_views = {
+    'consumption': path('consumption/', AsyncConsumptionView.as_view(), name='consumption'),
+    'consumption_list': path('consumption_list/', AsyncConsumptionListView.as_view(), name='consumption_list'),
+    'food': path('food/', AsyncFoodView.as_view(), name='food'),
+    'all_meals': path('all_meals', AsyncAllMealsView.as_view(), name='all_meals'),
+    'weight_data': path('weight_chart/data/', AsyncWeightDataView.as_view(), name='weight_data'),
+}
+
+urlpatterns = [async_views.get(getattr(pattern, 'name', None), pattern) for pattern in sync_urlpatterns]